@@ -9,127 +9,176 @@ __usage__ = """
 					--in <FULL_PATH_TO_INPUT_VCF>
 					--out <FULL_PATH_TO_OUTPUT_TEXT_FILE>
 					--anno <ANNOTATION_FILE>
+					--region <CHR:START-END, REPEATABLE>[all]
+					--threads <INT, NUMBER_OF_PROCESSES_FOR_CHROMOSOMES_OF_INDEXED_VCF>[1]
+					--profile <WRITE_STAGE_TIMES_AND_MEMORY_AS_JSON>[off]
+					--cprofile <ADDITIONALLY_WRITE_CPROFILE_STATISTICS>[off]
 					
 					bug reports and feature requests: bpucker@cebitec.uni-bielefeld.de
 					"""
 
 import re, sys
+from vcf_reader import read_vcf, get_info_value
+from input_handler import open_input, get_worker_threads
+from region_index import get_regions, get_chromosome_shards
+from multiprocessing import Pool
+from profiling import profiled, start_profiling, write_profile
 
 # ---- end of imports --- #
 
+GENE_ID_PATTERN = re.compile( "Ma[0-9Un_random]+_g\d+" )
+IMPACT_RANKS = { "HIGH": 0, "MODERATE": 1, "LOW": 2, "MODIFIER": 3 }
 
-def find_high_impact_variants( input_file, output_file, annotation ):
-	"""! @brief load only first high impact effect per gene """
+
+def parse_annotations( ann ):
+	"""! @brief split SnpEff ANN field into ( allele, effect, impact, gene ID ) per annotation (keeps SnpEff order; gene ID is None if missing) """
+	
+	annotations = []
+	for subpart in ann.split(','):
+		fields = subpart.split( '|', 5 )
+		if len( fields ) > 4:
+			ID = GENE_ID_PATTERN.search( fields[4] )
+			if ID:
+				annotations.append( ( fields[0], fields[1], fields[2], ID.group( 0 ) ) )
+			else:
+				annotations.append( ( fields[0], fields[1], fields[2], None ) )
+	return annotations
+
+
+COUNTERS = [ 'total_annotated_variants', 'total_small_variants', 'total_snps', 'splice_variants', 'premature_stops', 'frame_shifts', 'lost_stops', 'HIGH', 'MODERATE', 'LOW', 'MODIFIER' ]
+
+
+@profiled( count=lambda result: result['counters']['total_annotated_variants'] )
+def summarize_variants( input_file, regions=None, ended_genes=None, threads=None ):
+	"""! @brief load only first high impact effect per gene into a mergeable summary
 	
-	ended_genes = []
+	@param ended_genes genes with premature stop in preceding parts of the VCF (not considered anymore)
+	@param threads number of threads for BGZF decompression
+	"""
 	
-	effect_impact_positions = { }
-	#collect effect positions to avoid two high impact effects at same SNP
+	summary = { 'counters': dict( ( key, 0 ) for key in COUNTERS ), 'premature_stops': [], 'data_for_extraction': [], 'ended_genes': set( [] ), 'seen_genes': set( [] ) }
+	counters = summary['counters']
 	
-	splice_variants_counter = 0
-	premature_stop_counter = 0
-	frame_shift_counter = 0
-	lost_stop_counter = 0
+	if ended_genes is None:
+		ended_genes = set( [] )
+	ended_genes = set( ended_genes )
 	
-	high_counter = 0
-	moderate_counter = 0
-	low_counter = 0
-	modifier_counter = 0
+	effect_impact_positions = set( [] )
+	#collect effect positions to avoid two high impact effects at same SNP
 	
-	premature_stops = []
+	for record in read_vcf( input_file, regions=regions, threads=threads ):
+		counters['total_annotated_variants'] += 1
+		if abs( len( record.ref ) - len( record.alt ) ) < 100:	#filter out large InDels
+			counters['total_small_variants'] += 1
+			if len( record.ref ) == len( record.alt ):
+				counters['total_snps'] += 1
+			ann = get_info_value( record, "ANN" )
+			if ann is None or ( record.chrom, record.pos ) in effect_impact_positions:
+				continue
+			annotations = parse_annotations( ann )
+			
+			# --- impact of variant is the highest impact of all its annotations --- #
+			impacts = [ each[2] for each in annotations if each[2] in IMPACT_RANKS ]
+			if len( impacts ) == 0:
+				continue
+			impact = min( impacts, key=IMPACT_RANKS.get )
+			
+			for allele, effect, annotation_impact, ID in annotations:
+				# --- select only one annotation per variant (first one of a gene without premature stop) --- #
+				if ID is None:
+					continue
+				summary['seen_genes'].add( ID )
+				if ID in ended_genes:
+					continue
+				if impact == "HIGH":
+					effect_annotation = "ERROR"
+					if 'stop_gained' in effect:
+						counters['premature_stops'] += 1
+						summary['premature_stops'].append( ID )
+						ended_genes.add( ID )
+						summary['ended_genes'].add( ID )
+						effect_annotation = 'stop_gained'
+					elif 'stop_lost' in effect:
+						counters['lost_stops'] += 1
+						effect_annotation = 'stop_lost'
+					elif 'splice_region_variant' in effect:
+						counters['splice_variants'] += 1
+						effect_annotation = 'splice_region_variant'
+					elif 'frameshift' in effect:
+						counters['frame_shifts'] += 1
+						effect_annotation = 'frameshift'
+					if effect_annotation != "ERROR":
+						summary['data_for_extraction'].append( [ record.chrom, record.pos, record.ref, record.alt, ID, effect_annotation ] )
+				counters[ impact ] += 1
+				effect_impact_positions.add( ( record.chrom, record.pos ) )
+				break
+	return summary
+
+
+def summarize_shard( job ):
+	"""! @brief worker function: summarize one chromosome shard of the VCF """
 	
-	data_for_extraction = []
+	input_file, regions, threads = job
+	return summarize_variants( input_file, regions, threads=threads )
+
+
+@profiled()
+def merge_summaries( input_file, shards, summaries ):
+	"""! @brief merge shard summaries in VCF order; shards affected by premature stops of preceding shards are summarized again """
+	
+	merged = { 'counters': dict( ( key, 0 ) for key in COUNTERS ), 'premature_stops': [], 'data_for_extraction': [], 'ended_genes': set( [] ), 'seen_genes': set( [] ) }
+	for shard, summary in zip( shards, summaries ):
+		if len( summary['seen_genes'] & merged['ended_genes'] ) > 0:
+			summary = summarize_variants( input_file, shard, merged['ended_genes'] )
+		for key in COUNTERS:
+			merged['counters'][ key ] += summary['counters'][ key ]
+		merged['premature_stops'] += summary['premature_stops']
+		merged['data_for_extraction'] += summary['data_for_extraction']
+		merged['ended_genes'] |= summary['ended_genes']
+		merged['seen_genes'] |= summary['seen_genes']
+	return merged
+
+
+def find_high_impact_variants( input_file, output_file, annotation, regions=None, threads=1 ):
+	"""! @brief load only first high impact effect per gene (one worker process per chromosome if the VCF is indexed) """
+	
+	shards = None
+	if threads > 1:
+		shards = get_chromosome_shards( input_file, regions )
+	
+	if shards:
+		workers = min( [ threads, len( shards ) ] )
+		pool = Pool( workers )
+		summaries = pool.map( summarize_shard, [ ( input_file, shard, get_worker_threads( workers ) ) for shard in shards ] )
+		pool.close()
+		pool.join()
+		summary = merge_summaries( input_file, shards, summaries )
+	else:
+		summary = summarize_variants( input_file, regions )
 	
-	total_annotated_variant_counter = 0
-	total_small_variant_counter = 0
-	total_snp_counter = 0
+	counters = summary['counters']
+	premature_stops = summary['premature_stops']
+	data_for_extraction = summary['data_for_extraction']
 	
-	with open( input_file, "r" ) as f:
-		line = f.readline()
-		while line:
-			if line[0] != '#':
-				parts = line.strip().split('\t')
-				total_annotated_variant_counter += 1
-				try:
-					x = abs( len( parts[3] ) - len( parts[4] ) )
-				except IndexError:
-					print line
-				if abs( len( parts[3] ) - len( parts[4] ) ) < 100:	#filter out large InDels
-					total_small_variant_counter += 1
-					if len( parts[3] ) == len( parts[4] ):
-						total_snp_counter += 1
-					subparts = parts[7].split(',')
-					for subpart in subparts:
-						# --- check all variant annotations and select only one (highest impact and first) --- #
-						try:
-							ID = re.findall( "Ma[0-9Un_random]+_g\d+", subpart )[0]
-							if ID not in ended_genes:
-								# --- analyse high impact effects --- #
-								if 'HIGH' in line:
-									try:
-										position = effect_impact_positions[ parts[0]+parts[1] ]									
-									except:
-										effect_annotation = "ERROR"
-										if 'stop_gained' in subpart:
-											premature_stop_counter += 1
-											premature_stops.append( ID )
-											ended_genes.append( ID )
-											effect_annotation = 'stop_gained'
-										elif 'stop_lost' in subpart:
-											lost_stop_counter += 1
-											effect_annotation = 'stop_lost'
-										elif 'splice_region_variant' in subpart:
-											splice_variants_counter += 1
-											effect_annotation = 'splice_region_variant'
-										elif 'frameshift' in subpart:
-											frame_shift_counter += 1
-											effect_annotation = 'frameshift'
-										
-										effect_impact_positions.update( { parts[0]+parts[1]: "" } )
-										high_counter += 1
-										if effect_annotation != "ERROR":
-											data_for_extraction.append( [ parts[0], parts[1], parts[3], parts[4], re.findall( "Ma[0-9Un_random]+_g\d+", ID )[0], effect_annotation ] )
-										
-								elif 'MODERATE' in line:
-									try:
-										position = effect_impact_positions[ parts[0]+parts[1] ]											
-									except:
-										effect_impact_positions.update( { parts[0]+parts[1]: "" } )
-										moderate_counter += 1
-								elif 'LOW' in line:
-									try:
-										position = effect_impact_positions[ parts[0]+parts[1] ]											
-									except:
-										effect_impact_positions.update( { parts[0]+parts[1]: "" } )
-										low_counter += 1
-								elif 'MODIFIER' in line:
-									try:
-										position = effect_impact_positions[ parts[0]+parts[1] ]											
-									except:
-										effect_impact_positions.update( { parts[0]+parts[1]: "" })
-										modifier_counter += 1
-						except:
-							pass	#print "ERROR: " + subpart
-			line = f.readline()
 	print "RESULTS:"
 	
 	
-	print "total annotated variants: " + str( total_annotated_variant_counter )
-	print "total small variants: " + str( total_small_variant_counter )
-	print "total number of SNPs: " + str( total_snp_counter )
+	print "total annotated variants: " + str( counters['total_annotated_variants'] )
+	print "total small variants: " + str( counters['total_small_variants'] )
+	print "total number of SNPs: " + str( counters['total_snps'] )
 	
 	
-	print "number of splice variants: " + str( splice_variants_counter )
-	print "number of premature stops: " + str( premature_stop_counter )
-	print "number of frame shifts: " + str( frame_shift_counter )
-	print "number of lost stops: " + str( lost_stop_counter )
+	print "number of splice variants: " + str( counters['splice_variants'] )
+	print "number of premature stops: " + str( counters['premature_stops'] )
+	print "number of frame shifts: " + str( counters['frame_shifts'] )
+	print "number of lost stops: " + str( counters['lost_stops'] )
 	
 	
 	
-	print "HIGH: " + str( high_counter )
-	print "MODERATE: " + str( moderate_counter )
-	print "LOW: " + str( low_counter )
-	print "MODIFIER: " + str( modifier_counter )
+	print "HIGH: " + str( counters['HIGH'] )
+	print "MODERATE: " + str( counters['MODERATE'] )
+	print "LOW: " + str( counters['LOW'] )
+	print "MODIFIER: " + str( counters['MODIFIER'] )
 	
 	print "premature stop check: " + str( len( premature_stops ) )
 	print "premature stop check (unique): " + str( len( list( set( premature_stops ) ) ) )
@@ -153,11 +202,12 @@ def find_high_impact_variants( input_file, output_file, annotation ):
 	#print max( lengths_of_alt_alleles )
 
 
+@profiled( count=len )
 def load_annotation( annotation_file ):
 	"""! @brief load functional gene annotation from given file """
 	
 	annotation = {}
-	with open( annotation_file, "r" ) as f:
+	with open_input( annotation_file ) as f:
 		line = f.readline()
 		while line:
 			parts = line.strip().split('\t')
@@ -169,6 +219,7 @@ def load_annotation( annotation_file ):
 def main( arguments ):
 	"""! @brief run everything """
 	
+	start_profiling( arguments )
 	input_file = arguments[ arguments.index('--in')+1 ]
 	output_file = arguments[ arguments.index('--out')+1 ]
 	if '--anno' in arguments:
@@ -177,7 +228,15 @@ def main( arguments ):
 	else:
 		annotation = {}
 	
-	find_high_impact_variants( input_file, output_file, annotation )
+	regions = get_regions( arguments )
+	
+	if '--threads' in arguments:
+		threads = int( arguments[ arguments.index('--threads')+1 ] )
+	else:
+		threads = 1
+	
+	find_high_impact_variants( input_file, output_file, annotation, regions, threads )
+	write_profile( output_file + ".profile" )
 
 if __name__ == '__main__':
 	
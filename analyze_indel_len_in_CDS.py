@@ -8,37 +8,97 @@ __usage__ = """
 					--gff <FULL_PATH_TO_GFF3_FILE>
 					--out <FULL_PATH_TO_OUTPUT_FOLDER>
 					
+					optional:
+					--region <CHR:START-END, REPEATABLE>[all]
+					--no-plot <ONLY_WRITE_TABLES_WITHOUT_FIGURES>[off]
+					--profile <WRITE_STAGE_TIMES_AND_MEMORY_AS_JSON>[off]
+					--cprofile <ADDITIONALLY_WRITE_CPROFILE_STATISTICS>[off]
+					
 					bug reports and feature requests: bpucker@cebitec.uni-bielefeld.de
 					"""
 
 
-import os, sys, math
-import matplotlib.pyplot as plt
+import os, sys, math, bisect
+from array import array
+from collections import Counter
+from vcf_reader import read_vcf
+from gff_index import load_gff_index, get_feature_intervals
+from region_index import get_regions
+from profiling import profiled, stage, start_profiling, write_profile
+from plot_backend import get_pyplot, plots_requested
 
 # --- end of imports --- #
 
+LENGTH_TABLE = "InDel_lengths.txt"
+
+def merge_intervals( intervals ):
+	"""! @brief sort and merge overlapping or adjacent half-open intervals """
+	
+	starts = array( 'l' )
+	ends = array( 'l' )
+	for start, end in sorted( intervals ):
+		if len( ends ) > 0 and start <= ends[ -1 ]:
+			if end > ends[ -1 ]:
+				ends[ -1 ] = end
+		else:
+			starts.append( start )
+			ends.append( end )
+	return starts, ends
+
+
+@profiled( count=lambda result: sum( [ len( starts ) for starts, ends in result.values() ] ) )
 def load_all_CDS_positions( gff ):
-	"""! @brief load all CDS positions """
+	"""! @brief load all CDS positions as sorted and merged intervals per chromosome
+	
+	@note each CDS covers the positions start to end-1 (as in the former per-base dictionary)
+	"""
+	
+	intervals = get_feature_intervals( load_gff_index( gff ), "CDS" )
 	
 	CDS_pos = {}
-	with open( gff, "r" ) as f:
-		line = f.readline()
-		while line:
-			if line[0] != '#':
-				parts = line.strip().split('\t')
-				if parts[2] == "CDS":
-					start, end = map( int, parts[3:5] )
-					while start < end:
-						key = parts[0] + "_%_" + ( str( start ).zfill( 8 ) )
-						try:
-							CDS_pos[ key ]
-						except KeyError:
-							CDS_pos.update( { key: None } )
-						start += 1
-			line = f.readline()
+	for chromosome in intervals.keys():
+		CDS_pos.update( { chromosome: merge_intervals( [ ( start, end ) for start, end in intervals[ chromosome ] if start < end ] ) } )
 	return CDS_pos
 
 
+class CDSSweep( object ):
+	"""! @brief overlap join of coordinate sorted variants with the sorted CDS intervals (one pointer per chromosome instead of a search per variant) """
+	
+	def __init__( self, CDS_pos ):
+		self.CDS_pos = CDS_pos
+		self.chromosome = None
+		self.starts = array( 'l' )
+		self.ends = array( 'l' )
+		self.idx = 0
+		self.last_start = 0
+	
+	def overlaps( self, chromosome, start, end ):
+		"""! @brief check if any position from start to end (inclusive) is located in a CDS; falls back to binary search for unsorted variants """
+		
+		if chromosome != self.chromosome:
+			self.chromosome = chromosome
+			self.starts, self.ends = self.CDS_pos.get( chromosome, ( array( 'l' ), array( 'l' ) ) )
+			self.idx = 0
+		elif start < self.last_start:
+			self.idx = bisect.bisect_right( self.ends, start )
+		self.last_start = start
+		
+		# --- skip all intervals which end before the variant --- #
+		while self.idx < len( self.ends ) and self.ends[ self.idx ] <= start:
+			self.idx += 1
+		return self.idx < len( self.starts ) and self.starts[ self.idx ] <= end
+
+
+def get_total_CDS_length( CDS_pos ):
+	"""! @brief calculate number of positions covered by CDS intervals """
+	
+	total = 0
+	for starts, ends in CDS_pos.values():
+		total += sum( ends ) - sum( starts )
+	return total
+
+
+@profiled()
 def generate_figure( indel_lengths, figfile ):
 	"""! @brief generate boxplot with InDel lengths """
 	
@@ -53,6 +113,7 @@ def generate_figure( indel_lengths, figfile ):
 			
 	
 	# --- generate figure --- #	
+	plt = get_pyplot()
 	fig, ax = plt.subplots()
 	ax.bar( len_to_check, values, color="lime" )
 	ax.set_xlabel( "InDel length distribution" )
@@ -67,50 +128,88 @@ def generate_figure( indel_lengths, figfile ):
 	plt.close( "all" )
 
 
+def write_length_table( CDS_indel_lens, other_indel_lens, total_CDS_length, table_file ):
+	"""! @brief write numbers of InDels and number of InDels per length inside and outside of CDS """
+	
+	CDS_counts = Counter( CDS_indel_lens )
+	other_counts = Counter( other_indel_lens )
+	with open( table_file, "w" ) as out:
+		out.write( "#InDels in CDS\t" + str( len( CDS_indel_lens ) ) + '\n' )
+		out.write( "#InDels outside CDS\t" + str( len( other_indel_lens ) ) + '\n' )
+		out.write( "#total CDS length\t" + str( total_CDS_length ) + '\n' )
+		out.write( "Length\tCDS\tOther\n" )
+		for length in sorted( set( CDS_counts.keys() + other_counts.keys() ) ):
+			out.write( "\t".join( map( str, [ length, CDS_counts[ length ], other_counts[ length ] ] ) ) + '\n' )
+
+
+class IndelLengthConsumer( object ):
+	"""! @brief VCF record consumer: lengths of InDels inside and outside of CDS """
+	
+	def __init__( self, CDS_pos, output_dir, plot=True ):
+		self.CDS_pos = CDS_pos
+		self.sweep = CDSSweep( CDS_pos )
+		self.output_dir = output_dir
+		self.plot = plot
+		self.CDS_indel_lens = []
+		self.other_indel_lens = []
+	
+	def add( self, record ):
+		"""! @brief assign length of one InDel to CDS or other regions (InDels overlapping a CDS with any base of REF belong to the CDS) """
+		
+		if not "," in record.pos:
+			if len( record.ref ) != len( record.alt ):
+				start = int( record.pos )
+				if self.sweep.overlaps( record.chrom, start, start + len( record.ref ) - 1 ):
+					self.CDS_indel_lens.append( abs( len( record.ref ) - len( record.alt ) ) )
+				else:
+					self.other_indel_lens.append( abs( len( record.ref ) - len( record.alt ) ) )
+	
+	def finish( self ):
+		"""! @brief report numbers, write table and generate figures """
+		
+		total_CDS_length = get_total_CDS_length( self.CDS_pos )
+		print "number of InDels in CDS: " + str( len( self.CDS_indel_lens ) )
+		print "number of InDels outside CDS: " + str( len( self.other_indel_lens ) )
+		print "total CDS length: " + str( total_CDS_length )
+		
+		write_length_table( self.CDS_indel_lens, self.other_indel_lens, total_CDS_length, self.output_dir + LENGTH_TABLE )
+		if not self.plot:
+			return
+		
+		CDS_file = self.output_dir + "CDS_InDel_lengths.png"
+		other_file = self.output_dir + "other_InDel_lengths.png"
+		
+		generate_figure( self.CDS_indel_lens, CDS_file )
+		generate_figure( self.other_indel_lens, other_file )
+
+
 def main( arguments ):
 	"""! @brief run everything """
 	
+	start_profiling( arguments )
 	vcf = arguments[ arguments.index('--vcf')+1 ]
 	gff = arguments[ arguments.index('--gff')+1 ]
 	output_dir = arguments[ arguments.index('--out')+1 ]
+	regions = get_regions( arguments )
 	
 	if not output_dir[-1] == "/":
 		output_dir += "/"
 	if not os.path.exists( output_dir ):
 		os.makedirs( output_dir )
 	
-	CDS_pos = load_all_CDS_positions( gff )
-	
-	
-	CDS_indel_lens = []
-	other_indel_lens = []
-	
-	with open( vcf, "r" ) as f:
-		line = f.readline()
-		while line:
-			if line[0] != '#':
-				parts = line.strip().split('\t')
-				if not "," in parts[1]:
-					if len( parts[3] ) != len( parts[4] ):
-						try:
-							CDS_pos[ parts[0] + "_%_" + ( parts[1].zfill( 8 ) ) ]
-							CDS_indel_lens.append( abs( len( parts[3] ) - len( parts[4] ) ) )
-						except KeyError:
-							other_indel_lens.append( abs( len( parts[3] ) - len( parts[4] ) ) )
-			line = f.readline()
-	
-	print "number of InDels in CDS: " + str( len( CDS_indel_lens ) )
-	print "number of InDels outside CDS: " + str( len( other_indel_lens ) )
-	print "total CDS length: " + str( len( CDS_pos.keys() ) )
-	
-	CDS_file = output_dir + "CDS_InDel_lengths.png"
-	other_file = output_dir + "other_InDel_lengths.png"
-	
-	generate_figure( CDS_indel_lens, CDS_file )
-	generate_figure( other_indel_lens, other_file )
+	consumer = IndelLengthConsumer( load_all_CDS_positions( gff ), output_dir, plots_requested( arguments ) )
+	with stage( "read_vcf" ) as info:
+		info['records'] = 0
+		for record in read_vcf( vcf, regions=regions ):
+			consumer.add( record )
+			info['records'] += 1
+	consumer.finish()
+	write_profile( output_dir + "profile" )
 
 
-if '--vcf' in sys.argv and '--gff' in sys.argv and '--out' in sys.argv:
-	main( sys.argv )
-else:
-	sys.exit( __usage__ )
+if __name__ == '__main__':
+	
+	if '--vcf' in sys.argv and '--gff' in sys.argv and '--out' in sys.argv:
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
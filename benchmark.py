@@ -0,0 +1,406 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+__usage__ = """
+					python benchmark.py
+					--out <FULL_PATH_TO_OUTPUT_DIR>
+					
+					optional:
+					--chromosomes <INT, NUMBER_OF_CHROMOSOMES>[3]
+					--length <INT, LENGTH_OF_EACH_CHROMOSOME>[1000000]
+					--seed <INT, SEED_FOR_SYNTHETIC_DATA>[1]
+					--json <FULL_PATH_TO_RESULT_FILE>[<OUTPUT_DIR>/benchmark.json]
+					--compare <FULL_PATH_TO_PREVIOUS_RESULT_FILE>
+					--tolerance <FLOAT, ALLOWED_SLOWDOWN_FACTOR>[1.2]
+					
+					bug reports and feature requests: bpucker@cebitec.uni-bielefeld.de
+					"""
+
+import matplotlib
+matplotlib.use( "Agg" )
+import json, os, random, resource, subprocess, sys, time
+from multiprocessing import Process, Pipe
+
+import numpy as np
+import analyze_indel_len_in_CDS, classify_genes_by_cov, cov_plot_banana, genome_wide_variants, SnpEff_results_parser
+from cov_loader import load_cov
+from gff_index import load_gff_index
+
+# --- end of imports --- #
+
+MIN_DIFFERENCES = { 'wall_time': 0.05, 'rss_increase_kb': 10240 }	#differences below these values are never reported as regression (memory of the run without interpreter and setup)
+EFFECTS = [ ( "stop_gained", "HIGH" ), ( "frameshift_variant", "HIGH" ), ( "splice_region_variant&intron_variant", "HIGH" ), ( "stop_lost", "HIGH" ), ( "missense_variant", "MODERATE" ), ( "synonymous_variant", "LOW" ), ( "upstream_gene_variant", "MODIFIER" ) ]
+
+
+def get_chromosome_names( n_chromosomes ):
+	"""! @brief generate chromosome names like chr01, chr02, ... """
+	
+	return [ "chr" + str( i+1 ).zfill( 2 ) for i in range( n_chromosomes ) ]
+
+
+def write_coverage_file( cov_file, n_chromosomes, chr_length, seed ):
+	"""! @brief write samtools depth style coverage file with a duplicated segment on the second chromosome """
+	
+	state = np.random.RandomState( seed )
+	with open( cov_file, "w" ) as out:
+		for idx, name in enumerate( get_chromosome_names( n_chromosomes ) ):
+			depths = state.poisson( 60, chr_length )
+			if idx == 1:
+				depths[ chr_length // 4:chr_length // 2 ] *= 2
+			for start in range( 0, chr_length, 100000 ):
+				block = depths[ start:start+100000 ]
+				out.write( "".join( [ name + "\t" + str( start+i+1 ) + "\t" + str( value ) + "\n" for i, value in enumerate( block ) ] ) )
+
+
+def write_gff3_file( gff3_file, n_chromosomes, chr_length, seed ):
+	"""! @brief write GFF3 file with gene, mRNA and CDS features (about one gene per 5 kbp) """
+	
+	state = random.Random( seed )
+	genes = []
+	with open( gff3_file, "w" ) as out:
+		out.write( "##gff-version 3\n" )
+		for idx, name in enumerate( get_chromosome_names( n_chromosomes ) ):
+			counter = 0
+			pos = state.randint( 500, 3000 )
+			while pos < chr_length - 6000:
+				counter += 1
+				start = pos
+				end = pos + state.randint( 1000, 4000 )
+				strand = state.choice( [ "+", "-" ] )
+				ID = "Ma" + str( idx+1 ).zfill( 2 ) + "_g" + str( counter ).zfill( 5 )
+				genes.append( ( name, ID ) )
+				out.write( "\t".join( [ name, "synthetic", "gene", str( start ), str( end ), ".", strand, ".", "ID=" + ID + ";Name=" + ID ] ) + "\n" )
+				out.write( "\t".join( [ name, "synthetic", "mRNA", str( start ), str( end ), ".", strand, ".", "ID=" + ID + ".1;Parent=" + ID ] ) + "\n" )
+				cds_start = start
+				while cds_start < end - 200:
+					cds_end = min( [ end, cds_start + state.randint( 50, 300 ) ] )
+					out.write( "\t".join( [ name, "synthetic", "CDS", str( cds_start ), str( cds_end ), ".", strand, "0", "ID=" + ID + ".1.cds;Parent=" + ID + ".1" ] ) + "\n" )
+					cds_start = cds_end + state.randint( 80, 400 )
+				pos = end + state.randint( 500, 3000 )
+	return genes
+
+
+def write_vcf_files( vcf_file, annotated_vcf_file, genes, n_chromosomes, chr_length, seed ):
+	"""! @brief write plain VCF and SnpEff annotated VCF (ANN field) with SNVs, InDels and triallelic variants """
+	
+	state = random.Random( seed )
+	genes_per_chr = {}
+	for name, ID in genes:
+		try:
+			genes_per_chr[ name ].append( ID )
+		except KeyError:
+			genes_per_chr.update( { name: [ ID ] } )
+	
+	header = "##fileformat=VCFv4.2\n##FORMAT=<ID=GT,Number=1,Type=String>\n##FORMAT=<ID=AD,Number=R,Type=Integer>\n##FORMAT=<ID=DP,Number=1,Type=Integer>\n"
+	header += "#" + "\t".join( [ "CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT", "sample1", "sample2" ] ) + "\n"
+	with open( vcf_file, "w" ) as out:
+		with open( annotated_vcf_file, "w" ) as out_ann:
+			out.write( header )
+			out_ann.write( header )
+			for name in get_chromosome_names( n_chromosomes ):
+				pos = 0
+				while True:
+					pos += state.randint( 1, 600 )
+					if pos >= chr_length:
+						break
+					ref, alt = "A", "G"
+					r = state.random()
+					if r < 0.15:
+						ref = "A" + "C" * state.randint( 1, 12 )
+					elif r < 0.3:
+						alt = "G" + "T" * state.randint( 1, 12 )
+					elif r < 0.32:
+						alt = "G,T"
+					samples = []
+					for i in range( 2 ):
+						gt = state.choice( [ "0/1", "0/1", "1/1", "0/0" ] )
+						x, y = state.randint( 0, 60 ), state.randint( 0, 60 )
+						samples.append( gt + ":" + str( x ) + "," + str( y ) + ":" + str( x+y ) )
+					parts = [ name, str( pos ), ".", ref, alt, "50", "PASS", "DP=" + str( state.randint( 10, 100 ) ), "GT:AD:DP" ] + samples
+					out.write( "\t".join( parts ) + "\n" )
+					
+					annotations = []
+					for i in range( state.randint( 1, 4 ) ):
+						effect, impact = state.choice( EFFECTS )
+						ID = state.choice( genes_per_chr.get( name, [ "Ma00_g00000" ] ) )
+						annotations.append( "|".join( [ alt.split(',')[0], effect, impact, ID, ID, "transcript", ID + ".1", "protein_coding", "1/1", "c.1A>G", "", "", "", "", "", "" ] ) )
+					parts[7] += ";ANN=" + ",".join( annotations )
+					out_ann.write( "\t".join( parts ) + "\n" )
+
+
+def generate_fixtures( output_dir, n_chromosomes, chr_length, seed ):
+	"""! @brief generate all synthetic input files (existing files are reused) """
+	
+	prefix = output_dir + "synthetic_" + str( n_chromosomes ) + "x" + str( chr_length ) + "_" + str( seed )
+	fixtures = { 'cov': prefix + ".cov", 'gff': prefix + ".gff3", 'vcf': prefix + ".vcf", 'ann_vcf': prefix + ".ann.vcf" }
+	if not all( os.path.isfile( fixtures[ key ] ) for key in fixtures.keys() ):
+		write_coverage_file( fixtures['cov'], n_chromosomes, chr_length, seed )
+		genes = write_gff3_file( fixtures['gff'], n_chromosomes, chr_length, seed )
+		write_vcf_files( fixtures['vcf'], fixtures['ann_vcf'], genes, n_chromosomes, chr_length, seed )
+	return fixtures
+
+
+def get_current_rss():
+	"""! @brief get current resident set size of this process in kB """
+	
+	with open( "/proc/self/statm", "r" ) as f:
+		return int( f.read().split()[1] ) * resource.getpagesize() // 1024
+
+
+def measure_in_child( connection, setup, run ):
+	"""! @brief run setup (not measured) and run (measured) in this (forked) process and report the measurement """
+	
+	devnull = open( os.devnull, "w" )
+	sys.stdout = devnull
+	try:
+		data = setup()
+		start_rss = get_current_rss()
+		start_times = os.times()
+		start = time.time()
+		records = run( data )
+		wall_time = time.time() - start
+		end_times = os.times()
+		result = {	'wall_time': wall_time,
+							'cpu_time': ( end_times[0] - start_times[0] ) + ( end_times[1] - start_times[1] ),
+							'peak_rss_kb': resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss,
+							'rss_increase_kb': max( [ 0, resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss - start_rss ] )
+						}
+		if records:
+			result.update( { 'records': records, 'records_per_second': records / max( [ wall_time, 1e-9 ] ) } )
+		connection.send( result )
+	except Exception as error:
+		connection.send( { 'error': repr( error ) } )
+	finally:
+		sys.stdout = sys.__stdout__
+		connection.close()
+
+
+def measure( setup, run ):
+	"""! @brief measure run in a separate process to get a clean peak memory value per entry point """
+	
+	parent_connection, child_connection = Pipe()
+	process = Process( target=measure_in_child, args=( child_connection, setup, run ) )
+	process.start()
+	result = parent_connection.recv()
+	process.join()
+	return result
+
+
+def count_data_lines( filename ):
+	"""! @brief count lines which do not start with '#' """
+	
+	counter = 0
+	with open( filename, "r" ) as f:
+		for line in f:
+			if line[0] != '#':
+				counter += 1
+	return counter
+
+
+def get_benchmarks( fixtures, output_dir ):
+	"""! @brief define setup and run functions of all benchmarked entry points """
+	
+	n_cov = count_data_lines( fixtures['cov'] )
+	n_gff = count_data_lines( fixtures['gff'] )
+	n_vcf = count_data_lines( fixtures['vcf'] )
+	
+	def no_setup():
+		return None
+	
+	def setup_cache():
+		load_cov( fixtures['cov'] )
+	
+	def setup_gff_cache():
+		load_gff_index( fixtures['gff'] )
+	
+	def setup_gene_covs():
+		return load_cov( fixtures['cov'] ), classify_genes_by_cov.load_gene_positions( fixtures['gff'] )
+	
+	def setup_variants():
+		return genome_wide_variants.load_variants_from_vcf( fixtures['vcf'] )
+	
+	def setup_binning():
+		snps_per_chr, indels_per_chr = genome_wide_variants.load_variants_from_vcf( fixtures['vcf'] )
+		data = []
+		for key in sorted( snps_per_chr.keys() ):
+			snps = np.array( snps_per_chr[ key ], dtype=np.int64 )
+			indels = np.array( indels_per_chr.get( key, [] ), dtype=np.int64 )
+			data.append( ( int( np.concatenate( [ snps, indels ] ).max() ), snps, indels ) )
+		return data
+	
+	def setup_block_means():
+		cov = load_cov( fixtures['cov'] )
+		collected_values = {}
+		for key in sorted( cov.keys() )[:12]:
+			collected_values.update( { key: cov_plot_banana.get_block_means( cov[ key ], 10000, 300 ) } )
+		return collected_values
+	
+	def setup_heatmap():
+		gene_pos = classify_genes_by_cov.load_gene_positions( fixtures['gff'] )
+		return gene_pos, classify_genes_by_cov.get_gene_covs( load_cov( fixtures['cov'] ), gene_pos )
+	
+	def run_binning( data ):
+		for chr_length, snps, indels in data:
+			genome_wide_variants.generate_binned_values( chr_length, snps, indels, 10000 )
+	
+	def run_load_cov( data ):
+		load_cov( fixtures['cov'], use_cache=False )
+		return n_cov
+	
+	def run_load_cached_cov( data ):
+		load_cov( fixtures['cov'] )
+		return n_cov
+	
+	def run_gff_index( data ):
+		load_gff_index( fixtures['gff'], use_cache=False )
+		return n_gff
+	
+	def run_cached_gff_index( data ):
+		load_gff_index( fixtures['gff'] )
+		return n_gff
+	
+	def run_CDS_positions( data ):
+		analyze_indel_len_in_CDS.load_all_CDS_positions( fixtures['gff'] )
+		return n_gff
+	
+	def run_gene_positions( data ):
+		classify_genes_by_cov.load_gene_positions( fixtures['gff'] )
+		return n_gff
+	
+	def run_gene_covs( data ):
+		classify_genes_by_cov.get_gene_covs( data[0], data[1] )
+		return len( data[1] )
+	
+	def run_load_variants( data ):
+		genome_wide_variants.load_variants_from_vcf( fixtures['vcf'] )
+		return n_vcf
+	
+	def run_high_impact( data ):
+		SnpEff_results_parser.find_high_impact_variants( fixtures['ann_vcf'], output_dir + "benchmark_high_impact.txt", {} )
+		return n_vcf
+	
+	def run_construct_plot( data ):
+		genome_wide_variants.construct_plot( data[0], data[1], output_dir + "benchmark_variants.png", output_dir + "benchmark_variants.txt", 100000 )
+	
+	def run_cov_plot( data ):
+		cov_plot_banana.generate_plot( data, output_dir + "benchmark_coverage.png", 300 )
+	
+	def run_cov_plot_raster( data ):
+		cov_plot_banana.generate_plot( data, output_dir + "benchmark_coverage_raster.png", 300, raster=True )
+	
+	def run_heatmap( data ):
+		classify_genes_by_cov.generate_heatmap( data[0], data[1], output_dir + "benchmark_heatmap.png" )
+	
+	def run_heatmap_raster( data ):
+		classify_genes_by_cov.generate_heatmap( data[0], data[1], output_dir + "benchmark_heatmap_raster.png", raster=True )
+	
+	def run_indel_figure( data ):
+		analyze_indel_len_in_CDS.generate_figure( [ ( i % 30 ) + 1 for i in range( n_vcf ) ], output_dir + "benchmark_indel_lengths.png" )
+	
+	return [	( "load_cov", no_setup, run_load_cov ),
+						( "load_cov_cached", setup_cache, run_load_cached_cov ),
+						( "load_gff_index", no_setup, run_gff_index ),
+						( "load_gff_index_cached", setup_gff_cache, run_cached_gff_index ),
+						( "load_all_CDS_positions", setup_gff_cache, run_CDS_positions ),
+						( "load_gene_positions", setup_gff_cache, run_gene_positions ),
+						( "get_gene_covs", setup_gene_covs, run_gene_covs ),
+						( "load_variants_from_vcf", no_setup, run_load_variants ),
+						( "find_high_impact_variants", no_setup, run_high_impact ),
+						( "generate_binned_values", setup_binning, run_binning ),
+						( "construct_plot", setup_variants, run_construct_plot ),
+						( "generate_plot", setup_block_means, run_cov_plot ),
+						( "generate_plot_raster", setup_block_means, run_cov_plot_raster ),
+						( "generate_heatmap", setup_heatmap, run_heatmap ),
+						( "generate_heatmap_raster", setup_heatmap, run_heatmap_raster ),
+						( "generate_figure", no_setup, run_indel_figure )
+					]
+
+
+def get_commit():
+	"""! @brief get current git commit of the repository (if available) """
+	
+	try:
+		return subprocess.check_output( [ "git", "rev-parse", "HEAD" ], cwd=os.path.dirname( os.path.abspath( __file__ ) ), stderr=open( os.devnull, "w" ) ).strip()
+	except ( OSError, subprocess.CalledProcessError ):
+		return "n/a"
+
+
+def load_results( previous_file ):
+	"""! @brief load results of a previous run """
+	
+	with open( previous_file, "r" ) as f:
+		return json.load( f )['results']
+
+
+def compare_results( results, previous, tolerance ):
+	"""! @brief compare wall time and memory increase with previous results; returns number of regressions """
+	
+	regressions = 0
+	for name in sorted( results.keys() ):
+		if name not in previous or 'error' in results[ name ] or 'error' in previous[ name ]:
+			continue
+		for key in sorted( MIN_DIFFERENCES.keys() ):
+			if key not in previous[ name ]:
+				continue
+			ratio = results[ name ][ key ] / float( max( [ previous[ name ][ key ], 1e-9 ] ) )
+			status = "ok"
+			if ratio > tolerance and results[ name ][ key ] - previous[ name ][ key ] > MIN_DIFFERENCES[ key ]:
+				status = "REGRESSION"
+				regressions += 1
+			print name + "\t" + key + "\t" + str( previous[ name ][ key ] ) + "\t" + str( results[ name ][ key ] ) + "\t" + str( round( ratio, 3 ) ) + "\t" + status
+	return regressions
+
+
+def main( arguments ):
+	"""! @brief run everything """
+	
+	output_dir = arguments[ arguments.index( '--out' )+1 ]
+	if output_dir[ -1 ] != "/":
+		output_dir += "/"
+	if not os.path.exists( output_dir ):
+		os.makedirs( output_dir )
+	
+	parameters = { 'chromosomes': 3, 'length': 1000000, 'seed': 1 }
+	for key in parameters.keys():
+		if '--' + key in arguments:
+			parameters[ key ] = int( arguments[ arguments.index( '--' + key )+1 ] )
+	
+	if '--json' in arguments:
+		json_file = arguments[ arguments.index( '--json' )+1 ]
+	else:
+		json_file = output_dir + "benchmark.json"
+	
+	if '--tolerance' in arguments:
+		tolerance = float( arguments[ arguments.index( '--tolerance' )+1 ] )
+	else:
+		tolerance = 1.2
+	
+	previous = None
+	if '--compare' in arguments:	#loaded before the run because the result file may be the same file
+		previous = load_results( arguments[ arguments.index( '--compare' )+1 ] )
+	
+	fixtures = generate_fixtures( output_dir, parameters['chromosomes'], parameters['length'], parameters['seed'] )
+	
+	results = {}
+	for name, setup, run in get_benchmarks( fixtures, output_dir ):
+		results.update( { name: measure( setup, run ) } )
+		if 'error' in results[ name ]:
+			print name + "\tERROR\t" + results[ name ]['error']
+		else:
+			print name + "\t" + str( round( results[ name ]['wall_time'], 3 ) ) + " s\t" + str( results[ name ]['peak_rss_kb'] ) + " kB"
+	
+	with open( json_file, "w" ) as out:
+		json.dump( { 'commit': get_commit(), 'date': time.strftime( "%Y-%m-%d %H:%M:%S" ), 'parameters': parameters, 'results': results }, out, indent=2, sort_keys=True )
+	
+	if previous is not None:
+		if compare_results( results, previous, tolerance ) > 0:
+			sys.exit( 1 )
+
+
+if __name__ == '__main__':
+
+	if '--out' in sys.argv:
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
@@ -8,66 +8,95 @@ __usage__ = """
 					--cov <FULL_PATH_TO_COVERAGE_FILE>
 					--out <FULL_PATH_TO_OUTPUT_DIR>
 					
+					optional:
+					--region <CHR:START-END, REPEATABLE>[all]
+					--stat <mean|median|fraction, COVERAGE_STATISTIC_PER_GENE (fraction: PERCENT_OF_POSITIONS_WITH_AT_LEAST_--min_cov)>[mean]
+					--min_cov <INT, COVERAGE_THRESHOLD_FOR_--stat_fraction>[10]
+					--raster <DRAW_GENES_AS_ONE_PIXEL_IMAGE_INSTEAD_OF_MARKERS>[off]
+					--reduction <mean|max, AGGREGATION_OF_GENES_PER_PIXEL_COLUMN_IN_RASTER_MODE>[mean]
+					--no-plot <ONLY_WRITE_TABLE_WITHOUT_FIGURE>[off]
+					--profile <WRITE_STAGE_TIMES_AND_MEMORY_AS_JSON>[off]
+					--cprofile <ADDITIONALLY_WRITE_CPROFILE_STATISTICS>[off]
+					
 					bug reports and feature requests: bpucker@cebitec.uni-bielefeld.de
 					"""
 
-import matplotlib.pyplot as plt
 import numpy as np
 import sys, os
+from cov_loader import load_cov
+from gff_index import load_gff_index, get_gene_positions
+from region_index import get_regions
+from cov_stats import get_interval_means, get_interval_medians, get_interval_fractions_above
+from columnar import get_columnar_type, load_gene_columns
+from profiling import profiled, start_profiling, write_profile
+from plot_backend import get_pyplot, plots_requested
+from raster_plot import get_axes_pixel_size, new_image, get_pixel_columns, get_pixel_rows, reduce_to_columns, colorize, draw_band, show_image
 
+# --- end of imports --- #
 
-def load_cov( cov_file ):
-	"""! @brief load all information from coverage file """
-	
-	cov = {}
-	with open( cov_file, "r" ) as f:
-		line = f.readline()
-		header = line.split('\t')[0]
-		tmp = []
-		while line:
-			parts = line.strip().split('\t')
-			if parts[0] != header:
-				cov.update( { header: tmp } )
-				header = parts[0]
-				tmp = []
-			tmp.append( float( parts[-1] ) )
-			line = f.readline()
-		cov.update( { header: tmp } )
-	return cov
+CHROMOSOME_BAND = 0.2	#height of the band of each chromosome in raster mode (distance between chromosomes is 1)
+STATISTICS = { 'mean': ( "MeanCoverage", 300.0, "x" ), 'median': ( "MedianCoverage", 300.0, "x" ), 'fraction': ( "PercentCovered", 100.0, "%" ) }	#table column, upper cutoff and unit of the heatmap
+MIN_COV = 10	#default coverage threshold of the fraction statistic
 
 
+@profiled( count=len )
 def load_gene_positions( gff3_file ):
-	"""! @brief load all gene positions from given gff3 file """
-	
-	gene_pos = {}
-	with open( gff3_file, "r" ) as f:
-		line = f.readline()
-		while line:
-			if line[0] != '#':
-				parts = line.strip().split('\t')
-				if parts[2] == "gene":
-					# --- get gene ID --- #
-					if ";" in parts[-1]:
-						ID = parts[-1].split(';')[0].split('ID=')[-1]
-					else:
-						ID = parts[-1].split('ID=')[-1]
-					gene_pos.update( { ID: { 'chr': parts[0], 'start': int( parts[3] ), 'end': int( parts[4] ) } } )
-			line = f.readline()
-	return gene_pos
-
-
-def get_gene_covs( cov, gene_pos ):
-	"""! @brief get average coverage per gene """
+	"""! @brief load all gene positions from given gff3 file (via the cached feature index) or from a columnar .npz file """
 	
-	gene_covs = {}
+	if get_columnar_type( gff3_file ) == "genes":
+		return load_gene_columns( gff3_file )
+	return get_gene_positions( load_gff_index( gff3_file ) )
+
+
+def filter_genes_by_regions( gene_pos, regions ):
+	"""! @brief keep only genes which are located completely inside one of the given regions """
+	
+	selected_genes = {}
 	for gene in gene_pos.keys():
-		try:
-			gene_covs.update( { gene: np.mean( cov[ gene_pos[ gene ]['chr'] ][ gene_pos[ gene ]['start']:gene_pos[ gene ]['end'] ] ) } )
-		except KeyError:
+		for chrom, start, end in regions:
+			if gene_pos[ gene ]['chr'] == chrom and gene_pos[ gene ]['start'] >= start and gene_pos[ gene ]['end'] <= end:
+				selected_genes.update( { gene: gene_pos[ gene ] } )
+				break
+	return selected_genes
+
+
+@profiled( count=len )
+def get_gene_covs( cov, gene_pos, statistic="mean", min_cov=MIN_COV ):
+	"""! @brief get average coverage per gene (all genes at once via prefix sums)
+	
+	@param statistic mean or median coverage or fraction (in percent) of positions with a coverage of at least min_cov
+	"""
+	
+	genes = gene_pos.keys()
+	chromosomes = [ gene_pos[ gene ]['chr'] for gene in genes ]
+	starts = [ gene_pos[ gene ]['start'] for gene in genes ]
+	ends = [ gene_pos[ gene ]['end'] for gene in genes ]
+	if statistic == "median":
+		values = get_interval_medians( cov, chromosomes, starts, ends )
+	elif statistic == "fraction":
+		values = get_interval_fractions_above( cov, chromosomes, starts, ends, min_cov ) * 100
+	else:
+		values = get_interval_means( cov, chromosomes, starts, ends )
+	
+	gene_covs = {}
+	for idx, gene in enumerate( genes ):
+		if chromosomes[ idx ] in cov:
+			gene_covs.update( { gene: values[ idx ] } )
+		else:
 			print gene
 	return gene_covs
 
 
+def write_gene_covs( gene_pos, gene_covs, table_file, statistic="mean" ):
+	"""! @brief write coverage statistic per gene sorted by position """
+	
+	genes = sorted( gene_covs.keys(), key=lambda gene: ( gene_pos[ gene ]['chr'], gene_pos[ gene ]['start'], gene ) )
+	with open( table_file, "w" ) as out:
+		out.write( "Gene\tChromosome\tStart\tEnd\t" + STATISTICS[ statistic ][0] + "\n" )
+		for gene in genes:
+			out.write( "\t".join( map( str, [ gene, gene_pos[ gene ]['chr'], gene_pos[ gene ]['start'], gene_pos[ gene ]['end'] ] ) + [ "%.2f" % gene_covs[ gene ] ] ) + '\n' )
+
+
 def count_chromosomes( gene_pos ):
 	"""! @brief count number of chromosomes to get proper height """
 	
@@ -78,28 +107,48 @@ def count_chromosomes( gene_pos ):
 	return len( chr_names ) + 1, chr_names
 
 
-def generate_heatmap( gene_pos, gene_covs, fig_file ):
-	"""! @brief construct heatmap """
+@profiled()
+def generate_heatmap( gene_pos, gene_covs, fig_file, raster=False, reduction="mean", statistic="mean" ):
+	"""! @brief construct heatmap
+	
+	@param raster aggregate gene coverages into one pixel image (one band per chromosome) instead of drawing one marker per gene
+	@param reduction aggregation of genes in the same pixel column: mean or max
+	@param statistic coverage statistic of the genes (defines color scale and legend)
+	"""
 	
-	upper_cutoff = 300.0
+	upper_cutoff, unit = STATISTICS[ statistic ][ 1: ]
 	lower_cutoff = 0.0
+	dpi = 300
+	margins = { 'left': 0.01, 'right': 0.99, 'top': 0.99, 'bottom': 0.25 }
 	
+	plt = get_pyplot()
 	fig, ax = plt.subplots( figsize=( 8, 4 ) )
 	
 	y_max, chr_names = count_chromosomes( gene_pos )	#number of chromosomes + 1
-	x_values = []
-	y_values = []
-	color_values = []
-	
-	for gene in gene_pos:
-		x_values.append( gene_pos[ gene ]['start'] / 1000000.0 )
-		y_values.append( y_max - chr_names.index( gene_pos[ gene ]['chr'] ) - 1 )
-		c = max( [ min( [ gene_covs[ gene ], upper_cutoff ] ), lower_cutoff ] )
-		color_values.append( c )
-	
-	ax.scatter( x_values, y_values, c=color_values, cmap="cool", s=1, edgecolors="none" )
+	chr_rows = dict( [ ( chr_name, y_max - idx - 1 ) for idx, chr_name in enumerate( chr_names ) ] )
+	genes = gene_pos.keys()
+	x_values = np.array( [ gene_pos[ gene ]['start'] for gene in genes ], dtype=np.float64 ) / 1000000.0
+	y_values = np.array( [ chr_rows[ gene_pos[ gene ]['chr'] ] for gene in genes ], dtype=np.int64 )
+	color_values = np.clip( np.array( [ gene_covs[ gene ] for gene in genes ], dtype=np.float64 ), lower_cutoff, upper_cutoff )
+	
+	if raster:
+		plt.subplots_adjust( **margins )	#final axes size is required to get the number of pixels
+		width, height = get_axes_pixel_size( fig, ax, dpi )
+		xlim = ( 0, max( x_values ) )
+		y_span = ( min( [ 1, y_max - 5 ] ), y_max - 1 )	#chromosomes and legend
+		ylim = ( y_span[0] - 0.05 * ( y_span[1] - y_span[0] ), y_span[1] + 0.05 * ( y_span[1] - y_span[0] ) )	#same margins as autoscaling
+		image = new_image( width, height )
+		columns = get_pixel_columns( x_values, xlim[0], xlim[1], width )
+		for y in sorted( set( y_values.tolist() ) ):
+			selection = y_values == y
+			colors = colorize( reduce_to_columns( columns[ selection ], color_values[ selection ], width, reduction ), "cool", lower_cutoff, upper_cutoff )
+			first_row, last_row = get_pixel_rows( [ y + CHROMOSOME_BAND / 2, y - CHROMOSOME_BAND / 2 ], ylim[0], ylim[1], height )
+			draw_band( image, first_row, last_row, colors )
+		show_image( ax, image, xlim, ylim )
+	else:
+		ax.scatter( x_values, y_values, c=color_values, cmap="cool", s=1, edgecolors="none" )
+		ax.set_xlim( 0, max( x_values ) )
 	
-	ax.set_xlim( 0, max( x_values ) )
 	ax.spines['top'].set_visible(False)
 	ax.spines['right'].set_visible(False)
 	ax.spines['left'].set_visible(False)
@@ -107,24 +156,23 @@ def generate_heatmap( gene_pos, gene_covs, fig_file ):
 	
 	legend_x = [ max( x_values ) - ( 0.1 * max( x_values ) ), max( x_values ) - ( 0.1 * max( x_values ) ), max( x_values ) - ( 0.1 * max( x_values ) ), max( x_values ) - ( 0.1 * max( x_values ) ) ]
 	legend_y = [ y_max-2, y_max-3, y_max-4, y_max-5 ]
-	legend_color = [ 0.0, 100.0, 200.0, 300.0  ]
+	legend_color = [ 0.0, upper_cutoff / 3, upper_cutoff * 2 / 3, upper_cutoff ]
 	ax.scatter( legend_x, legend_y, c=legend_color, cmap="cool", s=10, edgecolors="none" )
 	
-	ax.text( max( x_values ) - ( 0.08 * max( x_values ) ), y_max-2, "0x", fontsize=5, ha="left", va="center" )
-	ax.text( max( x_values ) - ( 0.08 * max( x_values ) ), y_max-3, "100x", fontsize=5, ha="left", va="center" )
-	ax.text( max( x_values ) - ( 0.08 * max( x_values ) ), y_max-4, "200x", fontsize=5, ha="left", va="center" )
-	ax.text( max( x_values ) - ( 0.08 * max( x_values ) ), y_max-5, "300x", fontsize=5, ha="left", va="center" )
+	for y, value in zip( legend_y, legend_color ):
+		ax.text( max( x_values ) - ( 0.08 * max( x_values ) ), y, "%d" % round( value ) + unit, fontsize=5, ha="left", va="center" )
 	
 	ax.set_xlabel( "position on chromosome [ Mbp ]" )
 	
-	plt.subplots_adjust( left=0.01, right=0.99, top=0.99, bottom=0.25 )
+	plt.subplots_adjust( **margins )
 	
-	fig.savefig( fig_file, dpi=300 )
+	fig.savefig( fig_file, dpi=dpi )
 
 
 def main( arguments ):
 	"""! @brief run everything """
 	
+	start_profiling( arguments )
 	gff3_file = arguments[ arguments.index( '--gff' ) +1 ]
 	cov_file = arguments[ arguments.index( '--cov' ) +1 ]
 	output_dir = arguments[ arguments.index( '--out' ) +1 ]
@@ -135,17 +183,41 @@ def main( arguments ):
 		os.makedirs( output_dir )
 	
 	fig_file = output_dir + "gene_coverage_heatmap.png"
+	table_file = output_dir + "gene_coverage.txt"
+	
+	regions = get_regions( arguments )
 	
 	gene_pos = load_gene_positions( gff3_file )
+	if regions:
+		gene_pos = filter_genes_by_regions( gene_pos, regions )
+	
+	cov = load_cov( cov_file, regions=regions )
 	
-	cov = load_cov( cov_file )
+	statistic = "mean"
+	if '--stat' in arguments:
+		statistic = arguments[ arguments.index( '--stat' ) +1 ]
+		if statistic not in STATISTICS:
+			sys.exit( "ERROR: unknown --stat " + statistic + "\n" + __usage__ )
+	min_cov = MIN_COV
+	if '--min_cov' in arguments:
+		min_cov = int( arguments[ arguments.index( '--min_cov' ) +1 ] )
 	
-	gene_cov = get_gene_covs( cov, gene_pos )
+	gene_cov = get_gene_covs( cov, gene_pos, statistic, min_cov )
 	
-	generate_heatmap( gene_pos, gene_cov, fig_file )
+	if '--reduction' in arguments:
+		reduction = arguments[ arguments.index( '--reduction' ) +1 ]
+	else:
+		reduction = "mean"
+	
+	write_gene_covs( gene_pos, gene_cov, table_file, statistic )
+	if plots_requested( arguments ):
+		generate_heatmap( gene_pos, gene_cov, fig_file, '--raster' in arguments, reduction, statistic )
+	write_profile( output_dir + "profile" )
 
 
-if '--gff' in sys.argv and '--cov' in sys.argv and '--out' in sys.argv:
-	main( sys.argv )
-else:
-	sys.exit( __usage__ )
+if __name__ == '__main__':
+	
+	if '--gff' in sys.argv and '--cov' in sys.argv and '--out' in sys.argv:
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
@@ -0,0 +1,134 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### compressed columnar files (.npz) of parsed variants, coverage and gene positions ###
+
+import os
+import numpy as np
+
+# --- end of imports --- #
+
+ZIP_MAGIC = b"PK\x03\x04"
+TYPE_KEY = "columnar_type"	#kind of data in the file: 'variants', 'coverage' or 'genes'
+SEPARATOR = "|"	#separates chromosome name and column name in array keys
+
+SNV = 0
+INDEL = 1
+MULTIALLELIC = 2
+OTHER = 3	#substitution of several bases
+
+
+def save_columns( output_file, columnar_type, columns_per_chr, meta={} ):
+	"""! @brief write columns of each chromosome into one compressed .npz file """
+	
+	arrays = { TYPE_KEY: np.array( columnar_type ) }
+	for key in meta.keys():
+		arrays.update( { key: np.array( meta[ key ] ) } )
+	for header in columns_per_chr.keys():
+		for column in columns_per_chr[ header ].keys():
+			arrays.update( { header + SEPARATOR + column: columns_per_chr[ header ][ column ] } )
+	with open( output_file + ".tmp", "wb" ) as out:
+		np.savez_compressed( out, **arrays )
+	os.rename( output_file + ".tmp", output_file )
+
+
+def get_columnar_type( filename ):
+	"""! @brief get kind of data of a columnar file; returns None for all other files """
+	
+	if not os.path.isfile( filename ):
+		return None
+	with open( filename, "rb" ) as f:
+		if f.read( 4 ) != ZIP_MAGIC:
+			return None
+	data = np.load( filename )
+	try:
+		if TYPE_KEY not in data.files:
+			return None
+		return str( data[ TYPE_KEY ] )
+	finally:
+		data.close()
+
+
+def load_columns( filename ):
+	"""! @brief load all columns per chromosome and the meta information of a columnar file """
+	
+	columns_per_chr = {}
+	meta = {}
+	data = np.load( filename )
+	try:
+		for key in data.files:
+			if SEPARATOR not in key:
+				meta.update( { key: data[ key ] } )
+				continue
+			header, column = key.rsplit( SEPARATOR, 1 )
+			try:
+				columns_per_chr[ header ].update( { column: data[ key ] } )
+			except KeyError:
+				columns_per_chr.update( { header: { column: data[ key ] } } )
+	finally:
+		data.close()
+	return columns_per_chr, meta
+
+
+def get_region_mask( header, positions, regions ):
+	"""! @brief select positions inside of the given regions (all positions if there are no regions) """
+	
+	if not regions:
+		return np.ones( len( positions ), dtype=bool )
+	mask = np.zeros( len( positions ), dtype=bool )
+	for chrom, start, end in regions:
+		if chrom == header:
+			mask |= ( positions >= start ) & ( positions <= end )
+	return mask
+
+
+def load_variant_positions( filename, regions=None ):
+	"""! @brief SNV and InDel positions per chromosome and number of multiallelic variants (like genome_wide_variants.collect_variants) """
+	
+	columns_per_chr, meta = load_columns( filename )
+	snps_per_chr = {}
+	indels_per_chr = {}
+	tri_counter = 0
+	for header in columns_per_chr.keys():
+		columns = columns_per_chr[ header ]
+		mask = get_region_mask( header, columns['pos'], regions )
+		if not mask.any():
+			continue
+		snps = columns['pos'][ mask & ( columns['type'] == SNV ) ]
+		indels = columns['pos'][ mask & ( columns['type'] == INDEL ) ]
+		if len( snps ) > 0:
+			snps_per_chr.update( { header: snps } )
+		if len( indels ) > 0:
+			indels_per_chr.update( { header: indels } )
+		tri_counter += int( np.count_nonzero( mask & ( columns['type'] == MULTIALLELIC ) ) )
+	return snps_per_chr, indels_per_chr, tri_counter
+
+
+def load_cov_columns( filename, regions=None ):
+	"""! @brief coverage per chromosome; array index i holds the coverage of position i+1 (zero outside the regions) """
+	
+	columns_per_chr, meta = load_columns( filename )
+	cov = {}
+	for header in columns_per_chr.keys():
+		values = columns_per_chr[ header ]['depth']
+		if regions:
+			ends = [ end for chrom, start, end in regions if chrom == header ]
+			if len( ends ) == 0:
+				continue
+			values = values[ :max( ends ) ]
+			values[ ~get_region_mask( header, np.arange( 1, len( values ) + 1 ), regions ) ] = 0
+		cov.update( { header: values } )
+	return cov
+
+
+def load_gene_columns( filename ):
+	"""! @brief gene positions like classify_genes_by_cov.load_gene_positions """
+	
+	columns_per_chr, meta = load_columns( filename )
+	gene_pos = {}
+	for header in columns_per_chr.keys():
+		columns = columns_per_chr[ header ]
+		for ID, start, end in zip( columns['id'].tolist(), columns['start'].tolist(), columns['end'].tolist() ):
+			gene_pos.update( { ID: { 'chr': header, 'start': start, 'end': end } } )
+	return gene_pos
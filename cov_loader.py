@@ -0,0 +1,303 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### shared loader for samtools depth style coverage files ###
+
+import os, sys
+import numpy as np
+from input_handler import open_input, get_source_stamp
+from region_index import iterate_region_lines
+from columnar import get_columnar_type, load_cov_columns
+from profiling import profiled
+
+# --- end of imports --- #
+
+CHUNK_SIZE = 16 * 1024 * 1024	#number of bytes parsed per block
+CACHE_SUFFIX = ".covcache"	#binary sidecar file next to the coverage file
+INDEX_SUFFIX = ".covcache.idx"	#offsets and lengths of chromosomes in the sidecar file
+COV_LAYOUT = "position"	#array index i holds the coverage of position i+1; sidecar files of other layouts are rebuilt
+STREAM_CHUNK_SIZE = 1024 * 1024	#number of bytes parsed per block of streamed input (peak memory of streaming is dominated by this block)
+
+
+def get_compact_dtype( values ):
+	"""! @brief select smallest unsigned integer type able to hold all given values """
+	
+	if len( values ) == 0 or values.max() < 2**16:
+		return np.uint16
+	return np.uint32
+
+
+def split_cov_lines( lines ):
+	"""! @brief chromosome names, positions and depth values (last column) of a block of coverage lines """
+	
+	n_cols = len( lines[0].split('\t') )
+	fields = "".join( lines ).split()
+	names = np.array( fields[ 0::n_cols ] )
+	positions = np.fromstring( " ".join( fields[ 1::n_cols ] ), dtype=np.int64, sep=" " )	#faster than conversion of a string array
+	depths = np.fromstring( " ".join( fields[ n_cols-1::n_cols ] ), dtype=np.int64, sep=" " )
+	return names, positions, depths
+
+
+def parse_cov_chunk( lines ):
+	"""! @brief convert block of coverage lines into runs of one chromosome: ( name, first position, depth values, positions )
+	
+	positions are only kept (otherwise None) if the run is not contiguous, i.e. samtools depth was run without -a
+	"""
+	
+	names, positions, depths = split_cov_lines( lines )
+	depths = depths.astype( np.uint32 )
+	
+	# --- split block at chromosome borders --- #
+	borders = [ 0 ] + list( np.flatnonzero( names[ 1: ] != names[ :-1 ] ) + 1 ) + [ len( names ) ]
+	segments = []
+	for i in range( len( borders ) - 1 ):
+		run = positions[ borders[ i ]:borders[ i+1 ] ]
+		if run[ -1 ] - run[0] == len( run ) - 1 and np.all( np.diff( run ) == 1 ):
+			run = None
+		segments.append( ( str( names[ borders[ i ] ] ), int( positions[ borders[ i ] ] ), depths[ borders[ i ]:borders[ i+1 ] ], run ) )
+	return segments
+
+
+def write_cov_cache( cov_file, cov ):
+	"""! @brief write one contiguous array per chromosome into a sidecar file and index the offsets """
+	
+	size, mtime = get_source_stamp( cov_file )
+	dtype = np.dtype( np.uint16 )
+	for header in cov.keys():
+		if cov[ header ].dtype.itemsize > dtype.itemsize:
+			dtype = cov[ header ].dtype
+	
+	cache_file = cov_file + CACHE_SUFFIX
+	index_file = cov_file + INDEX_SUFFIX
+	try:
+		offset = 0
+		with open( cache_file + ".tmp", "wb" ) as out:
+			with open( index_file + ".tmp", "w" ) as out_index:
+				out_index.write( "#size\t" + size + "\n#mtime\t" + mtime + "\n#dtype\t" + dtype.name + "\n#layout\t" + COV_LAYOUT + "\n" )
+				for header in sorted( cov.keys() ):
+					out.write( cov[ header ].astype( dtype ).tostring() )
+					out_index.write( "\t".join( [ header, str( offset ), str( len( cov[ header ] ) ) ] ) + "\n" )
+					offset += len( cov[ header ] )
+		os.rename( cache_file + ".tmp", cache_file )
+		os.rename( index_file + ".tmp", index_file )
+	except ( IOError, OSError ):
+		print "WARNING: could not write coverage cache " + cache_file
+
+
+def load_cov_cache( cov_file ):
+	"""! @brief memory-map cached coverage arrays if the cache matches the coverage file; returns None otherwise """
+	
+	cache_file = cov_file + CACHE_SUFFIX
+	index_file = cov_file + INDEX_SUFFIX
+	if not os.path.isfile( cache_file ) or not os.path.isfile( index_file ):
+		return None
+	
+	meta = {}
+	chromosomes = []
+	with open( index_file, "r" ) as f:
+		line = f.readline()
+		while line:
+			parts = line.strip().split('\t')
+			if line[0] == '#':
+				meta.update( { parts[0][1:]: parts[1] } )
+			else:
+				chromosomes.append( ( parts[0], int( parts[1] ), int( parts[2] ) ) )
+			line = f.readline()
+	
+	if ( meta.get( 'size' ), meta.get( 'mtime' ) ) != get_source_stamp( cov_file ) or meta.get( 'layout' ) != COV_LAYOUT:
+		return None
+	
+	if os.path.getsize( cache_file ) > 0:
+		data = np.memmap( cache_file, dtype=np.dtype( meta['dtype'] ), mode="r" )
+	else:
+		data = np.zeros( 0, dtype=np.dtype( meta['dtype'] ) )
+	
+	cov = {}
+	for header, offset, length in chromosomes:
+		cov.update( { header: data[ offset:offset+length ].view( np.ndarray ) } )
+	return cov
+
+
+def place_cov_runs( runs ):
+	"""! @brief combine runs of one chromosome into one array; array index i holds the coverage of position i+1 (zero for positions without line) """
+	
+	expected = 1
+	for first, depths, positions in runs:
+		if first != expected or positions is not None:
+			break
+		expected += len( depths )
+	else:	#complete coverage (samtools depth -a): runs can be joined
+		return np.concatenate( [ depths for first, depths, positions in runs ] )
+	
+	length = max( [ first + len( depths ) - 1 if positions is None else positions.max() for first, depths, positions in runs ] )
+	values = np.zeros( length, dtype=np.uint32 )
+	for first, depths, positions in runs:
+		if positions is None:
+			values[ first-1:first-1+len( depths ) ] = depths
+		else:
+			values[ positions - 1 ] = depths
+	return values
+
+
+def parse_cov_file( cov_file, chunk_size=CHUNK_SIZE ):
+	"""! @brief parse all information from coverage file into one compact integer array per chromosome (like parse_cov_regions without regions) """
+	
+	blocks = {}
+	with open_input( cov_file ) as f:
+		lines = f.readlines( chunk_size )
+		while lines:
+			for header, first, depths, positions in parse_cov_chunk( lines ):
+				try:
+					blocks[ header ].append( ( first, depths, positions ) )
+				except KeyError:
+					blocks.update( { header: [ ( first, depths, positions ) ] } )
+			lines = f.readlines( chunk_size )
+	
+	cov = {}
+	for header in blocks.keys():
+		values = place_cov_runs( blocks[ header ] )
+		cov.update( { header: values.astype( get_compact_dtype( values ) ) } )
+		del blocks[ header ][:]
+	return cov
+
+
+def add_region_chunk( blocks, lines ):
+	"""! @brief parse block of coverage lines and add positions and depth values per chromosome to blocks """
+	
+	names, positions, depths = split_cov_lines( lines )
+	depths = depths.astype( np.uint32 )
+	for header in set( names ):
+		selection = names == header
+		try:
+			blocks[ str( header ) ].append( ( positions[ selection ], depths[ selection ] ) )
+		except KeyError:
+			blocks.update( { str( header ): [ ( positions[ selection ], depths[ selection ] ) ] } )
+
+
+def parse_cov_regions( cov_file, regions, chunk_size=CHUNK_SIZE ):
+	"""! @brief parse coverage of given regions; array index i holds the coverage of position i+1 (zero outside the regions) """
+	
+	blocks = {}
+	lines = []
+	size = 0
+	for line in iterate_region_lines( cov_file, regions ):
+		lines.append( line )
+		size += len( line )
+		if size >= chunk_size:
+			add_region_chunk( blocks, lines )
+			lines = []
+			size = 0
+	if len( lines ) > 0:
+		add_region_chunk( blocks, lines )
+	
+	cov = {}
+	for header in blocks.keys():
+		positions = np.concatenate( [ each[0] for each in blocks[ header ] ] )
+		depths = np.concatenate( [ each[1] for each in blocks[ header ] ] )
+		values = np.zeros( positions.max(), dtype=get_compact_dtype( depths ) )
+		values[ positions - 1 ] = depths
+		cov.update( { header: values } )
+	return cov
+
+
+def open_stream( cov_file ):
+	"""! @brief open coverage input for streaming: '-' is stdin, regular files can be compressed, named pipes are read as plain text """
+	
+	if cov_file == "-":
+		return sys.stdin
+	if os.path.isfile( cov_file ):
+		return open_input( cov_file )
+	return open( cov_file, "r" )	#compression of a pipe can not be detected without consuming its data
+
+
+def parse_window_chunk( lines, resolution ):
+	"""! @brief sum, min and max of depth values, number of lines and last position of each run of lines in the same chromosome and window """
+	
+	names, positions, depths = split_cov_lines( lines )
+	windows = ( positions - 1 ) // resolution
+	starts = np.concatenate( [ [ 0 ], np.flatnonzero( ( names[ 1: ] != names[ :-1 ] ) | ( windows[ 1: ] != windows[ :-1 ] ) ) + 1 ] )
+	ends = np.append( starts[ 1: ], len( names ) )
+	return zip( names[ starts ].tolist(), windows[ starts ].tolist(), np.add.reduceat( depths, starts ).tolist(), np.minimum.reduceat( depths, starts ).tolist(), np.maximum.reduceat( depths, starts ).tolist(), ( ends - starts ).tolist(), positions[ ends - 1 ].tolist() )
+
+
+def close_window( run, resolution, last_window ):
+	"""! @brief final statistics of one window; positions without line (samtools depth without -a) count as zero coverage like in the arrays of load_cov """
+	
+	header, window, total, minimum, maximum, lines, last_position = run
+	if last_window:
+		count = last_position - window * resolution	#last window of chromosome ends at the last reported position
+	else:
+		count = resolution
+	if lines < count:
+		minimum = 0
+	return header, window, total, minimum, maximum, count
+
+
+def iterate_window_stats( handle, resolution, chunk_size=STREAM_CHUNK_SIZE ):
+	"""! @brief read position sorted coverage lines from an open handle and yield ( chromosome, window, sum, min, max, count ) of each window as soon as it is closed
+	
+	only the current window is kept between blocks of lines; windows without any line are reported with zero coverage, so gapped input gives the same windows as cov_pyramid.get_block_stats of load_cov
+	"""
+	
+	current = None
+	lines = handle.readlines( chunk_size )
+	while lines:
+		for run in parse_window_chunk( lines, resolution ):
+			if current is not None and run[0] == current[0]:
+				if run[1] == current[1]:
+					current = [ current[0], current[1], current[2] + run[2], min( current[3], run[3] ), max( current[4], run[4] ), current[5] + run[5], run[6] ]
+					continue
+				if run[1] < current[1]:
+					raise ValueError( "coverage input is not sorted by position: " + run[0] + " " + str( run[6] ) )
+				yield close_window( current, resolution, False )
+				first_window = current[1] + 1
+			else:
+				if current is not None:
+					yield close_window( current, resolution, True )
+				first_window = 0
+			for window in xrange( first_window, run[1] ):
+				yield run[0], window, 0, 0, 0, resolution
+			current = list( run )
+		lines = handle.readlines( chunk_size )
+	if current is not None:
+		yield close_window( current, resolution, True )
+
+
+@profiled( count=lambda result: sum( [ len( stats["count"] ) for stats in result.values() ] ) )
+def collect_window_stats( handle, resolution, chunk_size=STREAM_CHUNK_SIZE ):
+	"""! @brief sum, min, max and count per window of each chromosome from streamed coverage (like cov_pyramid.get_block_stats of the loaded coverage) without storing depth per position """
+	
+	rows_per_chr = {}
+	for row in iterate_window_stats( handle, resolution, chunk_size ):
+		try:
+			rows_per_chr[ row[0] ].append( row[2:] )
+		except KeyError:
+			rows_per_chr.update( { row[0]: [ row[2:] ] } )
+		if row[1] != len( rows_per_chr[ row[0] ] ) - 1:
+			raise ValueError( "coverage input is not sorted by chromosome: " + row[0] + " occurs in several blocks" )
+	
+	window_stats = {}
+	for header in rows_per_chr.keys():
+		values = np.array( rows_per_chr[ header ], dtype=np.int64 ).reshape( -1, 4 )
+		window_stats.update( { header: { "sum": values[ :, 0 ], "min": values[ :, 1 ], "max": values[ :, 2 ], "count": values[ :, 3 ] } } )
+		del rows_per_chr[ header ][:]
+	return window_stats
+
+
+@profiled( count=lambda result: sum( [ len( values ) for values in result.values() ] ) )
+def load_cov( cov_file, chunk_size=CHUNK_SIZE, use_cache=True, regions=None ):
+	"""! @brief load coverage per chromosome; reuses (or creates) the memory-mapped sidecar cache (columnar .npz files are loaded directly) """
+	
+	if get_columnar_type( cov_file ) == "coverage":
+		return load_cov_columns( cov_file, regions )
+	if regions:
+		return parse_cov_regions( cov_file, regions, chunk_size )
+	if use_cache:
+		cov = load_cov_cache( cov_file )
+		if cov is not None:
+			return cov
+	cov = parse_cov_file( cov_file, chunk_size )
+	if use_cache:
+		write_cov_cache( cov_file, cov )
+	return cov
@@ -4,68 +4,108 @@
 
 __usage__ = """
 					python cov_plot_banana.py
-					--in <FULL_PATH_TO_COVERAGE_FILE>
+					--in <FULL_PATH_TO_COVERAGE_FILE ('-' FOR STDIN WITH --stream)>
 					--out <FULL_PATH_TO_OUTPUT_FILE>
 					
 					--res <RESOLUTION, WINDOW_SIZE_FOR_COVERAGE_CALCULATION>
 					--sat <SATURATION, CUTOFF_FOR_MAX_COVERAGE_VALUE>
+					--region <CHR:START-END, REPEATABLE>
+					--threads <NUMBER_OF_PROCESSES_FOR_PER_CHROMOSOME_CALCULATIONS>
+					--envelope <SHOW_MIN_AND_MAX_COVERAGE_PER_BLOCK>
+					--segments <WRITE_COPY_NUMBER_SEGMENTS_TO_OUTPUT_FILE_PREFIX + segments.txt>
+					--overlay <SHOW_COPY_NUMBER_SEGMENTS_IN_PLOT (implies --segments)>
+					--seg_res <INT, WINDOW_SIZE_FOR_SEGMENTATION>[1000]
+					--ploidy <INT, PLOIDY_OF_GENOME_MEDIAN_COVERAGE>[3]
+					--raster <DRAW_BLOCKS_AS_ONE_PIXEL_IMAGE_INSTEAD_OF_MARKERS>
+					--no-plot <ONLY_WRITE_BLOCK_TABLES_WITHOUT_FIGURES>
+					--stream <AGGREGATE_WINDOWS_WHILE_READING_POSITION_SORTED_INPUT_FROM_FILE_PIPE_OR_STDIN (no --region)>
+					--profile <WRITE_STAGE_TIMES_AND_MEMORY_AS_JSON>[off]
+					--cprofile <ADDITIONALLY_WRITE_CPROFILE_STATISTICS>[off]
 					"""
 
 import sys, os
-import matplotlib.pyplot as plt
 import numpy as np
+from fractions import gcd
+from cov_loader import load_cov, open_stream, collect_window_stats
+from cov_pyramid import get_block_stats, merge_block_stats, get_pyramid, get_pyramid_stats, get_nearest_level
+from cov_segments import call_segments, write_segments
+from region_index import get_regions
+from multiprocessing import Pool
+from profiling import profiled, start_profiling, write_profile
+from plot_backend import get_pyplot, plots_requested
+from raster_plot import get_axes_pixel_size, new_image, get_pixel_columns, get_pixel_rows, draw_points, draw_spans, show_image
 
 # --- end of imports --- #
 
+SHARED_COV = {}	#coverage of main process; inherited by forked worker processes without copying
+SHARED_PYRAMID = {}	#multi-resolution block statistics of main process (used instead of SHARED_COV if available)
+SHARED_WINDOWS = {}	#block statistics of streamed coverage at one base resolution (used instead of SHARED_COV and SHARED_PYRAMID if available)
 
-def load_cov( cov_file ):
-	"""! @brief load all information from coverage file """
+
+def get_capped_means( stats, saturation ):
+	"""! @brief average coverage per block from block statistics (capped at saturation) """
+	
+	return np.minimum( stats["sum"] / stats["count"].astype( np.float64 ), saturation ).tolist()
+
+
+def get_block_means( values, resolution, saturation ):
+	"""! @brief calculate average coverage per block (capped at saturation) """
 	
-	cov = {}
-	with open( cov_file, "r" ) as f:
-		line = f.readline()
-		header = line.split('\t')[0]
-		tmp = []
-		while line:
-			parts = line.strip().split('\t')
-			if parts[0] != header:
-				cov.update( { header: tmp } )
-				header = parts[0]
-				tmp = []
-			tmp.append( float( parts[-1] ) )
-			line = f.readline()
-		cov.update( { header: tmp } )
-	return cov
+	return get_capped_means( get_block_stats( values, resolution ), saturation )
 
 
-def generate_plot( cov, out_file, resolution, saturation ):
-	"""! @brief generate figure """
+@profiled()
+def generate_plot( collected_values, out_file, saturation, envelopes=None, segments=None, raster=False ):
+	"""! @brief generate figure
 	
+	@param envelopes minimal and maximal coverage per block and chromosome (optional)
+	@param segments first block, last block and mean coverage of copy number segments per chromosome (optional)
+	@param raster paint blocks and envelopes into one pixel image instead of drawing one marker per block
+	"""
+	
+	dpi = 300
+	margins = { 'left': 0.03, 'right': 0.999, 'top': 0.99, 'bottom': 0.1 }
+	plt = get_pyplot()
 	fig, ax = plt.subplots( figsize=( 10, 7 ) )
 	
 	ymax = 12	#len( cov.keys() )+1
 	max_value = 0
-	collected_values = {}
-	
-	# --- generate list for plotting --- #
-	for idx, key in enumerate( sorted( cov.keys() )[:12] ):
-		y = ymax-idx-1
-		x = []
-		blocks = [ cov[ key ] [ i : i + resolution ] for i in xrange( 0, len( cov[ key ] ), resolution ) ]
-		for block in blocks:
-			x.append( min( [ np.mean( block ), saturation ] ) )
-		max_value = max( [ max_value, max( x ) ] )
-		collected_values.update( { key: x } )
+	keys = sorted( collected_values.keys() )[:12]
+	
+	# --- get maximal value for plotting --- #
+	for key in keys:
+		max_value = max( [ max_value, max( collected_values[ key ] ) ] )
 	
 	# --- plot values --- #
 	max_value = float( min( [ saturation, max_value ] ) )
-	for idx, key in enumerate( sorted( cov.keys() )[:12] ):
+	if raster:
+		xlim = ( 0, 4800 )
+		y_span = ( ymax - ( len( keys ) - 1 ) * 1.3, ymax + max( [ 1, 200 / max_value ] ) )	#blocks and reference lines
+		ylim = ( y_span[0] - 0.05 * ( y_span[1] - y_span[0] ), y_span[1] + 0.05 * ( y_span[1] - y_span[0] ) )	#same margins as autoscaling
+		plt.subplots_adjust( **margins )	#final axes size is required to get the number of pixels
+		width, height = get_axes_pixel_size( fig, ax, dpi )
+		image = new_image( width, height )
+	for idx, key in enumerate( keys ):
 		y = ymax - ( idx*1.3 )
-		x = []
-		for each in collected_values[ key ]:
-			x.append( y + min( [ 1, ( each / max_value ) ] ) )
+		x = y + np.minimum( 1, np.asarray( collected_values[ key ], dtype=np.float64 ) / max_value )
 		
-		ax.scatter( np.arange( 0, len( x ), 1 ), x, s=1, color="lime" )
+		if raster:
+			columns = get_pixel_columns( np.arange( 0, len( x ), 1 ), xlim[0], xlim[1], width )
+			if envelopes is not None:
+				mins = np.minimum( np.asarray( envelopes[ key ][0], dtype=np.float64 ) / max_value, 1 )
+				maxs = np.minimum( np.asarray( envelopes[ key ][1], dtype=np.float64 ) / max_value, 1 )
+				draw_spans( image, columns, get_pixel_rows( y + maxs, ylim[0], ylim[1], height ), get_pixel_rows( y + mins, ylim[0], ylim[1], height ), "green" )
+			draw_points( image, columns, get_pixel_rows( x, ylim[0], ylim[1], height ), "lime", size=5 )
+		else:
+			if envelopes is not None:
+				mins = np.minimum( np.asarray( envelopes[ key ][0], dtype=np.float64 ) / max_value, 1 )
+				maxs = np.minimum( np.asarray( envelopes[ key ][1], dtype=np.float64 ) / max_value, 1 )
+				ax.vlines( np.arange( 0, len( x ), 1 ), y + mins, y + maxs, color="green", linewidth=0.1 )
+			ax.scatter( np.arange( 0, len( x ), 1 ), x, s=1, color="lime" )
+		
+		if segments is not None:
+			for start, end, mean in segments.get( key, [] ):
+				ax.plot( [ start, end ], [ y + min( [ 1, mean / max_value ] ), y + min( [ 1, mean / max_value ] ) ], color="red", linewidth=0.5 )
 		
 		ax.plot( [ 0, len( x ) ], [ y+( 0 / max_value ), y+( 0 / max_value ) ], color="black" , linewidth=0.1)
 		ax.plot( [ 0, len( x ) ], [ y+( 50 / max_value ), y+( 50 / max_value ) ], color="black" , linewidth=0.1)
@@ -77,6 +117,9 @@ def generate_plot( cov, out_file, resolution, saturation ):
 		ax.text( 0, y+1, str( int( max_value ) ), ha="right", fontsize=5 )
 		ax.text( 0, y+0.5, str( int( max_value / 2 ) ), ha="right", fontsize=5 )
 		ax.text( 0, y, "0", ha="right", fontsize=5 )
+	
+	if raster:
+		show_image( ax, image, xlim, ylim )
 		
 	ax.set_xlabel( "position on chromosome [ Mbp ]" )
 	ax.set_ylabel( "coverage" )
@@ -93,20 +136,16 @@ def generate_plot( cov, out_file, resolution, saturation ):
 	labels = map( str, np.arange( 0, 49, 1 ) )
 	ax.set_xticklabels( labels )
 	
-	plt.subplots_adjust( left=0.03, right=0.999, top=0.99, bottom=0.1 )
+	plt.subplots_adjust( **margins )
 	
-	fig.savefig( out_file, dpi=300 )
+	fig.savefig( out_file, dpi=dpi )
 	plt.close( "all" )
 
 
-def generate_hist( cov_values, outputfile, saturation, resolution ):
-	"""! @brief generate coverage histogram """
-	
-	values = []
-	blocks = [ cov_values[ i : i + resolution ] for i in xrange( 0, len( cov_values ), resolution ) ]
-	for block in blocks:
-		values.append( min( [ np.mean( block ), saturation ] ) )
+def generate_hist( values, outputfile ):
+	"""! @brief generate coverage histogram of block values """
 	
+	plt = get_pyplot()
 	fig, ax = plt.subplots()
 	
 	ax.hist( values, bins=300, color="lime" )
@@ -119,9 +158,48 @@ def generate_hist( cov_values, outputfile, saturation, resolution ):
 	plt.close( "all" )
 
 
+def get_chromosome_stats( key, resolution ):
+	"""! @brief block statistics of one chromosome from streamed windows, from the pyramid if a level fits the resolution or from the coverage """
+	
+	if SHARED_WINDOWS:
+		base_resolution = SHARED_WINDOWS.keys()[0]
+		return merge_block_stats( SHARED_WINDOWS[ base_resolution ][ key ], resolution // base_resolution )
+	stats = None
+	if SHARED_PYRAMID:
+		stats = get_pyramid_stats( SHARED_PYRAMID, key, resolution )
+	if stats is None:
+		stats = get_block_stats( SHARED_COV[ key ], resolution )
+	return stats
+
+
+def write_block_table( stats, table_file ):
+	"""! @brief write average, minimal and maximal coverage per block (BED style coordinates) """
+	
+	ends = np.cumsum( stats["count"] )
+	means = stats["sum"] / stats["count"].astype( np.float64 )
+	with open( table_file, "w" ) as out:
+		out.write( "#Start\tEnd\tMeanCoverage\tMinCoverage\tMaxCoverage\n" )
+		for end, count, mean, minimum, maximum in zip( ends.tolist(), stats["count"].tolist(), means.tolist(), stats["min"].tolist(), stats["max"].tolist() ):
+			out.write( "%d\t%d\t%.2f\t%d\t%d\n" % ( end - count, end, mean, minimum, maximum ) )
+
+
+@profiled( count=lambda result: len( result[1] ) )
+def process_chromosome( job ):
+	"""! @brief calculate block values of one chromosome, write them as table and generate its coverage histogram (if plot is True) """
+	
+	key, outputfile, resolution, saturation, plot = job
+	stats = get_chromosome_stats( key, resolution )
+	values = get_capped_means( stats, saturation )
+	write_block_table( stats, os.path.splitext( outputfile )[0] + ".txt" )
+	if plot:
+		generate_hist( values, outputfile )
+	return key, values, ( stats["min"], stats["max"] )
+
+
 def main( arguments ):
 	"""! @brief runs everything """
 	
+	start_profiling( arguments )
 	cov_file = arguments[ arguments.index( '--in' ) + 1 ]
 	out_file = arguments[ arguments.index( '--out' ) + 1 ]
 	
@@ -134,19 +212,85 @@ def main( arguments ):
 		saturation = int( arguments[ arguments.index( '--sat' ) + 1 ] )
 	else:
 		saturation = 300
-
-	cov = load_cov( cov_file )
+	
+	if '--threads' in arguments:
+		threads = int( arguments[ arguments.index( '--threads' ) + 1 ] )
+	else:
+		threads = 1
+	
+	regions = get_regions( arguments )
+	
+	if '--seg_res' in arguments:
+		window = int( arguments[ arguments.index( '--seg_res' ) + 1 ] )
+	else:
+		window = 1000
+	segmentation = '--segments' in arguments or '--overlay' in arguments
+	
+	# --- block statistics are aggregated while reading (one base resolution for plot and segmentation) --- #
+	if '--stream' in arguments:
+		if regions:
+			sys.exit( "ERROR: --region can not be combined with --stream\n" + __usage__ )
+		if segmentation:
+			base_resolution = gcd( resolution, window )
+		else:
+			base_resolution = resolution
+		SHARED_WINDOWS.update( { base_resolution: collect_window_stats( open_stream( cov_file ), base_resolution ) } )
+		chromosomes = SHARED_WINDOWS[ base_resolution ].keys()
+	
+	# --- block statistics of whole genome are taken from precomputed pyramid if a level fits the resolution --- #
+	elif not regions and get_nearest_level( resolution ) is not None:
+		SHARED_PYRAMID.update( get_pyramid( cov_file ) )
+		chromosomes = SHARED_PYRAMID[ get_nearest_level( resolution ) ].keys()
+	else:
+		SHARED_COV.update( load_cov( cov_file, regions=regions ) )
+		chromosomes = SHARED_COV.keys()
 	
 	# --- generate coverage histograms per chromosome --- #
-	for key in sorted( cov.keys() )[:12]:
+	jobs = []
+	for key in sorted( chromosomes )[:12]:
 		outputfile = out_file + key + ".png"
-		generate_hist( cov[ key ], outputfile, saturation, resolution )
+		jobs.append( ( key, outputfile, resolution, saturation, plots_requested( arguments ) ) )
+	if threads > 1:
+		pool = Pool( threads )
+		results = pool.map( process_chromosome, jobs )
+		pool.close()
+		pool.join()
+	else:
+		results = map( process_chromosome, jobs )
+	collected_values = dict( [ ( key, values ) for key, values, envelope in results ] )
+	envelopes = None
+	if '--envelope' in arguments:
+		envelopes = dict( [ ( key, envelope ) for key, values, envelope in results ] )
+	
+	# --- call copy number segments in windows of all chromosomes --- #
+	segments = None
+	if segmentation:
+		if '--ploidy' in arguments:
+			ploidy = int( arguments[ arguments.index( '--ploidy' ) + 1 ] )
+		else:
+			ploidy = 3
+		if not SHARED_COV and not SHARED_WINDOWS and get_nearest_level( window ) is None:
+			SHARED_COV.update( load_cov( cov_file ) )
+		window_stats = dict( [ ( key, get_chromosome_stats( key, window ) ) for key in chromosomes ] )
+		called_segments = call_segments( window_stats, ploidy )
+		write_segments( called_segments, out_file + "segments.txt" )
+		if '--overlay' in arguments:
+			segments = {}
+			for header, start, end, windows, mean, relative, copy_number in called_segments:
+				try:
+					segments[ header ].append( ( start / float( resolution ), end / float( resolution ), mean ) )
+				except KeyError:
+					segments.update( { header: [ ( start / float( resolution ), end / float( resolution ), mean ) ] } )
 	
 	# --- generate per chromosome position coveage plot --- #
-	generate_plot( cov, out_file, resolution, saturation )
+	if plots_requested( arguments ):
+		generate_plot( collected_values, out_file, saturation, envelopes, segments, '--raster' in arguments )
+	write_profile( out_file + "profile" )
 
 
-if '--in' in sys.argv and '--out' in sys.argv:
-	main( sys.argv )
-else:
-	sys.exit( __usage__ )
+if __name__ == '__main__':
+	
+	if '--in' in sys.argv and '--out' in sys.argv:
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
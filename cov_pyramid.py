@@ -0,0 +1,127 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### multi-resolution summaries (sum, min, max, count per block) of coverage arrays ###
+
+import os
+import numpy as np
+from input_handler import get_source_stamp
+from cov_loader import load_cov, COV_LAYOUT
+from profiling import profiled
+
+# --- end of imports --- #
+
+PYRAMID_LEVELS = [ 1000, 10000, 100000, 1000000 ]	#block sizes of the pyramid levels; each level is a multiple of the previous one
+PYRAMID_SUFFIX = ".covpyramid.npz"	#sidecar file next to the coverage file
+STATS = [ "sum", "min", "max", "count" ]
+
+
+def get_block_stats( values, resolution ):
+	"""! @brief sum, min, max and number of values per block of given size (last block can be shorter) """
+	
+	if len( values ) == 0:
+		empty = np.zeros( 0, dtype=np.int64 )
+		return { "sum": empty, "min": empty, "max": empty, "count": empty }
+	starts = np.arange( 0, len( values ), resolution )
+	counts = np.diff( np.append( starts, len( values ) ) )
+	return { "sum": np.add.reduceat( values, starts, dtype=np.int64 ), "min": np.minimum.reduceat( values, starts ), "max": np.maximum.reduceat( values, starts ), "count": counts }
+
+
+def merge_block_stats( stats, factor ):
+	"""! @brief combine each group of factor consecutive blocks into one block """
+	
+	if factor == 1 or len( stats["count"] ) == 0:
+		return stats
+	starts = np.arange( 0, len( stats["count"] ), factor )
+	return { "sum": np.add.reduceat( stats["sum"], starts ), "min": np.minimum.reduceat( stats["min"], starts ), "max": np.maximum.reduceat( stats["max"], starts ), "count": np.add.reduceat( stats["count"], starts ) }
+
+
+def build_pyramid( cov ):
+	"""! @brief calculate block statistics of all pyramid levels per chromosome; higher levels are derived from lower ones """
+	
+	pyramid = {}
+	for level in PYRAMID_LEVELS:
+		pyramid.update( { level: {} } )
+	for header in cov.keys():
+		stats = get_block_stats( cov[ header ], PYRAMID_LEVELS[0] )
+		pyramid[ PYRAMID_LEVELS[0] ].update( { header: stats } )
+		for i in xrange( 1, len( PYRAMID_LEVELS ) ):
+			stats = merge_block_stats( stats, PYRAMID_LEVELS[ i ] // PYRAMID_LEVELS[ i-1 ] )
+			pyramid[ PYRAMID_LEVELS[ i ] ].update( { header: stats } )
+	return pyramid
+
+
+def write_pyramid( cov_file, pyramid ):
+	"""! @brief store pyramid with size and modification time of the coverage file in a sidecar file """
+	
+	size, mtime = get_source_stamp( cov_file )
+	arrays = { "size": np.array( size ), "mtime": np.array( mtime ), "layout": np.array( COV_LAYOUT ) }
+	for level in pyramid.keys():
+		for header in pyramid[ level ].keys():
+			for stat in STATS:
+				arrays.update( { "|".join( [ str( level ), header, stat ] ): pyramid[ level ][ header ][ stat ] } )
+	pyramid_file = cov_file + PYRAMID_SUFFIX
+	try:
+		with open( pyramid_file + ".tmp", "wb" ) as out:
+			np.savez( out, **arrays )
+		os.rename( pyramid_file + ".tmp", pyramid_file )
+	except ( IOError, OSError ):
+		print "WARNING: could not write coverage pyramid " + pyramid_file
+
+
+def load_pyramid( cov_file ):
+	"""! @brief load pyramid if it matches the coverage file; returns None otherwise """
+	
+	pyramid_file = cov_file + PYRAMID_SUFFIX
+	if not os.path.isfile( pyramid_file ):
+		return None
+	data = np.load( pyramid_file )
+	try:
+		if ( str( data["size"] ), str( data["mtime"] ) ) != get_source_stamp( cov_file ) or "layout" not in data.files or str( data["layout"] ) != COV_LAYOUT:
+			return None
+		pyramid = {}
+		for level in PYRAMID_LEVELS:
+			pyramid.update( { level: {} } )
+		for key in data.files:
+			if "|" not in key:
+				continue
+			level, header, stat = key.split( "|" )
+			if int( level ) not in pyramid:
+				return None
+			try:
+				pyramid[ int( level ) ][ header ].update( { stat: data[ key ] } )
+			except KeyError:
+				pyramid[ int( level ) ].update( { header: { stat: data[ key ] } } )
+	finally:
+		data.close()
+	return pyramid
+
+
+@profiled()
+def get_pyramid( cov_file ):
+	"""! @brief load pyramid of coverage file or build and store it (coverage is only loaded if required) """
+	
+	pyramid = load_pyramid( cov_file )
+	if pyramid is None:
+		pyramid = build_pyramid( load_cov( cov_file ) )
+		write_pyramid( cov_file, pyramid )
+	return pyramid
+
+
+def get_nearest_level( resolution ):
+	"""! @brief largest pyramid level which divides the resolution (exact answers); returns None if there is no such level """
+	
+	for level in reversed( PYRAMID_LEVELS ):
+		if level <= resolution and resolution % level == 0:
+			return level
+	return None
+
+
+def get_pyramid_stats( pyramid, header, resolution ):
+	"""! @brief block statistics of one chromosome at given resolution from the nearest pyramid level; returns None if no level fits """
+	
+	level = get_nearest_level( resolution )
+	if level is None or header not in pyramid[ level ]:
+		return None
+	return merge_block_stats( pyramid[ level ][ header ], resolution // level )
@@ -0,0 +1,85 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### segmentation of windowed coverage into copy number segments relative to the genome median ###
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# --- end of imports --- #
+
+SMOOTHING_WINDOWS = 25	#number of windows in the rolling median (odd)
+MIN_SEGMENT_WINDOWS = 10	#shorter segments are merged into the preceding segment
+MAX_COPY_NUMBER = 12
+
+
+def get_rolling_median( values, size ):
+	"""! @brief median of each value and its neighbours (size values in total; borders are padded with the edge values) """
+	
+	if len( values ) == 0:
+		return values
+	padded = np.pad( values, size // 2, mode="edge" )
+	windows = as_strided( padded, shape=( len( values ), size ), strides=( padded.strides[0], padded.strides[0] ) )
+	return np.median( windows, axis=1 )
+
+
+def merge_short_runs( states, min_length ):
+	"""! @brief replace runs of equal states which are shorter than min_length by the state of the preceding long run (leading short runs by the following one) """
+	
+	starts = np.concatenate( [ [ 0 ], np.flatnonzero( np.diff( states ) ) + 1 ] )
+	lengths = np.diff( np.concatenate( [ starts, [ len( states ) ] ] ) )
+	valid = np.repeat( lengths >= min_length, lengths )
+	if not valid.any():
+		return states
+	idx = np.where( valid, np.arange( len( states ) ), 0 )
+	idx[ :np.argmax( valid ) ] = np.argmax( valid )
+	return states[ np.maximum.accumulate( idx ) ]
+
+
+def get_copy_number_states( means, median, ploidy ):
+	"""! @brief integer copy number of each window: smoothed coverage relative to the genome median times ploidy """
+	
+	relative = means / median * ploidy
+	states = np.clip( np.round( get_rolling_median( relative, SMOOTHING_WINDOWS ) ), 0, MAX_COPY_NUMBER ).astype( np.int64 )
+	return merge_short_runs( states, MIN_SEGMENT_WINDOWS )
+
+
+def call_segments( window_stats, ploidy ):
+	"""! @brief segments of equal copy number per chromosome from sum and count of coverage per window
+	
+	@param window_stats block statistics (sum, count) per chromosome
+	@return list of segments ( chromosome, start, end, windows, mean coverage, coverage relative to median, copy number ) with BED style coordinates
+	"""
+	
+	means = {}
+	for header in window_stats.keys():
+		means.update( { header: window_stats[ header ]['sum'] / window_stats[ header ]['count'].astype( np.float64 ) } )
+	all_means = np.concatenate( [ means[ header ] for header in means.keys() ] + [ np.zeros( 0 ) ] )
+	median = float( np.median( all_means ) ) if len( all_means ) > 0 else 0.0
+	if median <= 0:
+		return []
+	
+	segments = []
+	for header in sorted( means.keys() ):
+		if len( means[ header ] ) == 0:
+			continue
+		states = get_copy_number_states( means[ header ], median, ploidy )
+		starts = np.concatenate( [ [ 0 ], np.flatnonzero( np.diff( states ) ) + 1 ] )
+		ends = np.concatenate( [ starts[ 1: ], [ len( states ) ] ] )
+		sums = np.add.reduceat( window_stats[ header ]['sum'], starts )
+		counts = np.add.reduceat( window_stats[ header ]['count'], starts )
+		positions = np.concatenate( [ [ 0 ], np.cumsum( window_stats[ header ]['count'] ) ] )
+		for idx in xrange( len( starts ) ):
+			mean = sums[ idx ] / float( counts[ idx ] )
+			segments.append( ( header, int( positions[ starts[ idx ] ] ), int( positions[ ends[ idx ] ] ), int( ends[ idx ] - starts[ idx ] ), mean, mean / median, int( states[ starts[ idx ] ] ) ) )
+	return segments
+
+
+def write_segments( segments, output_file ):
+	"""! @brief write segments as BED compatible TSV (0-based start, exclusive end) """
+	
+	with open( output_file, "w" ) as out:
+		out.write( "#Chromosome\tStart\tEnd\tWindows\tMeanCoverage\tRelativeCoverage\tCopyNumber\n" )
+		for segment in segments:
+			out.write( "\t".join( map( str, segment[ :4 ] ) + [ "%.2f" % segment[4], "%.3f" % segment[5], str( segment[6] ) ] ) + '\n' )
@@ -0,0 +1,107 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### batched coverage statistics of many intervals via prefix sums ###
+
+import numpy as np
+
+# --- end of imports --- #
+
+MEDIAN_BATCH_SIZE = 10000000	#maximal number of positions sorted at once for median calculation
+
+
+def get_prefix_sum( values ):
+	"""! @brief cumulative sum with leading zero: sum of values[ start:end ] is prefix[ end ] - prefix[ start ] """
+	
+	prefix = np.zeros( len( values ) + 1, dtype=np.int64 )
+	np.cumsum( values, out=prefix[ 1: ] )
+	return prefix
+
+
+def group_intervals( chromosomes, starts, ends ):
+	"""! @brief convert interval lists to arrays and get indices of intervals per chromosome """
+	
+	chromosomes = np.asarray( chromosomes )
+	starts = np.asarray( starts, dtype=np.int64 )
+	ends = np.asarray( ends, dtype=np.int64 )
+	groups = {}
+	for chromosome in set( chromosomes.tolist() ):
+		groups.update( { chromosome: np.flatnonzero( chromosomes == chromosome ) } )
+	return starts, ends, groups
+
+
+def clip_intervals( length, starts, ends ):
+	"""! @brief clip intervals to chromosome length like python slices values[ start:end ] """
+	
+	starts = np.clip( starts, 0, length )
+	ends = np.clip( ends, starts, length )
+	return starts, ends
+
+
+def get_interval_means( cov, chromosomes, starts, ends ):
+	"""! @brief average coverage of all intervals (cov[ chr ][ start:end ]); NaN for empty intervals or unknown chromosomes """
+	
+	starts, ends, groups = group_intervals( chromosomes, starts, ends )
+	means = np.full( len( starts ), np.nan )
+	for chromosome in groups.keys():
+		if chromosome not in cov:
+			continue
+		idx = groups[ chromosome ]
+		prefix = get_prefix_sum( cov[ chromosome ] )
+		chr_starts, chr_ends = clip_intervals( len( cov[ chromosome ] ), starts[ idx ], ends[ idx ] )
+		lengths = chr_ends - chr_starts
+		with np.errstate( divide="ignore", invalid="ignore" ):
+			means[ idx ] = np.where( lengths > 0, ( prefix[ chr_ends ] - prefix[ chr_starts ] ) / lengths.astype( np.float64 ), np.nan )
+	return means
+
+
+def get_interval_fractions_above( cov, chromosomes, starts, ends, threshold ):
+	"""! @brief fraction of positions per interval with a coverage of at least threshold """
+	
+	starts, ends, groups = group_intervals( chromosomes, starts, ends )
+	fractions = np.full( len( starts ), np.nan )
+	for chromosome in groups.keys():
+		if chromosome not in cov:
+			continue
+		idx = groups[ chromosome ]
+		prefix = get_prefix_sum( cov[ chromosome ] >= threshold )
+		chr_starts, chr_ends = clip_intervals( len( cov[ chromosome ] ), starts[ idx ], ends[ idx ] )
+		lengths = chr_ends - chr_starts
+		with np.errstate( divide="ignore", invalid="ignore" ):
+			fractions[ idx ] = np.where( lengths > 0, ( prefix[ chr_ends ] - prefix[ chr_starts ] ) / lengths.astype( np.float64 ), np.nan )
+	return fractions
+
+
+def get_sorted_medians( values, starts, ends ):
+	"""! @brief median of each interval: values of all intervals are sorted together (by interval, then by value) """
+	
+	lengths = ends - starts
+	offsets = np.cumsum( lengths ) - lengths
+	interval_ids = np.repeat( np.arange( len( lengths ) ), lengths )
+	positions = np.arange( lengths.sum() ) - np.repeat( offsets, lengths ) + np.repeat( starts, lengths )
+	selected = values[ positions ]
+	sorted_values = selected[ np.lexsort( ( selected, interval_ids ) ) ]
+	lower = sorted_values[ offsets + ( lengths - 1 ) // 2 ]
+	upper = sorted_values[ offsets + lengths // 2 ]
+	return ( lower.astype( np.float64 ) + upper ) / 2.0
+
+
+def get_interval_medians( cov, chromosomes, starts, ends ):
+	"""! @brief median coverage of all intervals (same result as np.median( cov[ chr ][ start:end ] ) ) """
+	
+	starts, ends, groups = group_intervals( chromosomes, starts, ends )
+	medians = np.full( len( starts ), np.nan )
+	for chromosome in groups.keys():
+		if chromosome not in cov:
+			continue
+		chr_starts, chr_ends = clip_intervals( len( cov[ chromosome ] ), starts[ groups[ chromosome ] ], ends[ groups[ chromosome ] ] )
+		idx = groups[ chromosome ][ chr_ends > chr_starts ]
+		chr_starts, chr_ends = chr_starts[ chr_ends > chr_starts ], chr_ends[ chr_ends > chr_starts ]
+		
+		# --- process intervals in batches to limit memory consumption --- #
+		batch_ids = np.cumsum( chr_ends - chr_starts ) // MEDIAN_BATCH_SIZE
+		for batch in np.unique( batch_ids ):
+			selection = batch_ids == batch
+			medians[ idx[ selection ] ] = get_sorted_medians( cov[ chromosome ], chr_starts[ selection ], chr_ends[ selection ] )
+	return medians
@@ -0,0 +1,156 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+__usage__ = """
+					python export_columnar.py
+					--out <FULL_PATH_TO_OUTPUT_NPZ_FILE>
+					
+					one of:
+					--vcf <FULL_PATH_TO_INPUT_VCF>
+					--cov <FULL_PATH_TO_COVERAGE_FILE>
+					--gff <FULL_PATH_TO_GFF3_FILE>
+					
+					optional:
+					--window <INT, WINDOW_SIZE_OF_COVERAGE_SUMMARY>[1000]
+					--region <CHR:START-END, REPEATABLE>[all]
+					
+					bug reports and feature requests: bpucker@cebitec.uni-bielefeld.de
+					"""
+
+import sys
+import numpy as np
+from vcf_reader import read_vcf, get_format_keys, get_samples, get_info_value
+from cov_loader import load_cov
+from cov_pyramid import get_block_stats
+from region_index import get_regions
+from columnar import save_columns, SNV, INDEL, MULTIALLELIC, OTHER
+from SnpEff_results_parser import parse_annotations, IMPACT_RANKS
+from ploidy_check import GENOTYPE_CODES
+from classify_genes_by_cov import load_gene_positions, filter_genes_by_regions
+
+# --- end of imports --- #
+
+VARIANT_COLUMNS = [ ( "pos", np.int64 ), ( "ref_len", np.int32 ), ( "alt_len", np.int32 ), ( "type", np.int8 ), ( "gt", np.int8 ), ( "ad_ref", np.int32 ), ( "ad_alt", np.int32 ), ( "impact", np.int8 ), ( "gene", str ) ]
+
+
+def get_variant_type( record ):
+	"""! @brief classify variant like genome_wide_variants.collect_variants """
+	
+	if "," in record.alt:
+		return MULTIALLELIC
+	if len( record.ref ) != len( record.alt ):
+		return INDEL
+	if len( record.ref ) == 1:
+		return SNV
+	return OTHER
+
+
+def get_variant_row( record ):
+	"""! @brief parsed values of one variant: genotype and allele depths of the last sample, highest SnpEff impact and first annotated gene """
+	
+	gt, ad_ref, ad_alt = 0, -1, -1
+	samples = get_samples( record )
+	format_keys = get_format_keys( record )
+	if len( samples ) > 0 and "GT" in format_keys:
+		fields = samples[ -1 ].split(':')
+		gt = GENOTYPE_CODES.get( fields[ format_keys.index( "GT" ) ], 0 )
+		if "AD" in format_keys and len( fields ) > format_keys.index( "AD" ):
+			ad = fields[ format_keys.index( "AD" ) ].split(',')
+			if len( ad ) >= 2 and ad[0] != "." and ad[1] != ".":
+				ad_ref, ad_alt = int( ad[0] ), int( ad[1] )
+	
+	impact, gene = -1, ""
+	ann = get_info_value( record, "ANN" )
+	if ann is not None:
+		annotations = parse_annotations( ann )
+		impacts = [ IMPACT_RANKS[ each[2] ] for each in annotations if each[2] in IMPACT_RANKS ]
+		if len( impacts ) > 0:
+			impact = min( impacts )
+		genes = [ each[3] for each in annotations if each[3] is not None ]
+		if len( genes ) > 0:
+			gene = genes[0]
+	
+	return [ int( record.pos ), len( record.ref ), len( record.alt.split(',')[0] ), get_variant_type( record ), gt, ad_ref, ad_alt, impact, gene ]
+
+
+def export_variants( vcf_file, output_file, regions=None ):
+	"""! @brief parse all variants once and store them in columns per chromosome """
+	
+	rows_per_chr = {}
+	for record in read_vcf( vcf_file, regions=regions ):
+		try:
+			rows_per_chr[ record.chrom ].append( get_variant_row( record ) )
+		except KeyError:
+			rows_per_chr.update( { record.chrom: [ get_variant_row( record ) ] } )
+	
+	columns_per_chr = {}
+	for header in rows_per_chr.keys():
+		values = zip( *rows_per_chr[ header ] )
+		columns = {}
+		for idx, ( column, dtype ) in enumerate( VARIANT_COLUMNS ):
+			columns.update( { column: np.array( values[ idx ], dtype=dtype ) } )
+		columns_per_chr.update( { header: columns } )
+		del rows_per_chr[ header ][:]
+	save_columns( output_file, "variants", columns_per_chr )
+
+
+def export_coverage( cov_file, output_file, window, regions=None ):
+	"""! @brief store coverage per position and sum, min, max and count per window for each chromosome """
+	
+	cov = load_cov( cov_file, regions=regions )
+	columns_per_chr = {}
+	for header in cov.keys():
+		columns = { 'depth': np.asarray( cov[ header ] ) }
+		stats = get_block_stats( cov[ header ], window )
+		for stat in stats.keys():
+			columns.update( { 'window_' + stat: stats[ stat ] } )
+		columns_per_chr.update( { header: columns } )
+	save_columns( output_file, "coverage", columns_per_chr, { 'window': window } )
+
+
+def export_genes( gff3_file, output_file, regions=None ):
+	"""! @brief store gene IDs and positions per chromosome """
+	
+	gene_pos = load_gene_positions( gff3_file )
+	if regions:
+		gene_pos = filter_genes_by_regions( gene_pos, regions )
+	genes_per_chr = {}
+	for gene in sorted( gene_pos.keys() ):
+		try:
+			genes_per_chr[ gene_pos[ gene ]['chr'] ].append( gene )
+		except KeyError:
+			genes_per_chr.update( { gene_pos[ gene ]['chr']: [ gene ] } )
+	
+	columns_per_chr = {}
+	for header in genes_per_chr.keys():
+		genes = genes_per_chr[ header ]
+		columns_per_chr.update( { header: { 'id': np.array( genes, dtype=str ), 'start': np.array( [ gene_pos[ gene ]['start'] for gene in genes ], dtype=np.int64 ), 'end': np.array( [ gene_pos[ gene ]['end'] for gene in genes ], dtype=np.int64 ) } } )
+	save_columns( output_file, "genes", columns_per_chr )
+
+
+def main( arguments ):
+	"""! @brief run everything """
+	
+	output_file = arguments[ arguments.index( '--out' )+1 ]
+	regions = get_regions( arguments )
+	
+	if '--window' in arguments:
+		window = int( arguments[ arguments.index( '--window' )+1 ] )
+	else:
+		window = 1000
+	
+	if '--vcf' in arguments:
+		export_variants( arguments[ arguments.index( '--vcf' )+1 ], output_file, regions )
+	elif '--cov' in arguments:
+		export_coverage( arguments[ arguments.index( '--cov' )+1 ], output_file, window, regions )
+	else:
+		export_genes( arguments[ arguments.index( '--gff' )+1 ], output_file, regions )
+
+
+if __name__ == '__main__':
+	
+	if '--out' in sys.argv and ( '--vcf' in sys.argv or '--cov' in sys.argv or '--gff' in sys.argv ):
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
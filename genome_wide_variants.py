@@ -11,140 +11,212 @@ __usage__ = """
 					
 					optional:
 					--res <INT, RESOLUTION>[1000000]
+					--region <CHR:START-END, REPEATABLE>[all]
+					--threads <INT, NUMBER_OF_PROCESSES_FOR_CHROMOSOMES_OF_INDEXED_VCF>[1]
+					--rasterize <RASTERIZE_BINNED_VALUES_IN_VECTOR_FIGURES>[off]
+					--no-plot <ONLY_WRITE_TABLE_WITHOUT_FIGURE>[off]
+					--profile <WRITE_STAGE_TIMES_AND_MEMORY_AS_JSON>[off]
+					--cprofile <ADDITIONALLY_WRITE_CPROFILE_STATISTICS>[off]
 					
 					bug reports and feature requests: bpucker@cebitec.uni-bielefeld.de
 					"""
 
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-import sys, os
+import numpy as np
+import sys, os, math
+from vcf_reader import read_vcf
+from input_handler import get_worker_threads
+from region_index import get_regions, get_chromosome_shards
+from columnar import get_columnar_type, load_variant_positions
+from profiling import profiled, start_profiling, write_profile
+from plot_backend import get_pyplot, plots_requested
+from multiprocessing import Pool
 
 # --- end of imports --- #
 
 
-def load_variants_from_vcf( vcf_file ):
-	"""! @brief loads the variant informaiton from a SnpEff output VCF file """
+class VariantPositionConsumer( object ):
+	"""! @brief VCF record consumer: SNV and InDel positions per chromosome and number of triallelic variants """
 	
+	def __init__( self, output_dir=None, resolution=1000000, rasterize=False, plot=True ):
+		self.output_dir = output_dir
+		self.resolution = resolution
+		self.rasterize = rasterize
+		self.plot = plot
+		self.snps_per_chr = {}
+		self.indels_per_chr = {}
+		self.tri_counter = 0
+	
+	def add( self, record ):
+		"""! @brief collect position of one variant """
+		
+		if not "," in record.alt:	#only biallelic variants
+			if len( record.ref ) == len( record.alt ) and len( record.ref ) == 1:
+				try:
+					self.snps_per_chr[ record.chrom ].append( int( record.pos ) )
+				except KeyError:
+					self.snps_per_chr.update( { record.chrom: [ int( record.pos ) ] } )
+				
+			elif len( record.ref ) != len( record.alt ):
+				try:
+					self.indels_per_chr[ record.chrom ].append( int( record.pos ) )
+				except KeyError:
+					self.indels_per_chr.update( { record.chrom: [ int( record.pos ) ] } )
+		else:	#count triallelic variants
+			self.tri_counter += 1
+	
+	def finish( self ):
+		"""! @brief report numbers and generate figure and table """
+		
+		print "number of triallelic variants: " + str( self.tri_counter )
+		report_variants( self.snps_per_chr, self.indels_per_chr, self.output_dir, self.resolution, self.rasterize, self.plot )
+
+
+def collect_variants( vcf_file, regions=None, threads=None ):
+	"""! @brief collect SNV and InDel positions per chromosome and count triallelic variants """
+	
+	consumer = VariantPositionConsumer()
+	for record in read_vcf( vcf_file, regions=regions, threads=threads ):
+		consumer.add( record )
+	return consumer.snps_per_chr, consumer.indels_per_chr, consumer.tri_counter
+
+
+def collect_variants_of_shard( job ):
+	"""! @brief worker function: collect variants of one chromosome shard """
+	
+	vcf_file, regions, threads = job
+	return collect_variants( vcf_file, regions, threads )
+
+
+@profiled( count=lambda result: sum( [ len( values ) for each in result for values in each.values() ] ) )
+def load_variants_from_vcf( vcf_file, regions=None, threads=1 ):
+	"""! @brief loads the variant informaiton from a SnpEff output VCF file (one worker process per chromosome if the VCF is indexed) or from a columnar .npz file """
+	
+	if get_columnar_type( vcf_file ) == "variants":
+		snps_per_chr, indels_per_chr, tri_counter = load_variant_positions( vcf_file, regions )
+		print "number of triallelic variants: " + str( tri_counter )
+		return snps_per_chr, indels_per_chr
+	
+	shards = None
+	if threads > 1:
+		shards = get_chromosome_shards( vcf_file, regions )
+	
+	if shards:
+		workers = min( [ threads, len( shards ) ] )
+		worker_threads = get_worker_threads( workers )	#decompression threads per worker process to avoid oversubscription of the cores
+		pool = Pool( workers )
+		results = pool.map( collect_variants_of_shard, [ ( vcf_file, shard, worker_threads ) for shard in shards ] )
+		pool.close()
+		pool.join()
+	else:
+		results = [ collect_variants( vcf_file, regions ) ]
+	
+	# --- merge results of all shards --- #
 	snps_per_chr = {}
 	indels_per_chr = {}
-	
 	tri_counter = 0
+	for snps, indels, tri in results:
+		for key in snps.keys():
+			try:
+				snps_per_chr[ key ] += snps[ key ]
+			except KeyError:
+				snps_per_chr.update( { key: snps[ key ] } )
+		for key in indels.keys():
+			try:
+				indels_per_chr[ key ] += indels[ key ]
+			except KeyError:
+				indels_per_chr.update( { key: indels[ key ] } )
+		tri_counter += tri
 	
-	with open( vcf_file, "r" ) as f:
-		line = f.readline()
-		while line:
-			if line[0] != '#':
-				parts = line.strip().split('\t')
-				if not "," in parts[4]:	#only biallelic variants
-					if len( parts[3] ) == len( parts[4] ) and len( parts[3] ) == 1:
-						try:
-							snps_per_chr[ parts[0] ].append( parts[1] )
-						except KeyError:
-							snps_per_chr.update( { parts[0]: [ parts[1] ] } )
-						
-					elif len( parts[3] ) != len( parts[4] ):
-						try:
-							indels_per_chr[ parts[0] ].append( parts[1] )
-						except KeyError:
-							indels_per_chr.update( { parts[0]: [ parts[1] ] } )
-				else:	#count triallelic variants
-					tri_counter += 1
-						
-			line = f.readline()
 	print "number of triallelic variants: " + str( tri_counter )
 	
 	return snps_per_chr, indels_per_chr
 
 
-def generate_binned_values( lower_lim, upper_lim, chr_length, snps_per_chr, indels_per_chr, resolution ):
-	"""! @brief group variants into bins """
-	
-	snp_data = []
-	indel_data = []
-	while True:
-		if upper_lim >= chr_length:
-			break
-		else:
-			snp_tmp = []
-			indel_tmp = []
-			for SNP in snps_per_chr:
-				if SNP <= upper_lim and SNP > lower_lim:
-					snp_tmp.append( 'X' )
-			for indel in indels_per_chr:
-				if indel <= upper_lim and indel > lower_lim:
-					indel_tmp.append( 'X' )
-			snp_data.append( len( snp_tmp ) )
-			indel_data.append( len( indel_tmp ) )
-		upper_lim += resolution
-		lower_lim += resolution
-	return max( snp_data ), max( indel_data ), snp_data, indel_data
-
-
-def construct_plot( snps_per_chr_in, indels_per_chr_in, result_file, result_table, resolution ):
-	"""! @brief construct variant over Col-0 genome distribution plot """
-	
-	# --- conversion of data into lists of lists --- #
-	chr_lengths = []
-	chr_names = []
-	snps_per_chr = []
-	indels_per_chr = []
-	for key in sorted( snps_per_chr_in.keys() ):
-		snps = snps_per_chr_in[ key ]
-		indels = indels_per_chr_in[ key ]
-		snps_per_chr.append( snps )
-		indels_per_chr.append( indels )
-		chr_lengths.append( max( snps+indels ) )
-		chr_names.append( key )
+def generate_binned_values( chr_length, snps_per_chr, indels_per_chr, resolution ):
+	"""! @brief group variants into bins of given size (lower_lim < pos <= upper_lim) including the last partial bin """
 	
-	max_x_value = max( [ x for chro in snps_per_chr for x in chro ] + [ x for chro in indels_per_chr for x in chro ] )
+	n_bins = max( [ 1, int( math.ceil( chr_length / float( resolution ) ) ) ] )
+	snp_data = np.bincount( ( snps_per_chr - 1 ) // resolution, minlength=n_bins )
+	indel_data = np.bincount( ( indels_per_chr - 1 ) // resolution, minlength=n_bins )
+	return snp_data.max(), indel_data.max(), snp_data.tolist(), indel_data.tolist()
+
+
+@profiled( count=lambda result: sum( [ len( values ) for values in result[2] ] ) )
+def get_binned_data( snps_per_chr_in, indels_per_chr_in, resolution ):
+	"""! @brief numbers of SNVs and InDels per bin of all chromosomes (sorted by name)
 	
-	# --- generation of figure --- #
-	fig, ax = plt.subplots()
+	@return chromosome names, chromosome lengths (last variant), SNVs per bin, InDels per bin, maximal number of SNVs and of InDels in one bin
+	"""
 	
-	snp_scale = 1
-	indel_scale = 1
+	chr_lengths = []
+	chr_names = []
 	snp_data = []
 	indel_data = []
-	for idx, chr_length in enumerate( chr_lengths ):
-		max_snp, max_indel, snp_temp, indel_temp = generate_binned_values( 0, resolution+0, chr_length, snps_per_chr[ idx ], indels_per_chr[ idx ], resolution )
+	snp_scale = 1
+	indel_scale = 1
+	for key in sorted( snps_per_chr_in.keys() ):
+		snps = np.array( snps_per_chr_in[ key ], dtype=np.int64 )
+		indels = np.array( indels_per_chr_in.get( key, [] ), dtype=np.int64 )
+		chr_length = int( np.concatenate( [ snps, indels ] ).max() )
+		max_snp, max_indel, snp_temp, indel_temp = generate_binned_values( chr_length, snps, indels, resolution )
+		chr_lengths.append( chr_length )
+		chr_names.append( key )
 		snp_data.append( snp_temp )
 		indel_data.append( indel_temp )
 		snp_scale = max( [ snp_scale, max_snp ] )
 		indel_scale = max( [ indel_scale, max_indel ] )
+	return chr_names, chr_lengths, snp_data, indel_data, float( snp_scale ), float( indel_scale )
+
+
+@profiled()
+def write_variant_table( snp_data, indel_data, result_table ):
+	"""! @brief write numbers of SNVs and InDels per bin (two lines per chromosome) """
+	
+	with open( result_table, "w" ) as out:
+		for idx in range( len( snp_data ) ):
+			out.write( 'Chr' + str( idx+1 ) + "SNVs:\t" + '\t'.join( map( str, snp_data[ idx ] ) ) + '\n' )
+			out.write( 'Chr' + str( idx+1 ) + "InDels:\t" + '\t'.join( map( str, indel_data[ idx ] ) ) + '\n' )
+
+
+@profiled()
+def construct_plot( snps_per_chr_in, indels_per_chr_in, result_file, result_table, resolution, rasterize=False ):
+	"""! @brief construct variant over Col-0 genome distribution plot
+	
+	@param rasterize render the dense layers of binned values as raster image (vector output formats only)
+	"""
+	
+	chr_names, chr_lengths, snp_data, indel_data, snp_scale, indel_scale = get_binned_data( snps_per_chr_in, indels_per_chr_in, resolution )
+	write_variant_table( snp_data, indel_data, result_table )
 	
-	snp_scale = float( snp_scale )
-	indel_scale = float( indel_scale )
+	max_x_value = max( chr_lengths )
 	y_max = len( chr_lengths )
 	
+	# --- generation of figure --- #
+	plt = get_pyplot()
+	import matplotlib.patches as mpatches	#deferred like pyplot
+	fig, ax = plt.subplots()
 	ax2 = ax.twinx()
 	
-	with open( result_table, "w" ) as out:
-		for idx, chr_length in enumerate( chr_lengths ):
-			y = y_max-( idx*1.2 )
-			x = resolution / 1000000.0
-			
-			ax.text( ( chr_length/ 1000000.0 ), y+0.3, chr_names[ idx ], ha="right" )
-			
-			# --- plotting SNP and InDel distribution --- #
-			for i, snps in enumerate( snp_data[ idx ] ):
-				indels = indel_data[ idx ][ i ]
-				
-				ax.plot( [ x*i+0.5*x, x*i+0.5*x ], [ y, y+ ( snps / snp_scale ) ], "-", color="lime" )
-				ax2.plot( [ x*i+0.5*x, x*i+0.5*x ], [ y, y+ ( indels / indel_scale ) ], "-", color="magenta" )
-			
-			ax.plot( [ 0, 0 ], [ y, y+1 ], color="black" )
-			ax.text( 0, y+1, str( int( snp_scale ) ), ha="right", fontsize=5 )
-			ax.text( 0, y+0.5, str( int( snp_scale / 2 ) ), ha="right", fontsize=5 )
-			ax.text( 0, y, "0", ha="right", fontsize=5 )
-			
-			ax.plot( [ max_x_value, max_x_value ], [ y, y+1 ], color="black" )
-			ax.text( max_x_value, y+1, str( int( indel_scale ) ), ha="right", fontsize=5 )
-			ax.text( max_x_value, y+0.5, str( int( indel_scale / 2 ) ), ha="right", fontsize=5 )
-			ax.text( max_x_value, y, "0", ha="right", fontsize=5 )
-			
-			# --- writing data into output table --- #
-			out.write( 'Chr' + str( idx+1 ) + "SNVs:\t" + '\t'.join( map( str, snp_data ) ) + '\n' )
-			out.write( 'Chr' + str( idx+1 ) + "InDels:\t" + '\t'.join( map( str, indel_data ) ) + '\n' )
+	for idx, chr_length in enumerate( chr_lengths ):
+		y = y_max-( idx*1.2 )
+		x = resolution / 1000000.0
+		
+		ax.text( ( chr_length/ 1000000.0 ), y+0.3, chr_names[ idx ], ha="right" )
+		
+		# --- plotting SNP and InDel distribution (one collection of lines per chromosome and variant type) --- #
+		bin_centers = x * np.arange( len( snp_data[ idx ] ) ) + 0.5*x
+		ax.vlines( bin_centers, y, y + ( np.asarray( snp_data[ idx ] ) / snp_scale ), color="lime", rasterized=rasterize )
+		ax2.vlines( bin_centers, y, y + ( np.asarray( indel_data[ idx ] ) / indel_scale ), color="magenta", rasterized=rasterize )
+		
+		ax.plot( [ 0, 0 ], [ y, y+1 ], color="black" )
+		ax.text( 0, y+1, str( int( snp_scale ) ), ha="right", fontsize=5 )
+		ax.text( 0, y+0.5, str( int( snp_scale / 2 ) ), ha="right", fontsize=5 )
+		ax.text( 0, y, "0", ha="right", fontsize=5 )
+		
+		ax.plot( [ max_x_value, max_x_value ], [ y, y+1 ], color="black" )
+		ax.text( max_x_value, y+1, str( int( indel_scale ) ), ha="right", fontsize=5 )
+		ax.text( max_x_value, y+0.5, str( int( indel_scale / 2 ) ), ha="right", fontsize=5 )
+		ax.text( max_x_value, y, "0", ha="right", fontsize=5 )
 	
 	ax.set_xlabel( "genomic position [ Mbp ]" )
 	ax.set_ylabel( "number of SNVs per interval" )
@@ -170,9 +242,26 @@ def construct_plot( snps_per_chr_in, indels_per_chr_in, result_file, result_tabl
 	plt.close('all')
 
 
+def report_variants( snps_per_chr, indels_per_chr, output_dir, resolution, rasterize=False, plot=True ):
+	"""! @brief report numbers of variants and generate genome wide figure and table (only the table if plot is False) """
+	
+	result_file = output_dir + "genome_wide_small_variants.png"
+	result_table = output_dir + "genome_wide_small_variants.txt"
+	
+	print "number of SNVs: " + str( len( [ x for each in snps_per_chr.values() for x in each ] ) )
+	print "number of InDels: " + str( len( [ x for each in indels_per_chr.values() for x in each ]) )
+	
+	if plot:
+		construct_plot( snps_per_chr, indels_per_chr, result_file, result_table, resolution, rasterize )
+	else:
+		chr_names, chr_lengths, snp_data, indel_data, snp_scale, indel_scale = get_binned_data( snps_per_chr, indels_per_chr, resolution )
+		write_variant_table( snp_data, indel_data, result_table )
+
+
 def main( arguments ):
 	"""! @brief run everyting """
 	
+	start_profiling( arguments )
 	vcf_file = arguments[ arguments.index( '--vcf' )+1 ]
 	output_dir = arguments[ arguments.index( '--out' )+1 ]
 	
@@ -181,23 +270,28 @@ def main( arguments ):
 	else:
 		resolution = 1000000
 	
+	regions = get_regions( arguments )
+	rasterize = '--rasterize' in arguments
+	
+	if '--threads' in arguments:
+		threads = int( arguments[ arguments.index( '--threads' )+1 ] )
+	else:
+		threads = 1
+	
 	if output_dir[ -1 ] != "/":
 		output_dir += "/"
 	if not os.path.exists( output_dir ):
 		os.makedirs( output_dir )
 	
-	result_file = output_dir + "genome_wide_small_variants.png"
-	result_table = output_dir + "genome_wide_small_variants.txt"
-	
-	snps_per_chr, indels_per_chr = load_variants_from_vcf( vcf_file )
-	
-	print "number of SNVs: " + str( len( [ x for each in snps_per_chr.values() for x in each ] ) )
-	print "number of InDels: " + str( len( [ x for each in indels_per_chr.values() for x in each ]) )
+	snps_per_chr, indels_per_chr = load_variants_from_vcf( vcf_file, regions, threads )
 	
-	construct_plot( snps_per_chr, indels_per_chr, result_file, result_table, resolution )
+	report_variants( snps_per_chr, indels_per_chr, output_dir, resolution, rasterize, plots_requested( arguments ) )
+	write_profile( output_dir + "profile" )
 
 
-if '--vcf' in sys.argv and '--out' in sys.argv:
-	main( sys.argv )
-else:
-	sys.exit( __usage__ )
+if __name__ == '__main__':
+	
+	if '--vcf' in sys.argv and '--out' in sys.argv:
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
@@ -0,0 +1,147 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### one-pass GFF3 parser into columnar arrays per chromosome with parent links and checksum validated binary cache ###
+
+import hashlib, os
+import numpy as np
+from input_handler import open_input
+from columnar import save_columns, load_columns
+
+# --- end of imports --- #
+
+GFF_CACHE_SUFFIX = ".gffidx.npz"	#sidecar file next to the GFF3 file
+CHECKSUM_BLOCK_SIZE = 16 * 1024 * 1024	#number of bytes hashed at once
+GFF_CACHE_FORMAT = 2	#caches of other formats are rebuilt
+
+
+def get_file_checksum( filename ):
+	"""! @brief MD5 checksum of the file content """
+	
+	checksum = hashlib.md5()
+	with open( filename, "rb" ) as f:
+		block = f.read( CHECKSUM_BLOCK_SIZE )
+		while block:
+			checksum.update( block )
+			block = f.read( CHECKSUM_BLOCK_SIZE )
+	return checksum.hexdigest()
+
+
+def get_attribute_values( attributes, key ):
+	"""! @brief get all comma-separated values of one attribute from the last GFF3 column; empty list if missing """
+	
+	prefix = key + "="
+	for entry in attributes.split(';'):
+		entry = entry.strip()
+		if entry.startswith( prefix ):
+			return [ value for value in entry[ len( prefix ): ].split(',') if value ]
+	return []
+
+
+def get_attribute( attributes, key ):
+	"""! @brief get value of one attribute from the last GFF3 column (first value if there are several); empty string if missing """
+	
+	values = get_attribute_values( attributes, key )
+	if values:
+		return values[0]
+	return ""
+
+
+def parse_gff_features( gff3_file ):
+	"""! @brief parse all features into columns per chromosome: type, start, end, strand, ID and index of the first parent feature (-1 if none)
+	
+	features with several parents (e.g. a CDS shared by two mRNAs) keep all of them as ( child, parent ) index pairs in link_child and link_parent
+	"""
+	
+	rows_per_chr = {}
+	with open_input( gff3_file ) as f:
+		line = f.readline()
+		while line:
+			if line[0] != '#':
+				parts = line.strip().split('\t')
+				if len( parts ) > 8:
+					row = ( parts[2], int( parts[3] ), int( parts[4] ), parts[6], get_attribute( parts[8], "ID" ), get_attribute_values( parts[8], "Parent" ) )
+					try:
+						rows_per_chr[ parts[0] ].append( row )
+					except KeyError:
+						rows_per_chr.update( { parts[0]: [ row ] } )
+			line = f.readline()
+	
+	index = {}
+	for header in rows_per_chr.keys():
+		types, starts, ends, strands, IDs, parents = zip( *rows_per_chr[ header ] )
+		positions = {}
+		for idx, ID in enumerate( IDs ):
+			if ID and ID not in positions:
+				positions.update( { ID: idx } )
+		links = [ ( idx, positions[ parent ] ) for idx, values in enumerate( parents ) for parent in values if parent in positions ]
+		first_parents = [ positions.get( values[0], -1 ) if values else -1 for values in parents ]
+		index.update( { header: { 'type': np.array( types, dtype=str ), 'start': np.array( starts, dtype=np.int64 ), 'end': np.array( ends, dtype=np.int64 ), 'strand': np.array( strands, dtype=str ), 'id': np.array( IDs, dtype=str ), 'parent': np.array( first_parents, dtype=np.int64 ), 'link_child': np.array( [ link[0] for link in links ], dtype=np.int64 ), 'link_parent': np.array( [ link[1] for link in links ], dtype=np.int64 ) } } )
+		del rows_per_chr[ header ][:]
+	return index
+
+
+def load_gff_index( gff3_file, use_cache=True ):
+	"""! @brief load feature index of GFF3 file from cache if the checksum matches; otherwise parse the file and store the cache """
+	
+	checksum = get_file_checksum( gff3_file )
+	cache_file = gff3_file + GFF_CACHE_SUFFIX
+	if use_cache and os.path.isfile( cache_file ):
+		index, meta = load_columns( cache_file )
+		if str( meta.get( 'checksum' ) ) == checksum and int( meta.get( 'format', 0 ) ) == GFF_CACHE_FORMAT:
+			return index
+	
+	index = parse_gff_features( gff3_file )
+	if use_cache:
+		try:
+			save_columns( cache_file, "gff", index, { 'checksum': checksum, 'format': GFF_CACHE_FORMAT } )
+		except ( IOError, OSError ):
+			print "WARNING: could not write GFF3 index " + cache_file
+	return index
+
+
+def get_gene_positions( index ):
+	"""! @brief positions of all genes like classify_genes_by_cov.load_gene_positions """
+	
+	gene_pos = {}
+	for header in index.keys():
+		columns = index[ header ]
+		for idx in np.flatnonzero( columns['type'] == "gene" ).tolist():
+			gene_pos.update( { columns['id'][ idx ]: { 'chr': header, 'start': int( columns['start'][ idx ] ), 'end': int( columns['end'][ idx ] ) } } )
+	return gene_pos
+
+
+def get_feature_intervals( index, feature_type ):
+	"""! @brief ( start, end ) of all features of one type per chromosome """
+	
+	intervals = {}
+	for header in index.keys():
+		selection = index[ header ]['type'] == feature_type
+		if selection.any():
+			intervals.update( { header: zip( index[ header ]['start'][ selection ].tolist(), index[ header ]['end'][ selection ].tolist() ) } )
+	return intervals
+
+
+def get_descendants( columns, idx ):
+	"""! @brief indices of all features below the given feature (e.g. mRNAs, exons and CDS of a gene) via all parent links """
+	
+	descendants = set( [] )
+	parents = np.array( [ idx ], dtype=np.int64 )
+	while len( parents ) > 0:
+		children = [ child for child in set( columns['link_child'][ np.in1d( columns['link_parent'], parents ) ].tolist() ) if child not in descendants ]
+		descendants.update( children )
+		parents = np.array( children, dtype=np.int64 )
+	return sorted( descendants )
+
+
+def get_gene_CDS( index, gene_ID ):
+	"""! @brief chromosome and ( start, end ) of all CDS features of one gene (via the parent links gene - mRNA - CDS) """
+	
+	for header in index.keys():
+		matches = np.flatnonzero( index[ header ]['id'] == gene_ID )
+		if len( matches ) > 0:
+			columns = index[ header ]
+			CDS = [ ( int( columns['start'][ idx ] ), int( columns['end'][ idx ] ) ) for idx in get_descendants( columns, matches[0] ) if columns['type'][ idx ] == "CDS" ]
+			return header, sorted( CDS )
+	return None, []
@@ -0,0 +1,91 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### fixed-bin histograms which are filled in batches and can be merged, exported and loaded again ###
+
+import numpy as np
+
+# --- end of imports --- #
+
+
+class Histogram( object ):
+	"""! @brief integer counts of values in equally sized bins between start and end (values outside are counted separately) """
+	
+	def __init__( self, start, end, bins ):
+		self.start = float( start )
+		self.end = float( end )
+		self.bins = int( bins )
+		self.counts = np.zeros( self.bins, dtype=np.int64 )
+		self.underflow = 0
+		self.overflow = 0
+	
+	def get_edges( self ):
+		"""! @brief borders of all bins (bins + 1 values) """
+		
+		return np.linspace( self.start, self.end, self.bins + 1 )
+	
+	def add( self, values ):
+		"""! @brief count batch of values; the last bin includes the end like np.histogram """
+		
+		values = np.asarray( values, dtype=np.float64 )
+		if len( values ) == 0:
+			return
+		inside = ( values >= self.start ) & ( values <= self.end )
+		self.underflow += int( np.count_nonzero( values < self.start ) )
+		self.overflow += int( np.count_nonzero( values > self.end ) )
+		idx = ( ( values[ inside ] - self.start ) * self.bins / ( self.end - self.start ) ).astype( np.int64 )
+		np.minimum( idx, self.bins - 1, out=idx )
+		self.counts += np.bincount( idx, minlength=self.bins )
+	
+	def merge( self, other ):
+		"""! @brief add counts of another histogram with identical bins """
+		
+		if ( self.start, self.end, self.bins ) != ( other.start, other.end, other.bins ):
+			raise ValueError( "histograms with different bins can not be merged" )
+		self.counts += other.counts
+		self.underflow += other.underflow
+		self.overflow += other.overflow
+	
+	def write_table( self, output_file ):
+		"""! @brief write counts per bin as TSV (values outside of all bins in comment lines) """
+		
+		edges = self.get_edges()
+		with open( output_file, "w" ) as out:
+			out.write( "#underflow\t" + str( self.underflow ) + '\n' )
+			out.write( "#overflow\t" + str( self.overflow ) + '\n' )
+			out.write( "BinStart\tBinEnd\tCount\n" )
+			for i in xrange( self.bins ):
+				out.write( "\t".join( map( str, [ edges[ i ], edges[ i+1 ], self.counts[ i ] ] ) ) + '\n' )
+
+
+def load_histogram( input_file ):
+	"""! @brief load histogram from TSV written by Histogram.write_table """
+	
+	outside = {}
+	starts = []
+	ends = []
+	counts = []
+	with open( input_file, "r" ) as f:
+		for line in f:
+			parts = line.strip().split('\t')
+			if line[0] == '#':
+				outside.update( { parts[0][1:]: int( parts[1] ) } )
+			elif parts[0] != "BinStart":
+				starts.append( float( parts[0] ) )
+				ends.append( float( parts[1] ) )
+				counts.append( int( parts[2] ) )
+	if len( counts ) == 0:
+		raise ValueError( "histogram table without bins: " + input_file )
+	histogram = Histogram( starts[0], ends[-1], len( counts ) )
+	histogram.counts += np.array( counts, dtype=np.int64 )
+	histogram.underflow = outside.get( "underflow", 0 )
+	histogram.overflow = outside.get( "overflow", 0 )
+	return histogram
+
+
+def plot_histogram( ax, histogram, color ):
+	"""! @brief draw precomputed counts of histogram into axis """
+	
+	edges = histogram.get_edges()
+	ax.hist( edges[ :-1 ], bins=edges, weights=histogram.counts, color=color )
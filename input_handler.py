@@ -0,0 +1,187 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### transparent reading of plain, gzip and BGZF compressed input files ###
+
+import gzip, io, os, struct, zlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+# --- end of imports --- #
+
+GZIP_MAGIC = b"\x1f\x8b"
+BLOCKS_PER_THREAD = 16	#maximal number of BGZF blocks decompressed per thread and batch (batches grow from one block to this size)
+BGZF_THREADS = { 'default': None }	#number of threads for BGZF decompression if not given by the caller (None: number of CPUs)
+
+
+def set_bgzf_threads( threads ):
+	"""! @brief set default number of BGZF decompression threads of this process (e.g. 1 in worker processes) """
+	
+	BGZF_THREADS['default'] = threads
+
+
+def get_bgzf_threads( threads=None ):
+	"""! @brief number of BGZF decompression threads: given value, default of this process or number of CPUs """
+	
+	if threads is not None:
+		return max( [ 1, threads ] )
+	if BGZF_THREADS['default'] is not None:
+		return max( [ 1, BGZF_THREADS['default'] ] )
+	return cpu_count()
+
+
+def get_worker_threads( workers ):
+	"""! @brief number of BGZF decompression threads per worker process so that all workers together use each CPU once """
+	
+	return max( [ 1, cpu_count() // max( [ 1, workers ] ) ] )
+
+
+def get_source_stamp( filename ):
+	"""! @brief get size and modification time of a file to validate sidecar caches and indices """
+	
+	stat = os.stat( filename )
+	return str( stat.st_size ), repr( stat.st_mtime )
+
+
+def detect_compression( filename ):
+	"""! @brief detect compression by magic bytes: returns 'bgzf', 'gzip' or 'plain' """
+	
+	with open( filename, "rb" ) as f:
+		header = f.read( 18 )
+	if header[:2] != GZIP_MAGIC:
+		return "plain"
+	if len( header ) >= 14 and ord( header[3:4] ) & 4 and header[12:14] == b"BC":
+		return "bgzf"
+	return "gzip"
+
+
+def read_bgzf_block( handle ):
+	"""! @brief read next complete BGZF block (header, compressed data and footer); returns empty string at end of file """
+	
+	header = handle.read( 12 )
+	if len( header ) < 12:
+		return b""
+	xlen = struct.unpack( "<H", header[10:12] )[0]
+	extra = handle.read( xlen )
+	bsize = None
+	i = 0
+	while i < xlen:
+		si1, si2, slen = struct.unpack( "<ccH", extra[ i:i+4 ] )
+		if si1 == b"B" and si2 == b"C":
+			bsize = struct.unpack( "<H", extra[ i+4:i+6 ] )[0]
+		i += 4 + slen
+	if bsize is None:
+		raise IOError( "not a BGZF block (missing BC field)" )
+	return header + extra + handle.read( bsize + 1 - 12 - xlen )
+
+
+def decompress_bgzf_block( block ):
+	"""! @brief inflate one BGZF block and check the uncompressed size """
+	
+	xlen = struct.unpack( "<H", block[10:12] )[0]
+	data = zlib.decompress( block[ 12+xlen:-8 ], -15 )
+	if len( data ) != struct.unpack( "<I", block[-4:] )[0]:
+		raise IOError( "BGZF block is truncated or corrupted" )
+	return data
+
+
+class BGZFInflater( object ):
+	"""! @brief decompression of batches of BGZF blocks; the thread pool is only started for the first batch of several blocks """
+	
+	def __init__( self, threads=None ):
+		self.threads = get_bgzf_threads( threads )
+		self.pool = None
+	
+	def inflate( self, batch ):
+		"""! @brief decompressed data of all blocks of the batch in file order """
+		
+		if self.threads == 1 or len( batch ) == 1:
+			return [ decompress_bgzf_block( each ) for each in batch ]
+		if self.pool is None:
+			self.pool = ThreadPool( self.threads )
+		return self.pool.map( decompress_bgzf_block, batch )
+	
+	def close( self ):
+		if self.pool is not None:
+			self.pool.terminate()
+			self.pool = None
+
+
+def iterate_bgzf_data( handle, inflater ):
+	"""! @brief generator over decompressed BGZF blocks in file order from the current position of an open file
+	
+	batches start with one block and double up to BLOCKS_PER_THREAD blocks per thread, so short reads after a seek only inflate the blocks they need
+	"""
+	
+	batch_size = 1
+	while True:
+		batch = []
+		block = read_bgzf_block( handle )
+		while block:
+			batch.append( block )
+			if len( batch ) >= batch_size:
+				break
+			block = read_bgzf_block( handle )
+		if not batch:
+			break
+		for data in inflater.inflate( batch ):
+			if data:
+				yield data
+		batch_size = min( [ batch_size * 2, inflater.threads * BLOCKS_PER_THREAD ] )
+
+
+class BGZFRawReader( io.RawIOBase ):
+	"""! @brief raw stream of decompressed BGZF data to be wrapped by io.BufferedReader """
+	
+	def __init__( self, filename, threads, start=0 ):
+		io.RawIOBase.__init__( self )
+		self.handle = open( filename, "rb" )
+		self.handle.seek( start )
+		self.inflater = BGZFInflater( threads )
+		self.blocks = iterate_bgzf_data( self.handle, self.inflater )
+		self.buffer = b""
+	
+	def readable( self ):
+		return True
+	
+	def readinto( self, b ):
+		"""! @brief fill given buffer with decompressed data; returns 0 at end of file """
+		
+		while not self.buffer:
+			try:
+				self.buffer = next( self.blocks )
+			except StopIteration:
+				return 0
+		n = min( len( b ), len( self.buffer ) )
+		b[:n] = self.buffer[:n]
+		self.buffer = self.buffer[n:]
+		return n
+	
+	def close( self ):
+		if not self.closed:
+			self.blocks.close()
+			self.inflater.close()
+			self.handle.close()
+		io.RawIOBase.close( self )
+
+
+def open_input( filename, threads=None, offset=0 ):
+	"""! @brief open plain, gzip or BGZF compressed file for reading (line based access like open( filename, 'r' ) )
+	
+	@param threads number of BGZF decompression threads (default: get_bgzf_threads)
+	@param offset position to start reading from: byte offset for plain files, virtual offset for BGZF files (not supported for gzip)
+	"""
+	
+	compression = detect_compression( filename )
+	if compression == "plain":
+		handle = open( filename, "r" )
+		handle.seek( offset )
+		return handle
+	if compression == "gzip":
+		if offset:
+			raise IOError( "random access is not possible in gzip files, use bgzip instead" )
+		return gzip.open( filename, "rb" )
+	handle = io.BufferedReader( BGZFRawReader( filename, threads, offset >> 16 ), buffer_size=1024*1024 )
+	handle.read( offset & 0xFFFF )
+	return handle
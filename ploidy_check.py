@@ -6,50 +6,149 @@ __usage__ = """
 					python ploidy_check.py
 					--vcf <FULL_PATH_TO_INPUT_VCF>
 					--out <FULL_PATH_TO_OUTPUT_DIRECTORY>
+					
+					optional:
+					--region <CHR:START-END, REPEATABLE>[all]
+					--merge <FULL_PATH_TO_HISTOGRAM_TABLE_DIRECTORY, REPEATABLE>[none]
+					--all_samples <ANALYZE_EACH_SAMPLE_OF_MULTI_SAMPLE_VCF>[off]
+					--no-plot <ONLY_WRITE_TABLES_WITHOUT_FIGURES>[off]
+					--profile <WRITE_STAGE_TIMES_AND_MEMORY_AS_JSON>[off]
+					--cprofile <ADDITIONALLY_WRITE_CPROFILE_STATISTICS>[off]
 					"""
 
-import matplotlib.pyplot as plt
 import sys, os
+import numpy as np
+from vcf_reader import read_vcf, get_samples, get_sample_names, get_format_keys
+from region_index import get_regions
+from histogram_accumulator import Histogram, load_histogram, plot_histogram
+from profiling import profiled, stage, start_profiling, write_profile
+from plot_backend import get_pyplot, plots_requested
 
 
 # --- end of imports --- #
 
-def main( arguments ):
-	"""! @brief run everything """
+BATCH_SIZE = 100000	#number of values collected before they are added to the histograms
+
+MAX_COVERAGE = 1000	#coverage histogram counts values in bins of width 1 up to this value
+
+COVERAGE_TABLE = "variant_coverages.txt"
+FREQUENCY_TABLE = "allele_frequencies.txt"
+PLOIDY_TABLE = "ploidy_calls.txt"
+
+MATRIX_BATCH_SIZE = 10000	#number of variants parsed into one (variants x samples) matrix
+MIN_FREQUENCY_COVERAGE = 20	#minimal coverage of heterozygous variants for allele frequency histogram
+PEAK_WINDOW = 0.05	#allele frequencies within this distance of 0.33, 0.5 or 0.66 are assigned to the peak
+
+HETEROZYGOUS = 1
+HOMOZYGOUS = 2
+GENOTYPE_CODES = { "0/1": HETEROZYGOUS, "0|1": HETEROZYGOUS, "1|0": HETEROZYGOUS, "1/1": HOMOZYGOUS, "1|1": HOMOZYGOUS }
+
+
+def parse_sample_matrix( records, number_of_samples ):
+	"""! @brief parse GT and AD of all samples into (variants x samples) matrices of genotype codes, reference and alternative read counts """
 	
-	vcf_file = arguments[ arguments.index( '--vcf' )+1 ]
-	output_dir = arguments[ arguments.index( '--out' )+1 ]
-	if output_dir[ -1 ] != "/":
-		output_dir += "/"
+	genotypes = np.zeros( ( len( records ), number_of_samples ), dtype=np.int8 )
+	ref_counts = np.zeros( ( len( records ), number_of_samples ), dtype=np.int32 )
+	alt_counts = np.zeros( ( len( records ), number_of_samples ), dtype=np.int32 )
+	for i, record in enumerate( records ):
+		format_keys = get_format_keys( record )
+		if "GT" not in format_keys or "AD" not in format_keys:
+			continue
+		gt_idx = format_keys.index( "GT" )
+		ad_idx = format_keys.index( "AD" )
+		for j, sample in enumerate( get_samples( record )[ :number_of_samples ] ):
+			fields = sample.split(':')
+			code = GENOTYPE_CODES.get( fields[ gt_idx ], 0 )
+			if code == 0 or len( fields ) <= ad_idx:
+				continue
+			ad = fields[ ad_idx ].split(',')
+			if len( ad ) < 2 or ad[0] == "." or ad[1] == ".":
+				continue
+			genotypes[ i, j ] = code
+			ref_counts[ i, j ] = int( ad[0] )
+			alt_counts[ i, j ] = int( ad[1] )
+	return genotypes, ref_counts, alt_counts
+
+
+def add_sample_matrix( coverage_hists, frequency_hists, genotypes, ref_counts, alt_counts ):
+	"""! @brief add coverage of all variants and allele frequency of heterozygous variants to the histograms of each sample """
 	
-	if not os.path.exists( output_dir ):
-		os.makedirs( output_dir )
+	coverage = ref_counts + alt_counts
+	frequency_mask = ( genotypes == HETEROZYGOUS ) & ( coverage > MIN_FREQUENCY_COVERAGE )
+	with np.errstate( divide="ignore", invalid="ignore" ):
+		frequencies = ref_counts / coverage.astype( np.float64 )
+	for j in xrange( genotypes.shape[1] ):
+		coverage_hists[ j ].add( coverage[ genotypes[ :, j ] > 0, j ] )
+		frequency_hists[ j ].add( frequencies[ frequency_mask[ :, j ], j ] )
+
+
+def call_ploidy( frequency_hist ):
+	"""! @brief compare number of heterozygous variants around 0.5 (diploid) to the number around 0.33 and 0.66 (triploid) """
 	
-	fig_file = output_dir + "allele_frequencies.png"
-	cov_fig_file = output_dir + "variant_coverages.png"
+	centers = ( frequency_hist.get_edges()[ :-1 ] + frequency_hist.get_edges()[ 1: ] ) / 2.0
+	peaks = []
+	for peak in [ 0.33, 0.5, 0.66 ]:
+		peaks.append( int( frequency_hist.counts[ np.abs( centers - peak ) <= PEAK_WINDOW ].sum() ) )
+	if peaks[0] + peaks[1] + peaks[2] == 0:
+		return "n/a", peaks
+	if ( peaks[0] + peaks[2] ) / 2.0 > peaks[1]:
+		return "triploid", peaks
+	return "diploid", peaks
 
-	values = []
-	coverage = []
-
-
-	with open( vcf_file, "r" ) as f:
-		line = f.readline()
-		while line:
-			if line[0] != '#':
-				parts = line.strip().split('\t')
-				if parts[-1][:3] == "0/1":
-					x, y = map( float, parts[-1].split(':')[1].split(',')[:2] )
-					coverage.append( x+y )
-					if x+y > 20:
-						values.append( x / ( x+y ) )
-				elif parts[-1][:3] == "1/1":
-					x, y = map( float, parts[-1].split(':')[1].split(',')[:2] )
-					coverage.append( x+y )
-			line = f.readline()
 
+@profiled()
+def analyze_all_samples( vcf_file, regions, output_dir, plot=True ):
+	"""! @brief allele frequency histograms and ploidy call of each sample of a multi-sample VCF in one pass (figures only if plot is True) """
+	
+	sample_names = get_sample_names( vcf_file )
+	coverage_hists = [ Histogram( 0, MAX_COVERAGE, MAX_COVERAGE ) for name in sample_names ]
+	frequency_hists = [ Histogram( 0, 1, 100 ) for name in sample_names ]
+	
+	records = []
+	for record in read_vcf( vcf_file, regions=regions ):
+		records.append( record )
+		if len( records ) >= MATRIX_BATCH_SIZE:
+			add_sample_matrix( coverage_hists, frequency_hists, *parse_sample_matrix( records, len( sample_names ) ) )
+			records = []
+	add_sample_matrix( coverage_hists, frequency_hists, *parse_sample_matrix( records, len( sample_names ) ) )
+	
+	sample_dir = output_dir + "samples/"
+	if not os.path.exists( sample_dir ):
+		os.makedirs( sample_dir )
+	with open( output_dir + PLOIDY_TABLE, "w" ) as out:
+		out.write( "Sample\tHeterozygousVariants\tPeak0.33\tPeak0.5\tPeak0.66\tPloidy\n" )
+		for j, name in enumerate( sample_names ):
+			coverage_hists[ j ].write_table( sample_dir + name + "_" + COVERAGE_TABLE )
+			frequency_hists[ j ].write_table( sample_dir + name + "_" + FREQUENCY_TABLE )
+			ploidy, peaks = call_ploidy( frequency_hists[ j ] )
+			out.write( "\t".join( map( str, [ name, frequency_hists[ j ].counts.sum() ] + peaks + [ ploidy ] ) ) + '\n' )
+			if not plot:
+				continue
+			
+			plt = get_pyplot()
+			fig, ax = plt.subplots()
+			plot_histogram( ax, frequency_hists[ j ], "lime" )
+			ax.set_xlabel( "allele frequency" )
+			ax.set_ylabel( "number of variants" )
+			ax.set_title( name + " (" + ploidy + ")" )
+			ax.set_xlim( 0, 1 )
+			ax.spines['top'].set_visible(False)
+			ax.spines['right'].set_visible(False)
+			fig.savefig( sample_dir + name + "_allele_frequencies.png", dpi=300 )
+			plt.close( fig )
+
+
+@profiled()
+def generate_figures( coverage_hist, frequency_hist, output_dir ):
+	"""! @brief generate variant coverage and allele frequency histograms """
+	
+	fig_file = output_dir + "allele_frequencies.png"
+	cov_fig_file = output_dir + "variant_coverages.png"
+	
 	# --- generation of variant coverage histogram --- #
+	plt = get_pyplot()
 	fig, ax = plt.subplots()
-	ax.hist( coverage, bins=10000, color="lime" )
+	plot_histogram( ax, coverage_hist, "lime" )
 	ax.set_xlim( 0, 400 )
 	
 	ax.spines['top'].set_visible(False)
@@ -59,11 +158,11 @@ def main( arguments ):
 	ax.set_ylabel( "number of variants" )
 	
 	fig.savefig( cov_fig_file, dpi=300 )
-
+	
 	
 	# --- generation of variant frequency histogram --- #
 	fig, ax = plt.subplots()
-	ax.hist( values, bins=100, color="lime" )
+	plot_histogram( ax, frequency_hist, "lime" )
 	ax.set_xlabel( "allele frequency" )
 	ax.set_ylabel( "number of variants" )
 	
@@ -82,7 +181,92 @@ def main( arguments ):
 	plt.close( "all" )
 
 
-if '--vcf' in sys.argv and '--out' in sys.argv:
-	main( sys.argv )
-else:
-	sys.exit( __usage__ )
+class AlleleFrequencyConsumer( object ):
+	"""! @brief VCF record consumer: coverage and allele frequency histograms of the last sample """
+	
+	def __init__( self, output_dir, merge_dirs=[], plot=True ):
+		self.output_dir = output_dir
+		self.merge_dirs = merge_dirs
+		self.plot = plot
+		self.coverage_hist = Histogram( 0, MAX_COVERAGE, MAX_COVERAGE )
+		self.frequency_hist = Histogram( 0, 1, 100 )
+		self.values = []
+		self.coverage = []
+	
+	def add( self, record ):
+		"""! @brief collect coverage and allele frequency of one variant """
+		
+		samples = get_samples( record )
+		if not samples:	#sites-only record without FORMAT and sample columns
+			return
+		sample = samples[ -1 ]
+		if sample[:3] == "0/1":
+			x, y = map( float, sample.split(':')[1].split(',')[:2] )
+			self.coverage.append( x+y )
+			if x+y > 20:
+				self.values.append( x / ( x+y ) )
+		elif sample[:3] == "1/1":
+			x, y = map( float, sample.split(':')[1].split(',')[:2] )
+			self.coverage.append( x+y )
+		if len( self.coverage ) >= BATCH_SIZE:
+			self.flush()
+	
+	def flush( self ):
+		"""! @brief add collected values to the histograms """
+		
+		self.coverage_hist.add( self.coverage )
+		self.frequency_hist.add( self.values )
+		self.values = []
+		self.coverage = []
+	
+	def finish( self ):
+		"""! @brief add histograms of other samples (tables of previous runs), write tables and generate figures (if requested) """
+		
+		self.flush()
+		for table_dir in self.merge_dirs:
+			if table_dir[ -1 ] != "/":
+				table_dir += "/"
+			self.coverage_hist.merge( load_histogram( table_dir + COVERAGE_TABLE ) )
+			self.frequency_hist.merge( load_histogram( table_dir + FREQUENCY_TABLE ) )
+		
+		self.coverage_hist.write_table( self.output_dir + COVERAGE_TABLE )
+		self.frequency_hist.write_table( self.output_dir + FREQUENCY_TABLE )
+		if self.plot:
+			generate_figures( self.coverage_hist, self.frequency_hist, self.output_dir )
+
+
+def main( arguments ):
+	"""! @brief run everything """
+	
+	start_profiling( arguments )
+	vcf_file = arguments[ arguments.index( '--vcf' )+1 ]
+	output_dir = arguments[ arguments.index( '--out' )+1 ]
+	regions = get_regions( arguments )
+	if output_dir[ -1 ] != "/":
+		output_dir += "/"
+	
+	if not os.path.exists( output_dir ):
+		os.makedirs( output_dir )
+	
+	if '--all_samples' in arguments:
+		analyze_all_samples( vcf_file, regions, output_dir, plots_requested( arguments ) )
+		write_profile( output_dir + "profile" )
+		return
+	
+	merge_dirs = [ arguments[ i+1 ] for i, argument in enumerate( arguments ) if argument == '--merge' ]
+	consumer = AlleleFrequencyConsumer( output_dir, merge_dirs, plots_requested( arguments ) )
+	with stage( "read_vcf" ) as info:
+		info['records'] = 0
+		for record in read_vcf( vcf_file, regions=regions ):
+			consumer.add( record )
+			info['records'] += 1
+	consumer.finish()
+	write_profile( output_dir + "profile" )
+
+
+if __name__ == '__main__':
+	
+	if '--vcf' in sys.argv and '--out' in sys.argv:
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
@@ -0,0 +1,27 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### deferred import of matplotlib with a non-interactive backend: runs which only write tables never load it ###
+
+import sys
+
+# --- end of imports --- #
+
+BACKEND = "Agg"	#figures are only written to files; no display is required
+
+
+def get_pyplot():
+	"""! @brief import matplotlib.pyplot on first use (the backend is set before the first import) """
+	
+	if 'matplotlib.pyplot' not in sys.modules:
+		import matplotlib
+		matplotlib.use( BACKEND )
+	import matplotlib.pyplot as plt
+	return plt
+
+
+def plots_requested( arguments ):
+	"""! @brief figures are generated unless --no-plot is given (tables are always written) """
+	
+	return '--no-plot' not in arguments
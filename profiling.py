@@ -0,0 +1,97 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### optional stage timing (wall time, CPU time, peak memory, records per second) of all entry points ###
+
+import cProfile, json, resource, sys, time
+from contextlib import contextmanager
+from functools import wraps
+
+# --- end of imports --- #
+
+PROFILE = { 'enabled': False, 'stages': [], 'depth': 0, 'start': None, 'profiler': None }	#state of the current process
+
+
+def get_cpu_time():
+	"""! @brief user and system CPU time of this process """
+	
+	usage = resource.getrusage( resource.RUSAGE_SELF )
+	return usage.ru_utime + usage.ru_stime
+
+
+def get_peak_rss():
+	"""! @brief peak resident set size of this process in kB """
+	
+	return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+
+
+def start_profiling( arguments ):
+	"""! @brief enable stage timing if --profile is given (and cProfile if --cprofile is given) """
+	
+	if '--profile' not in arguments and '--cprofile' not in arguments:
+		return
+	PROFILE['enabled'] = True
+	PROFILE['start'] = ( time.time(), get_cpu_time() )
+	if '--cprofile' in arguments:
+		PROFILE['profiler'] = cProfile.Profile()
+		PROFILE['profiler'].enable()
+
+
+@contextmanager
+def stage( name ):
+	"""! @brief measure enclosed block as one stage; number of processed records can be set via the yielded dictionary """
+	
+	info = { 'records': None }
+	if not PROFILE['enabled']:
+		yield info
+		return
+	
+	start_wall = time.time()
+	start_cpu = get_cpu_time()
+	start_rss = get_peak_rss()
+	PROFILE['depth'] += 1
+	try:
+		yield info
+	finally:
+		PROFILE['depth'] -= 1
+		wall_time = time.time() - start_wall
+		result = { 'name': name, 'depth': PROFILE['depth'], 'start': start_wall - PROFILE['start'][0], 'wall_time': wall_time, 'cpu_time': get_cpu_time() - start_cpu, 'peak_rss_kb': get_peak_rss(), 'peak_rss_increase_kb': get_peak_rss() - start_rss, 'records': info['records'] }
+		if info['records'] is not None and wall_time > 0:
+			result.update( { 'records_per_second': info['records'] / wall_time } )
+		PROFILE['stages'].append( result )
+
+
+def profiled( count=None ):
+	"""! @brief decorator: measure each call of the function as one stage
+	
+	@param count function which gets the number of processed records from the return value (optional)
+	"""
+	
+	def decorator( function ):
+		@wraps( function )
+		def wrapper( *args, **kwargs ):
+			if not PROFILE['enabled']:
+				return function( *args, **kwargs )
+			with stage( function.__name__ ) as info:
+				result = function( *args, **kwargs )
+				if count is not None:
+					info['records'] = count( result )
+			return result
+		return wrapper
+	return decorator
+
+
+def write_profile( report_prefix ):
+	"""! @brief write stage report to <report_prefix>.json (and cProfile statistics to <report_prefix>.pstats) """
+	
+	if not PROFILE['enabled']:
+		return
+	if PROFILE['profiler'] is not None:
+		PROFILE['profiler'].disable()
+		PROFILE['profiler'].dump_stats( report_prefix + ".pstats" )
+	
+	total = { 'wall_time': time.time() - PROFILE['start'][0], 'cpu_time': get_cpu_time() - PROFILE['start'][1], 'peak_rss_kb': get_peak_rss() }
+	stages = sorted( PROFILE['stages'], key=lambda each: ( each['start'], each['depth'] ) )
+	with open( report_prefix + ".json", "w" ) as out:
+		json.dump( { 'command': sys.argv, 'total': total, 'stages': stages }, out, indent=2, sort_keys=True )
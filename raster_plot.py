@@ -0,0 +1,134 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### direct-to-pixel rendering of dense genome plots: values are aggregated into an RGBA pixel grid which is drawn as one image ###
+
+import numpy as np
+from plot_backend import get_pyplot
+
+# --- end of imports --- #
+
+REDUCTIONS = [ "mean", "max" ]	#aggregation of all values which fall into the same pixel column
+
+
+def get_axes_pixel_size( fig, ax, dpi ):
+	"""! @brief width and height of the axes area in pixels of the saved figure (call after subplots_adjust) """
+	
+	position = ax.get_position()
+	width = int( round( fig.get_figwidth() * dpi * position.width ) )
+	height = int( round( fig.get_figheight() * dpi * position.height ) )
+	return max( [ 1, width ] ), max( [ 1, height ] )
+
+
+def new_image( width, height ):
+	"""! @brief transparent RGBA pixel grid (one byte per channel) """
+	
+	return np.zeros( ( height, width, 4 ), dtype=np.uint8 )
+
+
+def get_rgba_bytes( color ):
+	"""! @brief RGBA channels of a matplotlib color as bytes """
+	
+	from matplotlib.colors import to_rgba	#deferred like pyplot
+	return np.round( np.array( to_rgba( color ) ) * 255 ).astype( np.uint8 )
+
+
+def get_pixel_columns( positions, lower, upper, width ):
+	"""! @brief pixel column of each position on an axis from lower to upper (-1 outside of the axis) """
+	
+	columns = np.floor( ( np.asarray( positions, dtype=np.float64 ) - lower ) / ( upper - lower ) * width ).astype( np.int64 )
+	columns[ columns == width ] = width - 1	#position at the upper border
+	columns[ ( columns < 0 ) | ( columns >= width ) ] = -1
+	return columns
+
+
+def get_pixel_rows( values, lower, upper, height ):
+	"""! @brief pixel row of each value on an axis from lower (bottom) to upper (top); row 0 is the top row (-1 outside of the axis) """
+	
+	rows = np.floor( ( upper - np.asarray( values, dtype=np.float64 ) ) / ( upper - lower ) * height ).astype( np.int64 )
+	rows[ rows == height ] = height - 1	#value at the lower border
+	rows[ ( rows < 0 ) | ( rows >= height ) ] = -1
+	return rows
+
+
+def reduce_to_columns( columns, values, width, reduction="mean" ):
+	"""! @brief aggregate values into pixel columns by mean or max; NaN for columns without values """
+	
+	if reduction not in REDUCTIONS:
+		raise ValueError( "unknown reduction: " + str( reduction ) )
+	valid = columns >= 0
+	columns = columns[ valid ]
+	values = np.asarray( values, dtype=np.float64 )[ valid ]
+	
+	if reduction == "max":
+		result = np.full( width, -np.inf )
+		np.maximum.at( result, columns, values )
+		result[ np.isneginf( result ) ] = np.nan
+		return result
+	
+	sums = np.bincount( columns, weights=values, minlength=width )
+	counts = np.bincount( columns, minlength=width )
+	result = np.full( width, np.nan )
+	result[ counts > 0 ] = sums[ counts > 0 ] / counts[ counts > 0 ]
+	return result
+
+
+def colorize( values, cmap, vmin, vmax ):
+	"""! @brief RGBA color (bytes) of each value via colormap (values are capped at vmin and vmax); transparent for NaN """
+	
+	values = np.asarray( values, dtype=np.float64 )
+	missing = np.isnan( values )
+	normed = np.clip( ( np.where( missing, vmin, values ) - vmin ) / float( vmax - vmin ), 0, 1 )
+	colors = get_pyplot().get_cmap( cmap )( normed, bytes=True )
+	colors[ missing, 3 ] = 0
+	return colors
+
+
+def draw_band( image, first_row, last_row, colors ):
+	"""! @brief fill rows first_row to last_row with one color per pixel column (transparent colors are skipped) """
+	
+	filled = colors[ :, 3 ] > 0
+	image[ first_row:last_row+1, filled ] = colors[ filled ]
+
+
+def dilate( mask, size ):
+	"""! @brief extend each set pixel of a boolean pixel grid to a square of size x size pixels """
+	
+	height, width = mask.shape
+	dilated = np.zeros( ( height, width ), dtype=bool )
+	for dy in range( -( size // 2 ), size - size // 2 ):
+		for dx in range( -( size // 2 ), size - size // 2 ):
+			dilated[ max( [ 0, dy ] ):height+min( [ 0, dy ] ), max( [ 0, dx ] ):width+min( [ 0, dx ] ) ] |= mask[ max( [ 0, -dy ] ):height-max( [ 0, dy ] ), max( [ 0, -dx ] ):width-max( [ 0, dx ] ) ]
+	return dilated
+
+
+def draw_points( image, columns, rows, color, size=1 ):
+	"""! @brief paint every pixel which is hit by at least one point (each point is a square of size x size pixels) """
+	
+	height, width = image.shape[ :2 ]
+	valid = ( columns >= 0 ) & ( rows >= 0 )
+	hits = np.zeros( ( height, width ), dtype=bool )
+	hits[ rows[ valid ], columns[ valid ] ] = True
+	image[ dilate( hits, size ) ] = get_rgba_bytes( color )
+
+
+def draw_spans( image, columns, top_rows, bottom_rows, color ):
+	"""! @brief paint vertical spans from top_row to bottom_row; spans in the same pixel column are united (spans reaching outside of the axis are skipped) """
+	
+	height, width = image.shape[ :2 ]
+	valid = ( columns >= 0 ) & ( top_rows >= 0 ) & ( bottom_rows >= 0 )
+	tops = np.full( width, height, dtype=np.int64 )
+	bottoms = np.full( width, -1, dtype=np.int64 )
+	np.minimum.at( tops, columns[ valid ], top_rows[ valid ] )
+	np.maximum.at( bottoms, columns[ valid ], bottom_rows[ valid ] )
+	rows = np.arange( height )[ :, None ]
+	image[ ( rows >= tops[ None, : ] ) & ( rows <= bottoms[ None, : ] ) ] = get_rgba_bytes( color )
+
+
+def show_image( ax, image, xlim, ylim ):
+	"""! @brief draw pixel grid so that it covers the given axis limits exactly """
+	
+	ax.imshow( image, extent=( xlim[0], xlim[1], ylim[0], ylim[1] ), origin="upper", aspect="auto", interpolation="nearest" )
+	ax.set_xlim( xlim[0], xlim[1] )
+	ax.set_ylim( ylim[0], ylim[1] )
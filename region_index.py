@@ -0,0 +1,448 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### region queries on sorted VCF and coverage files via tabix/CSI or a self-built offset index ###
+
+import bisect, gzip, os, struct
+from input_handler import open_input, detect_compression, get_source_stamp, read_bgzf_block, decompress_bgzf_block, iterate_bgzf_data, BGZFInflater
+
+# --- end of imports --- #
+
+OFFSET_INDEX_SUFFIX = ".regidx"	#self-built offset index next to the input file
+INDEX_STEP = 10000	#number of lines between two entries of the self-built offset index
+MAX_POSITION = 2**31 - 1	#end of a region which covers an entire chromosome
+VCF_HEADER = "#CHROM\tPOS\tID\tREF"	#start of the column header line of VCF files
+TABIX_VCF = 2	#format code of VCF files in tabix/CSI headers
+
+
+def parse_region( region ):
+	"""! @brief convert 'chr:start-end' or 'chr' into tuple ( chr, start, end ) with 1-based inclusive coordinates """
+	
+	region = region.replace( ",", "" )
+	if ":" not in region:
+		return region, 1, MAX_POSITION
+	chrom, interval = region.rsplit( ":", 1 )
+	if "-" in interval:
+		start, end = map( int, interval.split( "-" ) )
+	else:
+		start = end = int( interval )
+	if start < 1 or end < start:
+		raise ValueError( "invalid region: " + region )
+	return chrom, start, end
+
+
+def get_regions( arguments ):
+	"""! @brief collect all (sorted and merged) regions given via repeatable --region option """
+	
+	regions = []
+	for idx, argument in enumerate( arguments[:-1] ):
+		if argument == "--region":
+			regions.append( parse_region( arguments[ idx+1 ] ) )
+	
+	merged = []
+	for chrom, start, end in sorted( regions ):
+		if len( merged ) > 0 and merged[-1][0] == chrom and start <= merged[-1][2] + 1:
+			merged[-1] = ( chrom, merged[-1][1], max( [ end, merged[-1][2] ] ) )
+		else:
+			merged.append( ( chrom, start, end ) )
+	return merged
+
+
+def reg2bins( beg, end, min_shift, depth ):
+	"""! @brief list all bins overlapping the 0-based half-open interval beg..end (see SAM/tabix specification) """
+	
+	end = min( [ end, 1 << ( min_shift + depth*3 ) ] ) - 1
+	bins = []
+	shift = min_shift + depth*3
+	offset = 0
+	for level in range( depth+1 ):
+		bins += range( offset + ( beg >> shift ), offset + ( end >> shift ) + 1 )
+		shift -= 3
+		offset += 1 << ( level*3 )
+	return bins
+
+
+def parse_tabix_header( data, offset ):
+	"""! @brief parse format, columns, meta character and sequence names of a tabix style header """
+	
+	fmt, col_seq, col_beg, col_end, meta, skip, l_nm = struct.unpack( "<7i", data[ offset:offset+28 ] )
+	names = data[ offset+28:offset+28+l_nm ].split( b"\x00" )[:-1]
+	header = { 'col_seq': col_seq, 'col_beg': col_beg, 'col_end': col_end, 'vcf': fmt & 0xFFFF == TABIX_VCF, 'meta': chr( meta ), 'names': [ str( name.decode( "ascii" ) ) for name in names ] }
+	return header, offset + 28 + l_nm
+
+
+def load_tabix_index( index_file ):
+	"""! @brief load bins and linear index of all sequences from a tabix (.tbi) index """
+	
+	with gzip.open( index_file, "rb" ) as f:
+		data = f.read()
+	if data[:4] != b"TBI\x01":
+		raise IOError( "not a tabix index: " + index_file )
+	n_ref = struct.unpack( "<i", data[4:8] )[0]
+	index, offset = parse_tabix_header( data, 8 )
+	index.update( { 'type': "tabix", 'min_shift': 14, 'depth': 5, 'refs': {} } )
+	for name in index['names'][ :n_ref ]:
+		bins = {}
+		n_bin = struct.unpack( "<i", data[ offset:offset+4 ] )[0]
+		offset += 4
+		for i in range( n_bin ):
+			bin_number, n_chunk = struct.unpack( "<Ii", data[ offset:offset+8 ] )
+			chunks = struct.unpack( "<%dQ" % ( 2*n_chunk ), data[ offset+8:offset+8+16*n_chunk ] )
+			bins.update( { bin_number: ( 0, list( zip( chunks[::2], chunks[1::2] ) ) ) } )
+			offset += 8 + 16*n_chunk
+		n_intv = struct.unpack( "<i", data[ offset:offset+4 ] )[0]
+		linear = struct.unpack( "<%dQ" % n_intv, data[ offset+4:offset+4+8*n_intv ] )
+		offset += 4 + 8*n_intv
+		index['refs'].update( { name: ( bins, linear ) } )
+	return index
+
+
+def load_csi_index( index_file ):
+	"""! @brief load bins of all sequences from a CSI index with tabix style auxiliary data """
+	
+	with gzip.open( index_file, "rb" ) as f:
+		data = f.read()
+	if data[:4] != b"CSI\x01":
+		raise IOError( "not a CSI index: " + index_file )
+	min_shift, depth, l_aux = struct.unpack( "<3i", data[4:16] )
+	if l_aux < 28:
+		raise IOError( "CSI index without sequence names: " + index_file )
+	index = parse_tabix_header( data, 16 )[0]
+	index.update( { 'type': "csi", 'min_shift': min_shift, 'depth': depth, 'refs': {} } )
+	offset = 16 + l_aux
+	n_ref = struct.unpack( "<i", data[ offset:offset+4 ] )[0]
+	offset += 4
+	for name in index['names'][ :n_ref ]:
+		bins = {}
+		n_bin = struct.unpack( "<i", data[ offset:offset+4 ] )[0]
+		offset += 4
+		for i in range( n_bin ):
+			bin_number, loffset, n_chunk = struct.unpack( "<IQi", data[ offset:offset+16 ] )
+			chunks = struct.unpack( "<%dQ" % ( 2*n_chunk ), data[ offset+16:offset+16+16*n_chunk ] )
+			bins.update( { bin_number: ( loffset, list( zip( chunks[::2], chunks[1::2] ) ) ) } )
+			offset += 16 + 16*n_chunk
+		index['refs'].update( { name: ( bins, [] ) } )
+	return index
+
+
+def get_binned_offset( index, chrom, start, end ):
+	"""! @brief get smallest virtual offset of records possibly overlapping the region from tabix/CSI bins; None if there are none """
+	
+	try:
+		bins, linear = index['refs'][ chrom ]
+	except KeyError:
+		return None
+	beg = start - 1
+	
+	# --- lower bound from linear index (tabix) or from first record of finest bin (CSI) --- #
+	min_offset = 0
+	if len( linear ) > 0:
+		min_offset = linear[ min( [ beg >> 14, len( linear ) - 1 ] ) ]
+	elif index['type'] == "csi":
+		bin_number = reg2bins( beg, beg+1, index['min_shift'], index['depth'] )[-1]
+		while bin_number > 0 and bin_number not in bins:
+			bin_number = ( bin_number - 1 ) >> 3
+		if bin_number in bins:
+			min_offset = bins[ bin_number ][0]
+	
+	offsets = []
+	for bin_number in reg2bins( beg, end, index['min_shift'], index['depth'] ):
+		if bin_number in bins:
+			for chunk_beg, chunk_end in bins[ bin_number ][1]:
+				if chunk_end > min_offset:
+					offsets.append( max( [ chunk_beg, min_offset ] ) )
+	if len( offsets ) == 0:
+		return None
+	return min( offsets )
+
+
+def iterate_lines_with_offsets( filename, compression ):
+	"""! @brief generator over ( offset, line ) of an uncompressed or BGZF file; offsets of BGZF files are virtual offsets """
+	
+	if compression == "plain":
+		with open( filename, "rb" ) as f:
+			offset = 0
+			line = f.readline()
+			while line:
+				yield offset, line
+				offset += len( line )
+				line = f.readline()
+	else:
+		with open( filename, "rb" ) as f:
+			coffset = 0
+			pending = b""
+			pending_offset = 0
+			block = read_bgzf_block( f )
+			while block:
+				data = decompress_bgzf_block( block )
+				pos = 0
+				while pos < len( data ):
+					if not pending:
+						pending_offset = ( coffset << 16 ) | pos
+					newline = data.find( b"\n", pos )
+					if newline == -1:
+						pending += data[ pos: ]
+						break
+					yield pending_offset, pending + data[ pos:newline+1 ]
+					pending = b""
+					pos = newline + 1
+				coffset += len( block )
+				block = read_bgzf_block( f )
+			if pending:
+				yield pending_offset, pending
+
+
+def get_record_end( parts, pos, vcf, col_end ):
+	"""! @brief last position covered by a record: POS + len( REF ) - 1 for VCF, value of the end column (if any) or the start position """
+	
+	if vcf:
+		return pos + len( parts[3] ) - 1
+	if col_end > 0:
+		return int( parts[ col_end-1 ] )
+	return pos
+
+
+def build_offset_index( filename, compression ):
+	"""! @brief scan file once and store offset of first line per sequence and of every INDEX_STEP-th line
+	
+	each entry also stores the last position covered by any preceding record of the sequence, so that queries can start early enough to reach records (e.g. deletions) which begin before the region
+	
+	@return offsets per sequence, sequence names in file order, whether the file is sorted by sequence and position and whether it is a VCF file
+	"""
+	
+	size, mtime = get_source_stamp( filename )
+	refs = {}
+	names = []
+	current = None
+	last_pos = 0
+	reach = 0
+	is_sorted = True
+	vcf = False
+	counter = 0
+	for offset, line in iterate_lines_with_offsets( filename, compression ):
+		if line[:1] == b"#":
+			vcf = vcf or line.startswith( VCF_HEADER )
+			continue
+		if not line.strip():	#empty lines are skipped by the readers as well
+			continue
+		parts = line.split( b"\t", 4 )
+		chrom = str( parts[0].decode( "ascii" ) )
+		pos = int( parts[1] )
+		if ( chrom != current and chrom in refs ) or ( chrom == current and pos < last_pos ):
+			is_sorted = False
+		if chrom != current:
+			reach = 0
+		if chrom != current or counter % INDEX_STEP == 0:
+			if chrom not in refs:
+				refs.update( { chrom: ( [], [], [] ) } )
+				names.append( chrom )
+			refs[ chrom ][0].append( pos )
+			refs[ chrom ][1].append( offset )
+			refs[ chrom ][2].append( reach )
+		reach = max( [ reach, get_record_end( parts, pos, vcf, 0 ) ] )
+		current = chrom
+		last_pos = pos
+		counter += 1
+	
+	try:
+		with open( filename + OFFSET_INDEX_SUFFIX + ".tmp", "w" ) as out:
+			out.write( "#size\t" + size + "\n#mtime\t" + mtime + "\n#sorted\t" + str( int( is_sorted ) ) + "\n#vcf\t" + str( int( vcf ) ) + "\n" )
+			for chrom in names:
+				for pos, offset, reach in zip( refs[ chrom ][0], refs[ chrom ][1], refs[ chrom ][2] ):
+					out.write( "\t".join( [ chrom, str( pos ), str( offset ), str( reach ) ] ) + "\n" )
+		os.rename( filename + OFFSET_INDEX_SUFFIX + ".tmp", filename + OFFSET_INDEX_SUFFIX )
+	except ( IOError, OSError ):
+		print "WARNING: could not write offset index " + filename + OFFSET_INDEX_SUFFIX
+	return refs, names, is_sorted, vcf
+
+
+def load_offset_index( filename, compression ):
+	"""! @brief load self-built offset index (building it if missing or outdated); None for unsorted files """
+	
+	refs = None
+	names = []
+	is_sorted = True
+	vcf = False
+	index_file = filename + OFFSET_INDEX_SUFFIX
+	if os.path.isfile( index_file ):
+		meta = {}
+		refs = {}
+		with open( index_file, "r" ) as f:
+			line = f.readline()
+			while line:
+				parts = line.strip().split('\t')
+				if line[0] == '#':
+					meta.update( { parts[0][1:]: parts[1] } )
+				else:
+					if parts[0] not in refs:
+						refs.update( { parts[0]: ( [], [], [] ) } )
+						names.append( parts[0] )
+					refs[ parts[0] ][0].append( int( parts[1] ) )
+					refs[ parts[0] ][1].append( int( parts[2] ) )
+					refs[ parts[0] ][2].append( int( parts[3] ) if len( parts ) > 3 else 0 )
+				line = f.readline()
+		if ( meta.get( 'size' ), meta.get( 'mtime' ) ) != get_source_stamp( filename ) or 'vcf' not in meta:	#indices without record ends are rebuilt
+			refs = None
+		is_sorted = meta.get( 'sorted' ) == "1"
+		vcf = meta.get( 'vcf' ) == "1"
+	if refs is None:
+		refs, names, is_sorted, vcf = build_offset_index( filename, compression )
+	if not is_sorted:
+		return None
+	return { 'type': "offsets", 'col_seq': 1, 'col_beg': 2, 'col_end': 0, 'vcf': vcf, 'meta': "#", 'names': names, 'refs': refs }
+
+
+def load_region_index( filename ):
+	"""! @brief load tabix/CSI index of a BGZF file or the self-built offset index; None for gzip files (no random access) and unsorted files """
+	
+	compression = detect_compression( filename )
+	if compression == "bgzf":
+		if os.path.isfile( filename + ".tbi" ):
+			return load_tabix_index( filename + ".tbi" )
+		if os.path.isfile( filename + ".csi" ):
+			return load_csi_index( filename + ".csi" )
+	elif compression == "gzip":
+		return None
+	return load_offset_index( filename, compression )
+
+
+def get_region_offset( index, chrom, start, end ):
+	"""! @brief get offset to start reading the region from; None if no record can overlap the region """
+	
+	if index['type'] != "offsets":
+		return get_binned_offset( index, chrom, start, end )
+	try:
+		positions, offsets, reaches = index['refs'][ chrom ]
+	except KeyError:
+		return None
+	idx = max( [ 0, bisect.bisect_left( reaches, start ) - 1 ] )	#last entry without any preceding record reaching into the region
+	return offsets[ idx ]
+
+
+class RegionReader( object ):
+	"""! @brief line based reading from several offsets of one plain or BGZF file (one file handle and one decompression thread pool for all regions) """
+	
+	def __init__( self, filename, threads=None ):
+		self.handle = open( filename, "rb" )
+		self.inflater = None
+		if detect_compression( filename ) == "bgzf":
+			self.inflater = BGZFInflater( threads )
+	
+	def iterate_lines( self, offset ):
+		"""! @brief generator over lines starting at offset (virtual offset for BGZF files); BGZF blocks are inflated in batches which start with one block """
+		
+		if self.inflater is None:
+			self.handle.seek( offset )
+			line = self.handle.readline()
+			while line:
+				yield line
+				line = self.handle.readline()
+			return
+		
+		self.handle.seek( offset >> 16 )
+		skip = offset & 0xFFFF
+		pending = b""
+		for data in iterate_bgzf_data( self.handle, self.inflater ):
+			lines = ( pending + data[ skip: ] ).split( b"\n" )
+			skip = 0
+			pending = lines.pop()
+			for line in lines:
+				yield line + b"\n"
+		if pending:
+			yield pending
+	
+	def close( self ):
+		self.handle.close()
+		if self.inflater is not None:
+			self.inflater.close()
+
+
+def scan_region_lines( filename, regions, threads=None ):
+	"""! @brief generator over all data lines overlapping any of the regions by scanning the entire file once (files without index) """
+	
+	regions_per_chr = {}
+	for chrom, start, end in regions:
+		try:
+			regions_per_chr[ chrom ].append( ( start, end ) )
+		except KeyError:
+			regions_per_chr.update( { chrom: [ ( start, end ) ] } )
+	
+	vcf = False
+	with open_input( filename, threads=threads ) as f:
+		line = f.readline()
+		while line:
+			if line[0] == '#':
+				vcf = vcf or line.startswith( VCF_HEADER )
+			else:
+				parts = line.split( '\t', 4 )
+				if parts[0] in regions_per_chr:
+					pos = int( parts[1] )
+					record_end = get_record_end( parts, pos, vcf, 0 )
+					for start, end in regions_per_chr[ parts[0] ]:
+						if pos <= end and record_end >= start:
+							yield line
+							break
+			line = f.readline()
+
+
+def iterate_region_lines( filename, regions, threads=None ):
+	"""! @brief generator over all data lines overlapping the given sorted and merged regions (files without index are scanned completely)
+	
+	a record overlaps a region if any position from its start to its end is inside of the region (VCF records end at POS + len( REF ) - 1), like tabix queries; records overlapping several regions are reported once
+	
+	@param threads number of BGZF decompression threads (default: input_handler.get_bgzf_threads)
+	"""
+	
+	index = load_region_index( filename )
+	if index is None:
+		for line in scan_region_lines( filename, regions, threads ):
+			yield line
+		return
+	
+	col_seq, col_beg, col_end, meta, vcf = index['col_seq'], index['col_beg'], index['col_end'], index['meta'], index['vcf']
+	n_splits = max( [ col_seq, col_beg, col_end, 4 if vcf else 0 ] )
+	reader = RegionReader( filename, threads )
+	try:
+		previous = ( None, 0 )	#records starting up to the end of the previous region of the same sequence have been reported already
+		for chrom, start, end in regions:
+			offset = get_region_offset( index, chrom, start, end )
+			if offset is None:
+				continue
+			reported_until = previous[1] if previous[0] == chrom and start > previous[1] else 0
+			previous = ( chrom, end )
+			seen = False
+			for line in reader.iterate_lines( offset ):
+				if line[0] == meta or not line.strip():
+					continue
+				parts = line.split( '\t', n_splits )
+				if parts[ col_seq-1 ] != chrom:
+					if seen:
+						break
+					continue
+				seen = True
+				pos = int( parts[ col_beg-1 ] )
+				if pos > end:
+					break
+				if pos > reported_until and get_record_end( parts, pos, vcf, col_end ) >= start:
+					yield line
+	finally:
+		reader.close()
+
+
+def get_chromosome_shards( filename, regions=None ):
+	"""! @brief split regions (or all sequences of an indexed file) into one list of regions per chromosome; None if the file has no index """
+	
+	if regions:
+		shards = []
+		for chrom, start, end in regions:
+			if len( shards ) > 0 and shards[-1][-1][0] == chrom:
+				shards[-1].append( ( chrom, start, end ) )
+			else:
+				shards.append( [ ( chrom, start, end ) ] )
+		return shards
+	
+	index = load_region_index( filename )
+	if index is None:
+		return None
+	return [ [ ( name, 1, MAX_POSITION ) ] for name in index['names'] ]
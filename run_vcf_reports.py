@@ -0,0 +1,112 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+__usage__ = """
+					python run_vcf_reports.py
+					--vcf <FULL_PATH_TO_INPUT_VCF>
+					--out <FULL_PATH_TO_OUTPUT_DIRECTORY>
+					
+					optional:
+					--gff <FULL_PATH_TO_GFF3_FILE, REQUIRED_FOR_INDEL_REPORT>
+					--reports <COMMA_SEPARATED_LIST_OF_REPORTS: ploidy,indel,genome_wide>[all]
+					--res <INT, RESOLUTION_OF_GENOME_WIDE_REPORT>[1000000]
+					--rasterize <RASTERIZE_BINNED_VALUES_IN_VECTOR_FIGURES>[off]
+					--no-plot <ONLY_WRITE_TABLES_WITHOUT_FIGURES>[off]
+					--region <CHR:START-END, REPEATABLE>[all]
+					--profile <WRITE_STAGE_TIMES_AND_MEMORY_AS_JSON>[off]
+					--cprofile <ADDITIONALLY_WRITE_CPROFILE_STATISTICS>[off]
+					
+					bug reports and feature requests: bpucker@cebitec.uni-bielefeld.de
+					"""
+
+import sys, os
+from vcf_reader import read_vcf
+from region_index import get_regions
+from ploidy_check import AlleleFrequencyConsumer
+from analyze_indel_len_in_CDS import IndelLengthConsumer, load_all_CDS_positions
+from genome_wide_variants import VariantPositionConsumer
+from profiling import stage, start_profiling, write_profile
+from plot_backend import plots_requested
+
+# --- end of imports --- #
+
+REPORTS = [ "ploidy", "indel", "genome_wide" ]
+
+
+def get_consumers( reports, output_dir, gff, resolution, rasterize, plot=True ):
+	"""! @brief construct one consumer per report; each report is written into its own subdirectory """
+	
+	consumers = []
+	for report in reports:
+		report_dir = output_dir + report + "/"
+		if not os.path.exists( report_dir ):
+			os.makedirs( report_dir )
+		if report == "ploidy":
+			consumers.append( AlleleFrequencyConsumer( report_dir, plot=plot ) )
+		elif report == "indel":
+			consumers.append( IndelLengthConsumer( load_all_CDS_positions( gff ), report_dir, plot ) )
+		else:
+			consumers.append( VariantPositionConsumer( report_dir, resolution, rasterize, plot ) )
+	return consumers
+
+
+def run_consumers( vcf_file, consumers, regions=None ):
+	"""! @brief pass each VCF record to all consumers and finish them afterwards """
+	
+	with stage( "read_vcf" ) as info:
+		info['records'] = 0
+		for record in read_vcf( vcf_file, regions=regions ):
+			for consumer in consumers:
+				consumer.add( record )
+			info['records'] += 1
+	for consumer in consumers:
+		with stage( type( consumer ).__name__ + ".finish" ):
+			consumer.finish()
+
+
+def main( arguments ):
+	"""! @brief run everything """
+	
+	start_profiling( arguments )
+	vcf_file = arguments[ arguments.index( '--vcf' )+1 ]
+	output_dir = arguments[ arguments.index( '--out' )+1 ]
+	regions = get_regions( arguments )
+	rasterize = '--rasterize' in arguments
+	
+	if '--reports' in arguments:
+		reports = arguments[ arguments.index( '--reports' )+1 ].split(',')
+	else:
+		reports = REPORTS
+	for report in reports:
+		if report not in REPORTS:
+			sys.exit( "ERROR: unknown report " + report + "\n" + __usage__ )
+	
+	if '--gff' in arguments:
+		gff = arguments[ arguments.index( '--gff' )+1 ]
+	elif "indel" in reports:
+		if '--reports' in arguments:
+			sys.exit( "ERROR: InDel report requires --gff\n" + __usage__ )
+		reports = [ report for report in reports if report != "indel" ]
+		gff = None
+	else:
+		gff = None
+	
+	if '--res' in arguments:
+		resolution = int( arguments[ arguments.index( '--res' )+1 ] )
+	else:
+		resolution = 1000000
+	
+	if output_dir[ -1 ] != "/":
+		output_dir += "/"
+	
+	run_consumers( vcf_file, get_consumers( reports, output_dir, gff, resolution, rasterize, plots_requested( arguments ) ), regions )
+	write_profile( output_dir + "profile" )
+
+
+if __name__ == '__main__':
+	
+	if '--vcf' in sys.argv and '--out' in sys.argv:
+		main( sys.argv )
+	else:
+		sys.exit( __usage__ )
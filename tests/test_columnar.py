@@ -0,0 +1,84 @@
+### regression tests of the columnar .npz files ###
+
+import os, shutil, sys, tempfile, unittest
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+import numpy as np
+from columnar import save_columns, load_columns, get_columnar_type, load_variant_positions, load_cov_columns, load_gene_columns
+from export_columnar import export_variants, export_coverage
+from genome_wide_variants import collect_variants
+from cov_loader import load_cov
+
+# --- end of imports --- #
+
+VCF_LINES = [	"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n",
+				"chr1\t10\t.\tA\tT\t50\tPASS\tDP=30\tGT:AD\t0/1:10,20\n",
+				"chr1\t20\t.\tAC\tA\t40\tPASS\tDP=12\tGT:AD\t1/1:0,12\n",
+				"chr1\t30\t.\tA\tC,G\t40\tPASS\tDP=12\tGT:AD\t1/2:0,6,6\n",
+				"chr2\t5\t.\tG\tGTT\t60\tPASS\tDP=7\n",
+				"chr2\t8\t.\tC\tG\t60\tPASS\tDP=7\n"
+			]
+COV_LINES = [ "chr1\t2\t5\n", "chr1\t3\t7\n", "chr1\t6\t9\n", "chr2\t1\t4\n" ]	#samtools depth without -a
+
+
+class ColumnarTests( unittest.TestCase ):
+
+	def setUp( self ):
+		self.tmp_dir = tempfile.mkdtemp()
+	
+	def tearDown( self ):
+		shutil.rmtree( self.tmp_dir )
+	
+	def write_file( self, name, lines ):
+		filename = os.path.join( self.tmp_dir, name )
+		with open( filename, "w" ) as out:
+			out.write( "".join( lines ) )
+		return filename
+	
+	def test_round_trip( self ):
+		filename = os.path.join( self.tmp_dir, "test.npz" )
+		save_columns( filename, "genes", { "chr1": { 'id': np.array( [ "g1", "g2" ] ), 'start': np.array( [ 5, 50 ] ), 'end': np.array( [ 10, 60 ] ) } }, { 'window': 100 } )
+		columns_per_chr, meta = load_columns( filename )
+		self.assertEqual( get_columnar_type( filename ), "genes" )
+		self.assertEqual( int( meta['window'] ), 100 )
+		self.assertEqual( columns_per_chr["chr1"]['start'].tolist(), [ 5, 50 ] )
+		self.assertEqual( load_gene_columns( filename ), { "g1": { 'chr': "chr1", 'start': 5, 'end': 10 }, "g2": { 'chr': "chr1", 'start': 50, 'end': 60 } } )
+	
+	def test_other_files_have_no_type( self ):
+		self.assertEqual( get_columnar_type( self.write_file( "test.txt", COV_LINES ) ), None )
+		self.assertEqual( get_columnar_type( os.path.join( self.tmp_dir, "missing.npz" ) ), None )
+		other_file = os.path.join( self.tmp_dir, "other.npz" )
+		np.savez( other_file, values=np.arange( 3 ) )
+		self.assertEqual( get_columnar_type( other_file ), None )
+	
+	def test_variants_match_vcf( self ):
+		vcf_file = self.write_file( "test.vcf", VCF_LINES )
+		npz_file = os.path.join( self.tmp_dir, "variants.npz" )
+		export_variants( vcf_file, npz_file )
+		snps_per_chr, indels_per_chr, tri_counter = collect_variants( vcf_file )
+		snps, indels, tri = load_variant_positions( npz_file )
+		self.assertEqual( dict( [ ( header, snps[ header ].tolist() ) for header in snps.keys() ] ), dict( [ ( header, list( snps_per_chr[ header ] ) ) for header in snps_per_chr.keys() ] ) )
+		self.assertEqual( dict( [ ( header, indels[ header ].tolist() ) for header in indels.keys() ] ), dict( [ ( header, list( indels_per_chr[ header ] ) ) for header in indels_per_chr.keys() ] ) )
+		self.assertEqual( tri, tri_counter )
+		snps, indels, tri = load_variant_positions( npz_file, [ ( "chr2", 1, 6 ) ] )
+		self.assertEqual( snps.keys(), [] )
+		self.assertEqual( indels["chr2"].tolist(), [ 5 ] )
+		self.assertEqual( tri, 0 )
+	
+	def test_coverage_matches_text_file( self ):
+		cov_file = self.write_file( "test.cov", COV_LINES )
+		npz_file = os.path.join( self.tmp_dir, "coverage.npz" )
+		export_coverage( cov_file, npz_file, 2 )
+		cov = load_cov( cov_file, use_cache=False )
+		columnar_cov = load_cov( npz_file )
+		self.assertEqual( sorted( columnar_cov.keys() ), sorted( cov.keys() ) )
+		for header in cov.keys():
+			self.assertEqual( columnar_cov[ header ].tolist(), cov[ header ].tolist() )
+		self.assertEqual( cov["chr1"].tolist(), [ 0, 5, 7, 0, 0, 9 ] )
+		self.assertEqual( load_columns( npz_file )[0]["chr1"]['window_sum'].tolist(), [ 5, 7, 9 ] )
+		region_cov = load_cov_columns( npz_file, [ ( "chr1", 3, 4 ) ] )
+		self.assertEqual( region_cov.keys(), [ "chr1" ] )
+		self.assertEqual( region_cov["chr1"].tolist(), [ 0, 0, 7, 0 ] )
+
+
+if __name__ == '__main__':
+	unittest.main()
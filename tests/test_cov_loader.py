@@ -0,0 +1,132 @@
+### regression tests of the shared coverage loader ###
+
+import gzip, os, shutil, sys, tempfile, unittest
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+import numpy as np
+from cov_loader import load_cov, parse_cov_file, parse_cov_regions, collect_window_stats, CACHE_SUFFIX, INDEX_SUFFIX
+from cov_pyramid import get_block_stats
+
+# --- end of imports --- #
+
+GAPPED_COV = [ ( "chr1", 3, 10 ), ( "chr1", 4, 12 ), ( "chr1", 5, 14 ), ( "chr1", 9, 20 ), ( "chr1", 10, 22 ), ( "chr1", 23, 7 ), ( "chr2", 1, 5 ), ( "chr2", 2, 6 ) ]	#samtools depth without -a
+
+
+def write_cov( filename, rows ):
+	"""! @brief write coverage rows ( chromosome, position, depth ) as samtools depth output """
+	
+	with open( filename, "w" ) as out:
+		for header, position, depth in rows:
+			out.write( "\t".join( [ header, str( position ), str( depth ) ] ) + "\n" )
+
+
+def get_expected_cov( rows ):
+	"""! @brief coverage arrays of rows: index i holds the coverage of position i+1 (zero without row) """
+	
+	cov = {}
+	for header, position, depth in rows:
+		try:
+			values = cov[ header ]
+		except KeyError:
+			values = []
+			cov.update( { header: values } )
+		values.extend( [ 0 ] * ( position - len( values ) ) )
+		values[ position-1 ] = depth
+	return cov
+
+
+class LoaderTests( unittest.TestCase ):
+	
+	def setUp( self ):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.cov_file = os.path.join( self.tmp_dir, "gapped.cov" )
+		write_cov( self.cov_file, GAPPED_COV )
+	
+	def tearDown( self ):
+		shutil.rmtree( self.tmp_dir )
+	
+	def assert_cov_equal( self, cov, expected ):
+		self.assertEqual( sorted( cov.keys() ), sorted( expected.keys() ) )
+		for header in expected.keys():
+			self.assertEqual( cov[ header ].tolist(), expected[ header ] )
+	
+	def test_complete_file( self ):
+		rows = [ ( "chr1", position, position * 3 ) for position in range( 1, 50 ) ] + [ ( "chr2", position, 70000 ) for position in range( 1, 5 ) ]
+		write_cov( self.cov_file, rows )
+		cov = parse_cov_file( self.cov_file, chunk_size=100 )
+		self.assert_cov_equal( cov, get_expected_cov( rows ) )
+		self.assertEqual( cov["chr1"].dtype, np.uint16 )
+		self.assertEqual( cov["chr2"].dtype, np.uint32 )
+	
+	def test_gapped_file_is_placed_by_position( self ):
+		for chunk_size in [ 1, 20, 1024 ]:
+			self.assert_cov_equal( parse_cov_file( self.cov_file, chunk_size ), get_expected_cov( GAPPED_COV ) )
+	
+	def test_regions_match_full_file( self ):
+		cov = parse_cov_file( self.cov_file )
+		regions = [ ( header, 1, len( cov[ header ] ) ) for header in cov.keys() ]
+		self.assert_cov_equal( parse_cov_regions( self.cov_file, regions ), dict( [ ( header, cov[ header ].tolist() ) for header in cov.keys() ] ) )
+		partial = parse_cov_regions( self.cov_file, [ ( "chr1", 4, 9 ) ] )
+		self.assertEqual( partial.keys(), [ "chr1" ] )
+		self.assertEqual( partial["chr1"].tolist(), [ 0, 0, 0, 12, 14, 0, 0, 0, 20 ] )
+	
+	def test_cache_is_reused( self ):
+		cov = load_cov( self.cov_file )
+		self.assertTrue( os.path.isfile( self.cov_file + CACHE_SUFFIX ) )
+		cached = load_cov( self.cov_file )
+		self.assert_cov_equal( cached, dict( [ ( header, cov[ header ].tolist() ) for header in cov.keys() ] ) )
+	
+	def test_cache_of_other_layout_is_rebuilt( self ):
+		load_cov( self.cov_file )
+		with open( self.cov_file + INDEX_SUFFIX ) as f:
+			lines = [ line for line in f if not line.startswith( "#layout" ) ]
+		with open( self.cov_file + INDEX_SUFFIX, "w" ) as out:
+			out.write( "".join( lines ) )
+		self.assert_cov_equal( load_cov( self.cov_file ), get_expected_cov( GAPPED_COV ) )
+		with open( self.cov_file + INDEX_SUFFIX ) as f:
+			self.assertTrue( "#layout\tposition\n" in f.read() )
+	
+	def test_gzip_input( self ):
+		with open( self.cov_file ) as f:
+			content = f.read()
+		gz_file = self.cov_file + ".gz"
+		out = gzip.open( gz_file, "wb" )
+		out.write( content )
+		out.close()
+		self.assert_cov_equal( load_cov( gz_file, use_cache=False ), get_expected_cov( GAPPED_COV ) )
+
+
+class StreamTests( unittest.TestCase ):
+
+	def setUp( self ):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.cov_file = os.path.join( self.tmp_dir, "gapped.cov" )
+		write_cov( self.cov_file, GAPPED_COV )
+	
+	def tearDown( self ):
+		shutil.rmtree( self.tmp_dir )
+	
+	def test_gapped_stream_matches_file_mode( self ):
+		cov = load_cov( self.cov_file, use_cache=False )
+		for resolution in [ 1, 2, 4, 10, 100 ]:
+			for chunk_size in [ 1, 20, 1024 ]:
+				with open( self.cov_file ) as f:
+					window_stats = collect_window_stats( f, resolution, chunk_size )
+				self.assertEqual( sorted( window_stats.keys() ), sorted( cov.keys() ) )
+				for header in cov.keys():
+					expected = get_block_stats( cov[ header ], resolution )
+					for stat in expected.keys():
+						self.assertTrue( np.array_equal( window_stats[ header ][ stat ], expected[ stat ] ), ( resolution, chunk_size, header, stat ) )
+	
+	def test_unsorted_positions_are_rejected( self ):
+		write_cov( self.cov_file, [ ( "chr1", 30, 1 ), ( "chr1", 5, 1 ) ] )
+		with open( self.cov_file ) as f:
+			self.assertRaises( ValueError, collect_window_stats, f, 10 )
+	
+	def test_split_chromosomes_are_rejected( self ):
+		write_cov( self.cov_file, [ ( "chr1", 1, 1 ), ( "chr2", 1, 1 ), ( "chr1", 2, 1 ) ] )
+		with open( self.cov_file ) as f:
+			self.assertRaises( ValueError, collect_window_stats, f, 10 )
+
+
+if __name__ == '__main__':
+	unittest.main()
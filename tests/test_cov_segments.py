@@ -0,0 +1,51 @@
+### regression tests of the copy number segmentation ###
+
+import os, shutil, sys, tempfile, unittest
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+import numpy as np
+from cov_segments import get_rolling_median, merge_short_runs, call_segments, write_segments
+from cov_pyramid import get_block_stats
+
+# --- end of imports --- #
+
+RESOLUTION = 100
+PLOIDY = 3
+
+
+class SegmentTests( unittest.TestCase ):
+
+	def test_rolling_median( self ):
+		values = np.array( [ 1.0, 9.0, 2.0, 8.0, 3.0 ] )
+		self.assertEqual( get_rolling_median( values, 3 ).tolist(), [ 1.0, 2.0, 8.0, 3.0, 3.0 ] )
+		self.assertEqual( len( get_rolling_median( np.zeros( 0 ), 3 ) ), 0 )
+	
+	def test_merge_short_runs( self ):
+		states = np.array( [ 2, 5, 3, 3, 3, 4, 3, 3, 3, 1, 1, 1 ] )
+		self.assertEqual( merge_short_runs( states, 3 ).tolist(), [ 3, 3, 3, 3, 3, 3, 3, 3, 3, 1, 1, 1 ] )
+		self.assertEqual( merge_short_runs( states, 20 ).tolist(), states.tolist() )
+	
+	def test_duplicated_segment( self ):
+		coverage = np.full( 100 * RESOLUTION, 30, dtype=np.uint16 )
+		coverage[ 40 * RESOLUTION:70 * RESOLUTION ] = 40	#four instead of three copies
+		window_stats = { "chr1": get_block_stats( coverage, RESOLUTION ), "chr2": get_block_stats( np.full( 50 * RESOLUTION + 17, 30, dtype=np.uint16 ), RESOLUTION ) }
+		segments = call_segments( window_stats, PLOIDY )
+		self.assertEqual( [ segment[ :4 ] + segment[ 6: ] for segment in segments ], [ ( "chr1", 0, 4000, 40, 3 ), ( "chr1", 4000, 7000, 30, 4 ), ( "chr1", 7000, 10000, 30, 3 ), ( "chr2", 0, 5017, 51, 3 ) ] )
+		self.assertAlmostEqual( segments[1][4], 40.0 )
+		self.assertAlmostEqual( segments[1][5], 4 / 3.0 )
+	
+	def test_no_coverage( self ):
+		self.assertEqual( call_segments( { "chr1": get_block_stats( np.zeros( 1000, dtype=np.uint16 ), RESOLUTION ) }, PLOIDY ), [] )
+	
+	def test_write_segments( self ):
+		tmp_dir = tempfile.mkdtemp()
+		try:
+			output_file = os.path.join( tmp_dir, "segments.txt" )
+			write_segments( [ ( "chr1", 0, 4000, 40, 30.0, 1.0, 3 ) ], output_file )
+			with open( output_file ) as f:
+				self.assertEqual( f.read().split( "\n" )[1], "chr1\t0\t4000\t40\t30.00\t1.000\t3" )
+		finally:
+			shutil.rmtree( tmp_dir )
+
+
+if __name__ == '__main__':
+	unittest.main()
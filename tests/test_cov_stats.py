@@ -0,0 +1,65 @@
+### regression tests of the batched interval coverage statistics ###
+
+import os, sys, unittest
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+import numpy as np
+import cov_stats
+from cov_stats import get_interval_means, get_interval_medians, get_interval_fractions_above
+from classify_genes_by_cov import get_gene_covs
+
+# --- end of imports --- #
+
+THRESHOLD = 20
+
+
+class IntervalStatsTests( unittest.TestCase ):
+
+	def setUp( self ):
+		random = np.random.RandomState( 1 )
+		self.cov = { "chr1": random.randint( 0, 50, 500 ).astype( np.uint16 ), "chr2": random.randint( 0, 50, 37 ).astype( np.uint16 ) }
+		self.intervals = [ ( "chr1", 0, 1 ), ( "chr1", 10, 20 ), ( "chr1", 15, 316 ), ( "chr1", 490, 800 ), ( "chr2", 3, 36 ), ( "chr2", 5, 6 ), ( "chr1", 100, 100 ), ( "chr3", 1, 10 ) ]
+		self.chromosomes, self.starts, self.ends = zip( *self.intervals )
+	
+	def get_expected( self, function ):
+		"""! @brief statistic of each interval via slicing; NaN for empty intervals and unknown chromosomes """
+		
+		expected = []
+		for chromosome, start, end in self.intervals:
+			if chromosome not in self.cov or len( self.cov[ chromosome ][ start:end ] ) == 0:
+				expected.append( np.nan )
+			else:
+				expected.append( function( self.cov[ chromosome ][ start:end ] ) )
+		return np.array( expected )
+	
+	def assert_stats_equal( self, values, expected ):
+		self.assertTrue( np.allclose( values, expected, equal_nan=True ), ( values, expected ) )
+	
+	def test_means( self ):
+		self.assert_stats_equal( get_interval_means( self.cov, self.chromosomes, self.starts, self.ends ), self.get_expected( np.mean ) )
+	
+	def test_medians( self ):
+		self.assert_stats_equal( get_interval_medians( self.cov, self.chromosomes, self.starts, self.ends ), self.get_expected( np.median ) )
+	
+	def test_medians_in_small_batches( self ):
+		batch_size = cov_stats.MEDIAN_BATCH_SIZE
+		cov_stats.MEDIAN_BATCH_SIZE = 7
+		try:
+			self.assert_stats_equal( get_interval_medians( self.cov, self.chromosomes, self.starts, self.ends ), self.get_expected( np.median ) )
+		finally:
+			cov_stats.MEDIAN_BATCH_SIZE = batch_size
+	
+	def test_fractions_above( self ):
+		fractions = get_interval_fractions_above( self.cov, self.chromosomes, self.starts, self.ends, THRESHOLD )
+		self.assert_stats_equal( fractions, self.get_expected( lambda values: np.mean( values >= THRESHOLD ) ) )
+	
+	def test_gene_statistics( self ):
+		gene_pos = { "g1": { 'chr': "chr1", 'start': 10, 'end': 20 }, "g2": { 'chr': "chr2", 'start': 3, 'end': 36 }, "g3": { 'chr': "chr3", 'start': 1, 'end': 10 } }
+		for statistic, function in [ ( "mean", np.mean ), ( "median", np.median ), ( "fraction", lambda values: np.mean( values >= THRESHOLD ) * 100 ) ]:
+			gene_covs = get_gene_covs( self.cov, gene_pos, statistic, THRESHOLD )
+			self.assertEqual( sorted( gene_covs.keys() ), [ "g1", "g2" ] )
+			for gene in gene_covs.keys():
+				self.assertAlmostEqual( gene_covs[ gene ], function( self.cov[ gene_pos[ gene ]['chr'] ][ gene_pos[ gene ]['start']:gene_pos[ gene ]['end'] ] ) )
+
+
+if __name__ == '__main__':
+	unittest.main()
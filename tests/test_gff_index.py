@@ -0,0 +1,74 @@
+### regression tests of the cached GFF3 feature index ###
+
+import os, shutil, sys, tempfile, unittest
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+from gff_index import load_gff_index, get_gene_positions, get_feature_intervals, get_descendants, get_gene_CDS, get_file_checksum, GFF_CACHE_SUFFIX
+from columnar import save_columns
+
+# --- end of imports --- #
+
+GFF_LINES = [	"##gff-version 3\n",
+				"chr1\tsrc\tgene\t100\t900\t.\t+\t.\tID=gene1\n",
+				"chr1\tsrc\tmRNA\t100\t900\t.\t+\t.\tID=mRNA1;Parent=gene1\n",
+				"chr1\tsrc\tmRNA\t100\t700\t.\t+\t.\tID=mRNA2;Parent=gene1\n",
+				"chr1\tsrc\texon\t100\t300\t.\t+\t.\tID=exon1;Parent=mRNA1,mRNA2\n",
+				"chr1\tsrc\tCDS\t150\t300\t.\t+\t0\tID=cds1;Parent=mRNA1,mRNA2\n",	#shared by both mRNAs
+				"chr1\tsrc\tCDS\t500\t700\t.\t+\t0\tID=cds2;Parent=mRNA2\n",
+				"chr1\tsrc\tCDS\t800\t850\t.\t+\t0\tID=cds3;Parent=mRNA1\n",
+				"chr2\tsrc\tgene\t10\t90\t.\t-\t.\tID=gene2\n",
+				"chr2\tsrc\tmRNA\t10\t90\t.\t-\t.\tID=mRNA3;Parent=gene2\n",
+				"chr2\tsrc\tCDS\t20\t80\t.\t-\t0\tID=cds4;Parent=mRNA3\n"
+			]
+
+
+class GFFIndexTests( unittest.TestCase ):
+
+	def setUp( self ):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.gff3_file = os.path.join( self.tmp_dir, "test.gff3" )
+		with open( self.gff3_file, "w" ) as out:
+			out.write( "".join( GFF_LINES ) )
+	
+	def tearDown( self ):
+		shutil.rmtree( self.tmp_dir )
+	
+	def test_parent_links( self ):
+		columns = load_gff_index( self.gff3_file, use_cache=False )["chr1"]
+		self.assertEqual( columns['id'].tolist(), [ "gene1", "mRNA1", "mRNA2", "exon1", "cds1", "cds2", "cds3" ] )
+		self.assertEqual( columns['parent'].tolist(), [ -1, 0, 0, 1, 1, 2, 1 ] )
+		self.assertEqual( sorted( zip( columns['link_child'].tolist(), columns['link_parent'].tolist() ) ), [ ( 1, 0 ), ( 2, 0 ), ( 3, 1 ), ( 3, 2 ), ( 4, 1 ), ( 4, 2 ), ( 5, 2 ), ( 6, 1 ) ] )
+		self.assertEqual( get_descendants( columns, 2 ), [ 3, 4, 5 ] )
+		self.assertEqual( get_descendants( columns, 0 ), [ 1, 2, 3, 4, 5, 6 ] )
+	
+	def test_gene_CDS( self ):
+		index = load_gff_index( self.gff3_file, use_cache=False )
+		self.assertEqual( get_gene_CDS( index, "gene1" ), ( "chr1", [ ( 150, 300 ), ( 500, 700 ), ( 800, 850 ) ] ) )
+		self.assertEqual( get_gene_CDS( index, "gene2" ), ( "chr2", [ ( 20, 80 ) ] ) )
+		self.assertEqual( get_gene_CDS( index, "gene3" ), ( None, [] ) )
+	
+	def test_gene_positions_and_intervals( self ):
+		index = load_gff_index( self.gff3_file, use_cache=False )
+		self.assertEqual( get_gene_positions( index ), { "gene1": { 'chr': "chr1", 'start': 100, 'end': 900 }, "gene2": { 'chr': "chr2", 'start': 10, 'end': 90 } } )
+		self.assertEqual( get_feature_intervals( index, "CDS" ), { "chr1": [ ( 150, 300 ), ( 500, 700 ), ( 800, 850 ) ], "chr2": [ ( 20, 80 ) ] } )
+	
+	def test_cache( self ):
+		index = load_gff_index( self.gff3_file )
+		self.assertTrue( os.path.isfile( self.gff3_file + GFF_CACHE_SUFFIX ) )
+		cached = load_gff_index( self.gff3_file )
+		self.assertEqual( sorted( cached.keys() ), sorted( index.keys() ) )
+		for header in index.keys():
+			for column in index[ header ].keys():
+				self.assertEqual( cached[ header ][ column ].tolist(), index[ header ][ column ].tolist() )
+		self.assertEqual( get_gene_CDS( cached, "gene1" ), get_gene_CDS( index, "gene1" ) )
+	
+	def test_cache_of_old_format_is_rebuilt( self ):
+		index = load_gff_index( self.gff3_file, use_cache=False )
+		for header in index.keys():	#first parent only
+			del index[ header ]['link_child']
+			del index[ header ]['link_parent']
+		save_columns( self.gff3_file + GFF_CACHE_SUFFIX, "gff", index, { 'checksum': get_file_checksum( self.gff3_file ) } )	#matching checksum, but no format
+		self.assertTrue( 'link_child' in load_gff_index( self.gff3_file )["chr1"] )
+
+
+if __name__ == '__main__':
+	unittest.main()
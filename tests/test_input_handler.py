@@ -0,0 +1,93 @@
+### regression tests of transparent reading of plain, gzip and BGZF files ###
+
+import gzip, os, shutil, struct, sys, tempfile, unittest, zlib
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+import input_handler
+from input_handler import open_input, detect_compression, get_bgzf_threads, set_bgzf_threads
+
+# --- end of imports --- #
+
+BGZF_EOF = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"	#empty block at the end of BGZF files
+
+
+def get_bgzf_block( data ):
+	"""! @brief compress data into one BGZF block """
+	
+	compressor = zlib.compressobj( 6, zlib.DEFLATED, -15 )
+	compressed = compressor.compress( data ) + compressor.flush()
+	header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff" + struct.pack( "<H", 6 ) + b"BC" + struct.pack( "<HH", 2, len( compressed ) + 25 )
+	return header + compressed + struct.pack( "<II", zlib.crc32( data ) & 0xffffffff, len( data ) )
+
+
+def write_bgzf( filename, lines, lines_per_block ):
+	"""! @brief write lines into a BGZF file with a fixed number of lines per block; returns virtual offset of each line """
+	
+	offsets = []
+	coffset = 0
+	with open( filename, "wb" ) as out:
+		for i in range( 0, len( lines ), lines_per_block ):
+			uoffset = 0
+			for line in lines[ i:i+lines_per_block ]:
+				offsets.append( ( coffset << 16 ) | uoffset )
+				uoffset += len( line )
+			block = get_bgzf_block( "".join( lines[ i:i+lines_per_block ] ) )
+			out.write( block )
+			coffset += len( block )
+		out.write( BGZF_EOF )
+	return offsets
+
+
+class InputTests( unittest.TestCase ):
+
+	def setUp( self ):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.lines = [ "chr1\t%d\t%d\n" % ( position, position % 7 ) for position in range( 1, 2001 ) ]
+		self.bgzf_file = os.path.join( self.tmp_dir, "test.txt.gz" )
+		self.offsets = write_bgzf( self.bgzf_file, self.lines, 10 )
+	
+	def tearDown( self ):
+		shutil.rmtree( self.tmp_dir )
+		set_bgzf_threads( None )
+	
+	def test_all_formats_give_same_content( self ):
+		plain_file = os.path.join( self.tmp_dir, "test.txt" )
+		with open( plain_file, "w" ) as out:
+			out.write( "".join( self.lines ) )
+		gzip_file = os.path.join( self.tmp_dir, "test.gzip.gz" )
+		out = gzip.open( gzip_file, "wb" )
+		out.write( "".join( self.lines ) )
+		out.close()
+		self.assertEqual( [ detect_compression( each ) for each in [ plain_file, gzip_file, self.bgzf_file ] ], [ "plain", "gzip", "bgzf" ] )
+		for filename in [ plain_file, gzip_file, self.bgzf_file ]:
+			for threads in [ 1, 3 ]:
+				with open_input( filename, threads=threads ) as f:
+					self.assertEqual( f.readlines(), self.lines )
+	
+	def test_virtual_offset( self ):
+		with open_input( self.bgzf_file, threads=2, offset=self.offsets[ 1234 ] ) as f:
+			self.assertEqual( f.readline(), self.lines[ 1234 ] )
+			self.assertEqual( f.readlines(), self.lines[ 1235: ] )
+	
+	def test_short_read_inflates_few_blocks( self ):
+		inflated = []
+		decompress = input_handler.decompress_bgzf_block
+		def counting_decompress( block ):
+			inflated.append( 1 )
+			return decompress( block )
+		input_handler.decompress_bgzf_block = counting_decompress
+		try:
+			with open_input( self.bgzf_file, threads=32, offset=self.offsets[ 500 ] ) as f:
+				self.assertEqual( f.readline(), self.lines[ 500 ] )
+		finally:
+			input_handler.decompress_bgzf_block = decompress
+		self.assertEqual( len( inflated ), 1 )
+	
+	def test_default_threads( self ):
+		self.assertEqual( get_bgzf_threads( 3 ), 3 )
+		set_bgzf_threads( 1 )
+		self.assertEqual( get_bgzf_threads(), 1 )
+		self.assertEqual( get_bgzf_threads( 4 ), 4 )
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,96 @@
+### regression tests of region queries via the self-built offset index ###
+
+import gzip, os, shutil, sys, tempfile, unittest
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+import input_handler, region_index
+from region_index import iterate_region_lines, get_regions, OFFSET_INDEX_SUFFIX
+from test_input_handler import write_bgzf
+
+# --- end of imports --- #
+
+VCF_HEADER = [ "##fileformat=VCFv4.2\n", "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n" ]
+
+
+def get_vcf_line( chrom, pos, ref, alt ):
+	return "\t".join( [ chrom, str( pos ), ".", ref, alt, "50", "PASS", "." ] ) + "\n"
+
+
+def get_overlapping( lines, regions ):
+	"""! @brief expected result: all records whose span from POS to POS + len( REF ) - 1 overlaps any region """
+	
+	selected = []
+	for line in lines:
+		parts = line.split( "\t" )
+		pos = int( parts[1] )
+		if any( [ chrom == parts[0] and pos <= end and pos + len( parts[3] ) - 1 >= start for chrom, start, end in regions ] ):
+			selected.append( line )
+	return selected
+
+
+class RegionTests( unittest.TestCase ):
+
+	def setUp( self ):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.index_step = region_index.INDEX_STEP
+		region_index.INDEX_STEP = 3	#several index entries per sequence
+		self.records = [ get_vcf_line( "chr1", pos, "A", "T" ) for pos in range( 10, 200, 10 ) ]
+		self.records.insert( 2, get_vcf_line( "chr1", 25, "A" * 80, "A" ) )	#deletion from 25 to 104
+		self.records += [ get_vcf_line( "chr2", pos, "C", "G" ) for pos in range( 5, 50, 5 ) ]
+	
+	def tearDown( self ):
+		region_index.INDEX_STEP = self.index_step
+		shutil.rmtree( self.tmp_dir )
+	
+	def write_vcf( self, name ):
+		filename = os.path.join( self.tmp_dir, name )
+		with open( filename, "w" ) as out:
+			out.write( "".join( VCF_HEADER + self.records ) )
+		return filename
+	
+	def check_regions( self, filename, arguments ):
+		regions = get_regions( arguments )
+		self.assertEqual( list( iterate_region_lines( filename, regions ) ), get_overlapping( self.records, regions ) )
+	
+	def test_deletion_before_region_is_reported( self ):
+		filename = self.write_vcf( "test.vcf" )
+		self.check_regions( filename, [ "--region", "chr1:95-101" ] )
+		self.assertTrue( get_vcf_line( "chr1", 25, "A" * 80, "A" ) in list( iterate_region_lines( filename, [ ( "chr1", 95, 101 ) ] ) ) )
+		with open( filename + OFFSET_INDEX_SUFFIX ) as f:
+			self.assertTrue( "#vcf\t1\n" in f.read() )
+	
+	def test_record_in_several_regions_is_reported_once( self ):
+		filename = self.write_vcf( "test.vcf" )
+		self.check_regions( filename, [ "--region", "chr1:30-35", "--region", "chr1:61-62", "--region", "chr1:100-130", "--region", "chr2:10-20" ] )
+	
+	def test_bgzf_with_offset_index( self ):
+		filename = os.path.join( self.tmp_dir, "test.vcf.gz" )
+		write_bgzf( filename, VCF_HEADER + self.records, 2 )
+		for arguments in [ [ "--region", "chr1:95-101" ], [ "--region", "chr1:1-15", "--region", "chr1:99-150", "--region", "chr2:44-44" ], [ "--region", "chr3" ] ]:
+			self.check_regions( filename, arguments )
+	
+	def test_small_query_inflates_few_blocks( self ):
+		filename = os.path.join( self.tmp_dir, "test.vcf.gz" )
+		write_bgzf( filename, VCF_HEADER + self.records, 1 )
+		list( iterate_region_lines( filename, [ ( "chr2", 1, 1 ) ] ) )	#builds the index
+		inflated = []
+		decompress = input_handler.decompress_bgzf_block
+		def counting_decompress( block ):
+			inflated.append( 1 )
+			return decompress( block )
+		input_handler.decompress_bgzf_block = counting_decompress
+		try:
+			self.assertEqual( list( iterate_region_lines( filename, [ ( "chr2", 20, 20 ) ], threads=32 ) ), [ get_vcf_line( "chr2", 20, "C", "G" ) ] )
+		finally:
+			input_handler.decompress_bgzf_block = decompress
+		self.assertTrue( len( inflated ) <= 8, len( inflated ) )	#five blocks from the index entry to the first record behind the region (batches of 1, 2 and 4 blocks) instead of 32 * 16
+	
+	def test_file_without_index( self ):
+		filename = os.path.join( self.tmp_dir, "test.vcf.gz" )
+		out = gzip.open( filename, "wb" )	#gzip files have no random access
+		out.write( "".join( VCF_HEADER + self.records ) )
+		out.close()
+		self.check_regions( filename, [ "--region", "chr1:95-101", "--region", "chr2:1-5" ] )
+
+
+if __name__ == '__main__':
+	unittest.main()
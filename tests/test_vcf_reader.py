@@ -0,0 +1,79 @@
+### regression tests of the shared VCF reader ###
+
+import gzip, os, shutil, sys, tempfile, unittest
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+from vcf_reader import make_record, read_vcf, get_sample_names, get_info_value, get_format_keys, get_samples
+from ploidy_check import AlleleFrequencyConsumer
+from test_input_handler import write_bgzf
+
+# --- end of imports --- #
+
+VCF_LINES = [	"##fileformat=VCFv4.2\n",
+				"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\n",
+				"chr1\t10\t.\tA\tT\t50\tPASS\tDP=30;AF=0.5\tGT:AD\t0/1:10,20\t1/1:0,30\n",
+				"\n",
+				"chr1\t20\t.\tAC\tA\t40\tPASS\tINDEL;DP=12\tGT:AD\t0/0:12,0\t0/1:15,15\n"
+			]
+SITES_ONLY_LINE = "chr2\t5\t.\tG\tC\t60\tPASS\tDP=7\n"	#no FORMAT and sample columns
+
+
+class ReaderTests( unittest.TestCase ):
+
+	def setUp( self ):
+		self.tmp_dir = tempfile.mkdtemp()
+		self.vcf_file = os.path.join( self.tmp_dir, "test.vcf" )
+		with open( self.vcf_file, "w" ) as out:
+			out.write( "".join( VCF_LINES ) )
+	
+	def tearDown( self ):
+		shutil.rmtree( self.tmp_dir )
+	
+	def test_read_vcf_skips_header_and_empty_lines( self ):
+		records = list( read_vcf( self.vcf_file ) )
+		self.assertEqual( [ ( record.chrom, record.pos, record.ref, record.alt ) for record in records ], [ ( "chr1", "10", "A", "T" ), ( "chr1", "20", "AC", "A" ) ] )
+	
+	def test_small_blocks_and_gzip( self ):
+		expected = [ record.line for record in read_vcf( self.vcf_file ) ]
+		self.assertEqual( [ record.line for record in read_vcf( self.vcf_file, block_size=1 ) ], expected )
+		out = gzip.open( self.vcf_file + ".gz", "wb" )
+		out.write( "".join( VCF_LINES ) )
+		out.close()
+		self.assertEqual( [ record.line for record in read_vcf( self.vcf_file + ".gz" ) ], expected )
+	
+	def test_bgzf_with_one_thread( self ):
+		expected = [ record.line for record in read_vcf( self.vcf_file ) ]
+		write_bgzf( self.vcf_file + ".gz", VCF_LINES, 1 )
+		for threads in [ 1, 4 ]:
+			self.assertEqual( [ record.line for record in read_vcf( self.vcf_file + ".gz", threads=threads ) ], expected )
+			self.assertEqual( [ record.line for record in read_vcf( self.vcf_file + ".gz", regions=[ ( "chr1", 15, 25 ) ], threads=threads ) ], expected[ 1: ] )
+	
+	def test_sample_names( self ):
+		self.assertEqual( get_sample_names( self.vcf_file ), [ "S1", "S2" ] )
+	
+	def test_samples_and_format( self ):
+		record = make_record( VCF_LINES[2] )
+		self.assertEqual( get_format_keys( record ), [ "GT", "AD" ] )
+		self.assertEqual( get_samples( record ), [ "0/1:10,20", "1/1:0,30" ] )
+	
+	def test_info_value( self ):
+		record = make_record( VCF_LINES[4] )
+		self.assertEqual( get_info_value( record, "DP" ), "12" )
+		self.assertEqual( get_info_value( record, "AF" ), None )
+		self.assertEqual( get_info_value( make_record( VCF_LINES[2] ), "DP" ), "30" )
+		self.assertEqual( get_info_value( make_record( VCF_LINES[2] ), "AF" ), "0.5" )
+	
+	def test_sites_only_record( self ):
+		record = make_record( SITES_ONLY_LINE )
+		self.assertEqual( record.info, "DP=7" )
+		self.assertEqual( record.rest, "" )
+		self.assertEqual( get_samples( record ), [] )
+	
+	def test_ploidy_consumer_skips_sites_only_records( self ):
+		consumer = AlleleFrequencyConsumer( self.tmp_dir + "/", plot=False )
+		consumer.add( make_record( SITES_ONLY_LINE ) )
+		consumer.add( make_record( VCF_LINES[2] ) )
+		self.assertEqual( consumer.coverage, [ 30.0 ] )
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,88 @@
+### Boas Pucker ###
+### bpucker@cebitec.uni-bielefeld.de ###
+### v0.1 ###
+
+### shared streaming reader for VCF files ###
+
+from collections import namedtuple
+from input_handler import open_input
+from region_index import iterate_region_lines
+
+# --- end of imports --- #
+
+BLOCK_SIZE = 16 * 1024 * 1024	#number of bytes read per block
+
+VCFRecord = namedtuple( "VCFRecord", [ "chrom", "pos", "id", "ref", "alt", "qual", "filter", "info", "rest", "line" ] )
+#rest contains FORMAT and all sample columns as one unsplit string
+
+
+def make_record( line ):
+	"""! @brief split VCF data line into fixed columns; FORMAT and sample columns remain unsplit """
+	
+	fields = line.split( '\t', 8 )
+	if len( fields ) < 9:
+		fields[ -1 ] = fields[ -1 ].rstrip( '\r\n' )
+		fields += [ "" ] * ( 9 - len( fields ) )
+	return VCFRecord( fields[0], fields[1], fields[2], fields[3], fields[4], fields[5], fields[6], fields[7], fields[8], line )
+
+
+def read_vcf( vcf_file, block_size=BLOCK_SIZE, regions=None, threads=None ):
+	"""! @brief generator over all data lines of a VCF file (or only over the lines inside the given regions)
+	
+	@param threads number of threads for BGZF decompression (default of input_handler if None)
+	"""
+	
+	if regions:
+		for line in iterate_region_lines( vcf_file, regions, threads ):
+			if line.strip():
+				yield make_record( line )
+		return
+	
+	with open_input( vcf_file, threads=threads ) as f:
+		lines = f.readlines( block_size )
+		while lines:
+			for line in lines:
+				if line[0] != '#' and line.strip():
+					yield make_record( line )
+			lines = f.readlines( block_size )
+
+
+def get_sample_names( vcf_file ):
+	"""! @brief get names of all samples from the #CHROM header line """
+	
+	with open_input( vcf_file ) as f:
+		for line in f:
+			if line[:6] == "#CHROM":
+				return line.rstrip( '\r\n' ).split('\t')[ 9: ]
+			if line[0] != '#':
+				break
+	return []
+
+
+def get_info_value( record, key ):
+	"""! @brief get value of one INFO key without splitting the entire INFO column """
+	
+	prefix = key + "="
+	if record.info.startswith( prefix ):
+		start = len( prefix )
+	else:
+		start = record.info.find( ";" + prefix )
+		if start == -1:
+			return None
+		start += len( prefix ) + 1
+	end = record.info.find( ';', start )
+	if end == -1:
+		return record.info[ start: ]
+	return record.info[ start:end ]
+
+
+def get_format_keys( record ):
+	"""! @brief get keys of the FORMAT column """
+	
+	return record.rest.split( '\t', 1 )[0].rstrip( '\r\n' ).split(':')
+
+
+def get_samples( record ):
+	"""! @brief get list of all sample columns """
+	
+	return record.rest.rstrip( '\r\n' ).split('\t')[ 1: ]